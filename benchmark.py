@@ -0,0 +1,415 @@
+#! python3
+
+import sys
+import argparse
+import json
+import platform
+import random
+import time
+import fsm
+import dictionary as dic
+import comp_grammar_compiler as gc
+import lookup_cache
+import compound
+import verify_dictionary
+
+try:
+	import resource
+except ImportError:
+	# Windows
+	resource = None
+
+DescriptionString = "Benchmarks for dictionary build, serialization, loading and lookup, and grammar compilation."
+
+# Имена метрик:
+#   *_s      - время в секундах (меньше - лучше)
+#   *_per_s  - пропускная способность (больше - лучше)
+#   *_bytes, *_kb, *_count - размеры
+
+#------------------------------------------------------------------------------
+# генераторы синтетических данных. Фиксированный seed - одинаковые данные между запусками
+
+Alphabet = "абвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+
+def generate_lexicon( count, seed = 1, alphabet = Alphabet, min_length = 2, max_length = 14, tags = 100 ):
+	rnd = random.Random( seed )
+	# общие корни и окончания, чтобы DAWG было что минимизировать
+	stems = ["".join( rnd.choice( alphabet ) for _ in range( rnd.randint( min_length, max_length - 3 ) ) ) for _ in range( max( 1, count // 8 ) )]
+	endings = [""] + ["".join( rnd.choice( alphabet ) for _ in range( rnd.randint( 1, 3 ) ) ) for _ in range( 30 )]
+	lexicon = {}
+	while len( lexicon ) < count:
+		word = rnd.choice( stems ) + rnd.choice( endings )
+		lexicon[word] = rnd.randint( 1, tags )
+	return sorted( lexicon.items() )
+
+
+# правила (res, left, right) в духе *_CompositeRules_Grammar.txt
+def generate_grammar( rules, seed = 1, nonterminals = 40 ):
+	rnd = random.Random( seed )
+	grammar = []
+	while len( grammar ) < rules:
+		a = str( rnd.randint( 0, nonterminals - 1 ) )
+		b = str( rnd.randint( 0, nonterminals - 1 ) )
+		if a == b:
+			continue
+		# правоядерное или левоядерное правило
+		rule = (b, a, b) if rnd.random() < 0.5 else (a, a, b)
+		if rule not in grammar:
+			grammar.append( rule )
+	return grammar
+
+
+# запросы: половина - слова словаря, половина - искаженные слова
+def generate_queries( lexicon, count, seed = 1, alphabet = Alphabet ):
+	rnd = random.Random( seed )
+	queries = []
+	for i in range( count ):
+		word = rnd.choice( lexicon )[0]
+		if i % 2 == 1:
+			pos = rnd.randrange( len( word ) )
+			word = word[:pos] + rnd.choice( alphabet ) + word[pos:]
+		queries.append( word )
+	return queries
+
+
+# поток токенов с частотами по закону Ципфа: вероятность слова ранга r ~ 1 / r^s
+def generate_zipf_tokens( lexicon, count, seed = 1, s = 1.1 ):
+	rnd = random.Random( seed )
+	words = [word for (word, _attr) in lexicon]
+	rnd.shuffle( words )
+	cum_weights = []
+	total = 0.0
+	for rank in range( 1, len( words ) + 1 ):
+		total += 1.0 / rank ** s
+		cum_weights.append( total )
+	return rnd.choices( words, cum_weights = cum_weights, k = count )
+
+
+# автомат композитов из двух и более частей с любыми тэгами
+def generate_compound_dfa( lexicon ):
+	nfa = fsm.NFA()
+	nfa.add_state( "FINAL" )
+	nfa.set_final( "FINAL" )
+	for attr in set( attr for (_word, attr) in lexicon ):
+		nfa.add_trans( fsm.START, attr, "PART" )
+		nfa.add_trans( "PART", attr, "PART" )
+		nfa.add_trans( "PART", attr, "FINAL" )
+	return nfa.to_DFA()
+
+
+#------------------------------------------------------------------------------
+# реальные файлы
+
+# слово [атрибут] в строке
+def load_lexicon( path, encoding = "utf-8" ):
+	lexicon = {}
+	with open( path, encoding=encoding ) as lexicon_in:
+		for line in lexicon_in:
+			parts = line.split()
+			if len( parts ) == 0:
+				continue
+			attr = int( parts[1] ) if len( parts ) > 1 and parts[1].isdigit() else dic.DicNode.EmptyLeaf
+			lexicon[parts[0]] = attr
+	return sorted( lexicon.items() )
+
+
+def load_grammar( path, encoding = "utf-16" ):
+	with open( path, encoding=encoding ) as grammar_in:
+		return gc.parse_grammar( grammar_in )
+
+
+#------------------------------------------------------------------------------
+
+def max_rss_kb():
+	if resource is None:
+		return None
+	rss = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+	# macOS отдает байты, Linux - килобайты
+	return rss // 1024 if sys.platform == "darwin" else rss
+
+
+# лучшее время из repeat запусков и результат последнего
+def measure( func, repeat ):
+	best = None
+	result = None
+	for _ in range( repeat ):
+		start = time.perf_counter()
+		result = func()
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min( best, elapsed )
+	return best, result
+
+
+def percentiles( values, points = (0.5, 0.9, 0.99) ):
+	values = sorted( values )
+	return { p: values[min( len( values ) - 1, int( p * len( values ) ) )] for p in points }
+
+
+def latency_metrics( prefix, lookup, queries ):
+	timer = time.perf_counter_ns
+	latencies = []
+	for q in queries:
+		start = timer()
+		lookup( q )
+		latencies.append( timer() - start )
+	result = {}
+	for p, ns in percentiles( latencies ).items():
+		result["{}_p{}_s".format( prefix, int( p * 100 ) )] = ns / 1e9
+	result[prefix + "_per_s"] = len( queries ) / (sum( latencies ) / 1e9)
+	return result
+
+
+def bench_dictionary( lexicon, queries, repeat ):
+	results = { "words_count": len( lexicon ) }
+
+	def build_tree():
+		tree = dic.DicTree()
+		for (word, attr) in lexicon:
+			tree.add_word( word, attr )
+		return tree
+
+	def build_dawg():
+		builder = dic.DicDawgBuilder()
+		for (word, attr) in lexicon:
+			builder.add_word( word, attr )
+		return builder.build()
+
+	elapsed, tree = measure( build_tree, repeat )
+	results["tree_build_s"] = elapsed
+	results["tree_build_words_per_s"] = len( lexicon ) / elapsed
+	elapsed, dawg = measure( build_dawg, repeat )
+	results["dawg_build_s"] = elapsed
+	results["dawg_build_words_per_s"] = len( lexicon ) / elapsed
+
+	elapsed, tree_data = measure( tree.serialize, repeat )
+	results["tree_serialize_s"] = elapsed
+	results["tree_size_bytes"] = len( tree_data )
+	elapsed, dawg_data = measure( dawg.serialize, repeat )
+	results["dawg_serialize_s"] = elapsed
+	results["dawg_size_bytes"] = len( dawg_data )
+
+	elapsed, _ = measure( lambda: dic.DicSerializer().deserialize( tree_data ), repeat )
+	results["tree_deserialize_s"] = elapsed
+	elapsed, loaded = measure( lambda: dic.DicSerializer().deserialize( dawg_data ), repeat )
+	results["dawg_deserialize_s"] = elapsed
+
+	reader = dic.DicReader( dawg_data )
+	results.update( latency_metrics( "dawg_check_word", loaded.check_word, queries ) )
+	results.update( latency_metrics( "reader_check_word", reader.check_word, queries ) )
+	return results
+
+
+# атрибут и разбор композита для потока токенов без кэша и с кэшем
+def bench_cache( lexicon, tokens, cache_entries ):
+	builder = dic.DicDawgBuilder()
+	for (word, attr) in lexicon:
+		builder.add_word( word, attr )
+	reader = dic.DicReader( builder.build().serialize() )
+	dfa = generate_compound_dfa( lexicon )
+
+	def run_uncached():
+		for t in tokens:
+			reader.get_attr( t )
+			compound.analyze_compound( reader, dfa, t )
+
+	cached = lookup_cache.CachedDictionary( reader, dfa, lookup_cache.LruCache( max_entries = cache_entries, segmented = True ) )
+	def run_cached():
+		for t in tokens:
+			cached.get_attr( t )
+			cached.analyze_compound( t )
+
+	results = { "cache_tokens_count": len( tokens ), "cache_max_entries_count": cache_entries }
+	elapsed, _ = measure( run_uncached, 1 )
+	results["uncached_lookup_per_s"] = len( tokens ) / elapsed
+	elapsed, _ = measure( run_cached, 1 )
+	results["cached_lookup_per_s"] = len( tokens ) / elapsed
+	stats = cached.stats()
+	results["cache_hit_rate"] = stats["hit_rate"]
+	results["cache_evictions_count"] = stats["evictions"]
+	return results
+
+
+def bench_grammar( grammar, repeat ):
+	results = { "grammar_rules_count": len( grammar ) }
+	elapsed, nfa = measure( lambda: gc.build_fsm( grammar ), repeat )
+	results["build_fsm_s"] = elapsed
+	results["nfa_states_count"] = len( nfa.states )
+	elapsed, dfa = measure( nfa.to_DFA, repeat )
+	results["to_dfa_s"] = elapsed
+	results["dfa_states_count"] = len( dfa.states )
+	return results
+
+
+# проверка: скомпилированный словарь против лексикона и дифференциальный fuzz реализаций.
+# Ошибки печатаются в stderr, их число попадает в отчет (*_errors_count должно быть 0)
+def bench_verify( lexicon, seed, rounds ):
+	builder = dic.DicDawgBuilder()
+	for (word, attr) in lexicon:
+		builder.add_word( word, attr )
+	reader = dic.DicReader( builder.build().serialize() )
+
+	results = {}
+	elapsed, report = measure( lambda: verify_dictionary.verify_lexicon( reader, lexicon, check_extra = True ), 1 )
+	results["verify_lexicon_s"] = elapsed
+	results["verify_lexicon_errors_count"] = report["missing"] + report["wrong_attr"] + report["extra"]
+	elapsed, fuzz = measure( lambda: verify_dictionary.fuzz( seed, rounds ), 1 )
+	results["verify_fuzz_s"] = elapsed
+	results["verify_fuzz_errors_count"] = len( fuzz["dictionary_errors"] ) + len( fuzz["automata_errors"] )
+	for error in report["errors"] + fuzz["dictionary_errors"] + fuzz["automata_errors"]:
+		print( error, file=sys.stderr )
+	return results
+
+
+# рост автоматов при добавлении саморекурсивных правил (A -> A A)
+def bench_self_recursive( grammar, steps = (0, 5, 10, 20) ):
+	nonterminals = sorted( set( n for rule in grammar for n in rule ), key=int )
+	results = {}
+	for count in steps:
+		extended = grammar + [(n, n, n) for n in nonterminals[:count]]
+		nfa = gc.build_fsm( extended )
+		dfa = nfa.to_DFA()
+		results["self_recursive_{}_nfa_states_count".format( count )] = len( nfa.states )
+		results["self_recursive_{}_dfa_states_count".format( count )] = len( dfa.states )
+	return results
+
+
+def run( args ):
+	if args.lexicon is not None:
+		lexicon = load_lexicon( args.lexicon, args.encoding )
+	else:
+		lexicon = generate_lexicon( args.words, args.seed )
+	if args.grammar is not None:
+		grammar = load_grammar( args.grammar )
+	else:
+		grammar = generate_grammar( args.rules, args.seed )
+	queries = generate_queries( lexicon, args.queries, args.seed )
+
+	results = {}
+	results.update( bench_dictionary( lexicon, queries, args.repeat ) )
+	results.update( bench_grammar( grammar, args.repeat ) )
+	results.update( bench_self_recursive( grammar ) )
+	if args.cache_tokens > 0:
+		tokens = generate_zipf_tokens( lexicon, args.cache_tokens, args.seed )
+		results.update( bench_cache( lexicon, tokens, args.cache_entries ) )
+	if args.verify:
+		results.update( bench_verify( lexicon, args.seed, args.verify_rounds ) )
+	results["max_rss_kb"] = max_rss_kb()
+
+	return {
+		"meta": {
+			"python": platform.python_version(),
+			"platform": platform.platform(),
+			"seed": args.seed,
+			"lexicon": args.lexicon or "synthetic:{}".format( args.words ),
+			"grammar": args.grammar or "synthetic:{}".format( args.rules ),
+			"repeat": args.repeat,
+		},
+		"results": results,
+	}
+
+
+#------------------------------------------------------------------------------
+# сравнение двух отчетов (например, до и после коммита)
+
+# [(metric, old, new, relative_change, is_regression)]
+def compare( old, new, threshold ):
+	rows = []
+	for metric, old_value in sorted( old["results"].items() ):
+		new_value = new["results"].get( metric )
+		if not isinstance( old_value, (int, float) ) or not isinstance( new_value, (int, float) ) or old_value == 0:
+			continue
+		change = (new_value - old_value) / old_value
+		if metric.endswith( "_per_s" ):
+			regression = change < -threshold
+		elif metric.endswith( "_s" ) or metric.endswith( "_bytes" ) or metric.endswith( "_kb" ):
+			regression = change > threshold
+		else:
+			regression = False
+		rows.append( (metric, old_value, new_value, change, regression) )
+	return rows
+
+
+def parse_args( argv = None ):
+	parser = argparse.ArgumentParser( prog = "benchmark.py", description = DescriptionString )
+	subparsers = parser.add_subparsers( dest = "command" )
+
+	run_parser = subparsers.add_parser( "run", help = "Run benchmarks and write JSON report" )
+	run_parser.add_argument( "-o", "--output", help = "Path to JSON report. If not set, stdout will be used", default = None )
+	run_parser.add_argument( "--seed", type = int, default = 1 )
+	run_parser.add_argument( "--words", type = int, default = 100000, help = "Synthetic lexicon size" )
+	run_parser.add_argument( "--rules", type = int, default = 60, help = "Synthetic grammar size" )
+	run_parser.add_argument( "--queries", type = int, default = 20000 )
+	run_parser.add_argument( "--repeat", type = int, default = 3 )
+	run_parser.add_argument( "--cache-tokens", type = int, default = 50000, help = "Zipf token stream size for cache benchmark (0 - skip)" )
+	run_parser.add_argument( "--cache-entries", type = int, default = 10000 )
+	run_parser.add_argument( "--lexicon", help = "Real lexicon: word [attr] per line", default = None )
+	run_parser.add_argument( "--encoding", default = "utf-8", help = "Lexicon encoding" )
+	run_parser.add_argument( "--grammar", help = "Real *_CompositeRules_Grammar.txt (UTF-16)", default = None )
+	run_parser.add_argument( "--verify",
+		action='store_const', const=True, default=False,
+		help = "Also verify the built dictionary against the lexicon and run differential fuzzing (see verify_dictionary.py)" )
+	run_parser.add_argument( "--verify-rounds", type = int, default = 20 )
+
+	compare_parser = subparsers.add_parser( "compare", help = "Compare two JSON reports" )
+	compare_parser.add_argument( "old" )
+	compare_parser.add_argument( "new" )
+	compare_parser.add_argument( "--threshold", type = float, default = 0.1, help = "Relative change treated as regression" )
+
+	args = parser.parse_args( argv )
+	if args.command is None:
+		parser.error( "command is required" )
+	return args
+
+
+def main():
+	args = parse_args()
+
+	if args.command == "run":
+		report = json.dumps( run( args ), indent = 2 )
+		if args.output is not None:
+			with open( args.output, "w" ) as out:
+				out.write( report + "\n" )
+		else:
+			print( report )
+
+	elif args.command == "compare":
+		with open( args.old ) as old_in, open( args.new ) as new_in:
+			rows = compare( json.load( old_in ), json.load( new_in ), args.threshold )
+		regressions = 0
+		for (metric, old_value, new_value, change, regression) in rows:
+			regressions += regression
+			print( "{:40} {:>14.6g} {:>14.6g} {:>+8.1%}{}".format( metric, old_value, new_value, change, "  REGRESSION" if regression else "" ) )
+		sys.exit( 1 if regressions > 0 else 0 )
+
+
+####################################################################################################
+
+import unittest
+
+class TestBenchmark(unittest.TestCase):
+
+	def test_generators_are_reproducible(self):
+		self.assertEqual( generate_lexicon( 200, seed = 5 ), generate_lexicon( 200, seed = 5 ) )
+		self.assertNotEqual( generate_lexicon( 200, seed = 5 ), generate_lexicon( 200, seed = 6 ) )
+		self.assertEqual( generate_grammar( 20, seed = 5 ), generate_grammar( 20, seed = 5 ) )
+
+	def test_run_and_compare(self):
+		args = parse_args( [ "run", "--words", "300", "--rules", "10", "--queries", "100", "--repeat", "1", "--cache-tokens", "500", "--cache-entries", "50",
+			"--verify", "--verify-rounds", "2" ] )
+		report = run( args )
+		results = report["results"]
+		self.assertEqual( results["words_count"], 300 )
+		self.assertLess( results["dawg_size_bytes"], results["tree_size_bytes"] )
+		self.assertIn( "reader_check_word_p99_s", results )
+		self.assertGreater( results["cache_hit_rate"], 0.5 )
+		self.assertEqual( results["verify_lexicon_errors_count"], 0 )
+		self.assertEqual( results["verify_fuzz_errors_count"], 0 )
+
+		slower = json.loads( json.dumps( report ) )
+		slower["results"]["dawg_build_s"] *= 2
+		regressions = [row[0] for row in compare( report, slower, 0.1 ) if row[4]]
+		self.assertEqual( regressions, [ "dawg_build_s" ] )
+
+
+if __name__ == "__main__":
+	main()
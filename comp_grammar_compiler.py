@@ -1,353 +1,587 @@
-#! python3
-
-import sys
-import fsm
-import dictionary as dic
-
-# единственный аргумент
-Language = sys.argv[1]
-
-# файл с комп. грамматикой вида:
-# 1 + 0 -> 0
-# 0 + 21 -> 22
-CompGrammarFile = open( Language + "_CompositeRules_Grammar.txt", encoding="utf-16" )
-
-# файл с отношением между грамматическими фильтрами
-# задаёт частичный порядок над грамматическими фильтрами
-# 0 < 1
-# означает, что фильтр 1 требует все те же граммемы, что фильтр 0
-GrammarFilterRelation = open( Language + "_GrammarFilterRel.txt", encoding="utf-16" )
-
-# Словарь
-# слово <тэг из номеров композитных фильтров>
-Dictionary = open( Language + "_Dictionary.txt", encoding="utf-16" )
-
-FINAL = "FINAL"
-
-def read_grammar():
-	grammar = []
-	CompGrammarFile.seek( 0 )
-	for line in CompGrammarFile:
-		parts = line[:-1].split()
-		if len( parts ) < 5:
-			continue
-		left, _plus, right, _arrow, res = parts
-		grammar.append( (res, left, right) )
-	return grammar
-
-def output_grammar( file_name, grammar ):
-	out = open( file_name, "w", encoding="utf-16" )
-	for (res, left, right) in grammar:
-		out.write( res + " -> " + left + " " + right + "\n" )
-
-
-def read_filter_relation():
-	result = {}
-	GrammarFilterRelation.seek( 0 )
-	for line in GrammarFilterRelation:
-		parts = line[:-1].split()
-		if len( parts ) != 3:
-			# формат 0 < 22
-			continue
-		left, _less, right = parts
-		if left not in result:
-			result[left] = []
-		result[left].append( right )
-
-	return result
-
-
-
-def inflate_grammar( grammar, gr_filter_rel ):
-	new_rules = []
-	
-	def append_new_rule( nr ): # nr = new_rule
-		if nr not in new_rules and nr not in grammar:
-			new_rules.append( nr )
-
-	for (res, left, right) in grammar:
-		if res == left and left in gr_filter_rel:
-			variants = gr_filter_rel[left]
-			for v in variants:
-				append_new_rule( (v, v, right) )
-
-		elif res == right and right in gr_filter_rel:
-			variants = gr_filter_rel[right]
-			for v in variants:
-				append_new_rule( (v, left, v) )
-	return grammar + new_rules
-
-
-def nonterm( number ):
-	return "G" + number
-
-
-def term( number ):
-	return "t" + number
-
-def build_trivial_transfers( grammar, nfa ):
-	for (res, left, right) in grammar:
-		add_terminal_transfer( res, nfa )
-		add_terminal_transfer( left, nfa )
-		add_terminal_transfer( right, nfa )
-
-# Результирующее правило
-# G1 -> t1
-def add_terminal_transfer( number, nfa ):
-	non_term_name = nonterm( number )
-	if nfa.has_state( non_term_name ):
-		return
-	nfa.add_state( non_term_name )
-	nfa.add_trans( non_term_name, term(number), FINAL )
-
-
-def add_dependency( dependencies, dependent, independent ):
-	if independent not in dependencies:
-		dependencies[independent] = []
-	# независимый -> зависимый
-	dependencies[independent].append( dependent )
-
-# правое ядро: R -> L R
-def add_right_core_rules( left, right, dependencies, nfa ):
-	left_terminal = term( left )
-	right_non_term = nonterm( right )
-	# 1. Любой разбор может быть последним. (S -> R) => S -> l R
-	nfa.add_trans( fsm.START, left_terminal, right_non_term )
-	# 2. Правое ядро (R -> L R) => R -> l R
-	nfa.add_trans( right_non_term, left_terminal, right_non_term )
-
-# левое ядро: L -> L R
-def add_left_core_rules( left, right, dependencies, nfa ):
-	left_non_term = nonterm( left )
-	left_term = nonterm( left )
-	right_term = term( right )
-	# 1. Любой разбор может быть последним
-	state_before_final = right_term + "_FINAL"
-	nfa.add_trans( fsm.START, left_term, state_before_final )
-	nfa.add_trans( state_before_final, right_term, FINAL )
-	# 2. Саморекурсия. l r+
-	# L -> l R+
-	# R+ -> r R+ | r
-	right_recursive = nonterm( right ) + "+"
-	nfa.add_trans( left_non_term, left_term, right_recursive )
-	nfa.add_trans( right_recursive, right_term, right_recursive )
-	nfa.add_trans( right_recursive, right_term, FINAL )
-
-
-# зависимость правоядерного от правоядерного
-# A -> B A
-# B -> C B
-# A зависит от B
-# принимаем слова вида (c+ b)+ a
-# отложенное состояние B_A (ведем себя как B, но обещаем вернуться в A)
-# 1. A -> c B>A (подстановка терминала)
-# 2. B>A -> c B>A (ведем себя как B - правоядерность)
-# 3. B>A -> b A (откладывали A - возвращаемся)
-def process_depend_right_right( left, right, dependent, nfa ):
-	dep_non_term = nonterm( dependent ) # A
-	deffered = nonterm( right ) + ">" + dep_non_term # B>A
-	left_term = term( left ) # c
-	final_term = term( right ) # b
-	# 1. A -> c B_A
-	nfa.add_trans( dep_non_term, left_term, deffered )
-	# 2. B_A -> c B_A
-	nfa.add_trans( deffered, left_term, deffered )
-	# 3. B_A -> b A
-	nfa.add_trans( deffered, final_term, dep_non_term )
-
-
-# зависимость правоядерного от левоядерного
-# A -> B A
-# B -> B С
-# A зависит от B
-# принимаем слова вида (b c+)+ a
-# отложенное состояние B^C+_A (ведем себя как B -> B C, но обещаем вернуться в A)
-# 1. A -> b B^C+_A
-# 2. B^C+_A -> c B^C+_A (ведем себя как B -> B C)
-# 3. B^C+_A -> c A (для рекурсии скобок (b c+)+ )
-# 4. B^C+_A -> a FINAL (откладывали a)
-def process_depend_right_left( left, right, dependent, nfa ):
-	dep_term = term( dependent ) # a
-	left_term = term( left ) # b
-	right_term = term( right ) # c
-	dep_non_term = nonterm( dependent ) # A
-	special_state = nonterm( left ) + "^" + nonterm( right ) + "+_" + dep_non_term # B^C+_A
-	nfa.add_trans( dep_non_term, left_term, special_state )		# 1
-	nfa.add_trans( special_state, right_term, special_state )	# 2
-	nfa.add_trans( special_state, right_term, dep_non_term )	# 3
-	nfa.add_trans( special_state, dep_term, FINAL )				# 4
-
-
-# зависимость левоядерного от правоядерного
-# A -> A B
-# B -> С B
-# A зависит от B
-# принимаем слова вида a(c+b)+
-# 1. A -> a C^B0
-# 2. C^B0 -> c C^B1
-# 3. C^B1 -> c C^B1
-# 4. C^B1 -> b C^B2
-# 5. C^B1 -> b FINAL
-# 6. C^B2 -> c C^B1
-def process_depend_left_right( left, right, dependent, nfa ):
-	dep_term = term( dependent ) # a
-	left_term = term( left ) # c
-	right_term = term( right ) # b
-	dep_non_term = nonterm( dependent ) # A
-	special = nonterm( left ) + "^" + nonterm( right )
-	special_0 = special + "0"
-	special_1 = special + "1"
-	special_2 = special + "2"
-	nfa.add_trans( dep_non_term, dep_term, special_0 )	# 1
-	nfa.add_trans( special_0, left_term, special_1 )	# 2
-	nfa.add_trans( special_1, left_term, special_1 )	# 3
-	nfa.add_trans( special_1, right_term, special_2 )	# 4
-	nfa.add_trans( special_1, right_term, FINAL )		# 5
-	nfa.add_trans( special_2, left_term, special_1 )	# 6
-
-# зависимость левоядерного от левоядерного
-# A -> A B
-# B -> B C
-# A зависит от B
-# принимаем слова вида a(bc+)+
-# 1. A -> a B^C+
-# 2. B^C+ -> b C+_B+
-# 3. C+_B+ -> c C+_B+
-# 4. C+_B+ -> c B^C+
-# 5. C+_B+ -> c FINAL
-def process_depend_left_left( left, right, dependent, nfa ):
-	dep_term = term( dependent ) # a
-	left_term = term( left ) # b
-	right_term = term( right ) # c
-	dep_non_term = nonterm( dependent ) # A
-	special_0 = nonterm( left ) + "^" + nonterm( right ) + "+"	# B^C+
-	special_1 = nonterm( right ) + "+_" + nonterm( left ) + "+"	# C+_B+
-	nfa.add_trans( dep_non_term, dep_term, special_0 )	# 1 
-	nfa.add_trans( special_0, left_term, special_1 )	# 2
-	nfa.add_trans( special_1, right_term, special_1 )	# 3
-	nfa.add_trans( special_1, right_term, special_0 )	# 4
-	nfa.add_trans( special_1, right_term, FINAL )		# 5
-
-
-def build_fsm( grammar ):
-	nfa = fsm.NFA()
-	nfa.add_state( FINAL )
-	nfa.set_final( FINAL )
-
-	build_trivial_transfers( grammar, nfa )
-	
-	right_dependencies = {}
-	left_dependencies = {}
-
-	# фаза 1. Простые правила. Зависимости будут обработаны на фазе 2.
-	for (res, left, right) in grammar:
-		if res == left == right:
-			pass # чтобы не забыть
-		elif res == right:
-			# правоядерное правило
-			add_right_core_rules( left, right, right_dependencies, nfa )
-			add_dependency( right_dependencies, right, left )
-		elif res == left:
-			# левоядерное правило
-			add_left_core_rules( left, right, left_dependencies, nfa )
-			add_dependency( left_dependencies, left, right)
-
-	# фаза 2. Обрабатываем зависимости
-	for (res, left, right) in grammar:
-		if res == left == right:
-			pass # TODO: чтобы не забыть
-		elif res == right:
-			# правоядерное правило
-			if res in right_dependencies:
-				for dependent in right_dependencies[res]:
-					process_depend_right_right( left, right, dependent, nfa )
-			if res in left_dependencies:
-				for dependent in left_dependencies[res]:
-					process_depend_right_left( left, right, dependent, nfa )
-		elif res == left:
-			# левоядерное правило
-			if res in right_dependencies:
-				for dependent in right_dependencies[res]:
-					process_depend_left_right( left, right, dependent, nfa )
-			if res in left_dependencies:
-				for dependent in left_dependencies[res]:
-					process_depend_left_left( left, right, dependent, nfa )
-
-	return nfa
-
-
-def compile_dictionary():
-	builder = dic.DicDawgBuilder()
-	number = 1
-	tags_to_number = { "<>": 0 }
-	terminals_to_tag = {}
-
-	for line in Dictionary:
-		word, tag = line[:-1].split( maxsplit=1 )
-		if tag not in tags_to_number:
-			tags_to_number[tag] = number
-			number += 1
-
-		current_tag_number = tags_to_number[tag]
-
-		builder.add_word( word.strip( " " ), current_tag_number )
-
-		terminals = tag.strip( " <>" ).split()
-		for term_number in terminals:
-			term_name = term( term_number )
-			if term_name not in terminals_to_tag:
-				terminals_to_tag[term_name] = []
-			if current_tag_number not in terminals_to_tag[term_name]:
-				terminals_to_tag[term_name].append( current_tag_number )
-
-	with open( Language + "_dic.dawg", "wb" ) as dawg_out:
-		dawg_out.write( builder.build().serialize() )
-
-	return terminals_to_tag
-
-
-def split_terminals_to_tags( dfsm, term_to_tag ):
-	# лезем в исходники FSM
-	new_nfa = fsm.NFA()
-	processed = set(fsm.START)
-
-	# обход в ширину (BFS)
-	to_process = [fsm.START]
-	while len( to_process ) > 0:
-		current_name = to_process.pop( 0 )
-		state = dfsm.states[current_name]
-		for term in state.keys():
-			if term not in term_to_tag:
-				continue
-			# в DFA state[term] - единственный элемент
-			next_name = state[term]
-			for tag in term_to_tag[term]:
-				new_nfa.add_trans( current_name, tag, next_name )
-			if next_name not in processed:
-				processed.add( next_name )
-				to_process.append( next_name )
-	return new_nfa.to_DFA()
-
-
-def main():
-	grammar = read_grammar()
-	gr_filter_rel = read_filter_relation()
-	grammar = inflate_grammar( grammar, gr_filter_rel )
-
-	nfa = build_fsm( grammar )
-	nfa.write_as_text( open( "nfa.txt", "w" ) )
-
-	dfa = nfa.to_DFA()
-	dfa.write_as_text( open( "dfa.txt", "w" ) )
-
-	term_to_tag = compile_dictionary()
-	open( "term_to_tag.txt", "w" ).write( str( term_to_tag ) )
-
-	splitted_dfa = split_terminals_to_tags( dfa, term_to_tag )
-	splitted_dfa.write_as_text( open( "splitted_dfa.txt", "w" ) )
-	with open( Language + "_copm.dfa", "wb" ) as out:
-		splitted_dfa.serialize( out )
-
-
-if __name__ == '__main__':
+#! python3
+
+import os
+import argparse
+import collections
+import fsm
+import dictionary as dic
+import profiling
+import container
+
+DescriptionString = "Compound grammar compiler."
+
+# Исходные файлы языка. Открываются в open_sources()
+Language = None
+
+# файл с комп. грамматикой вида:
+# 1 + 0 -> 0
+# 0 + 21 -> 22
+CompGrammarFile = None
+
+# файл с отношением между грамматическими фильтрами
+# задаёт частичный порядок над грамматическими фильтрами
+# 0 < 1
+# означает, что фильтр 1 требует все те же граммемы, что фильтр 0
+GrammarFilterRelation = None
+
+# Словарь
+# слово <тэг из номеров композитных фильтров>
+Dictionary = None
+
+def open_sources( language ):
+	global Language, CompGrammarFile, GrammarFilterRelation, Dictionary
+	Language = language
+	CompGrammarFile = open( Language + "_CompositeRules_Grammar.txt", encoding="utf-16" )
+	GrammarFilterRelation = open( Language + "_GrammarFilterRel.txt", encoding="utf-16" )
+	Dictionary = open( Language + "_Dictionary.txt", encoding="utf-16" )
+
+FINAL = "FINAL"
+
+def read_grammar():
+	CompGrammarFile.seek( 0 )
+	return parse_grammar( CompGrammarFile )
+
+def parse_grammar( lines ):
+	grammar = []
+	for line in lines:
+		parts = line.split()
+		if len( parts ) < 5:
+			continue
+		left, _plus, right, _arrow, res = parts
+		grammar.append( (res, left, right) )
+	return grammar
+
+def output_grammar( file_name, grammar ):
+	out = open( file_name, "w", encoding="utf-16" )
+	for (res, left, right) in grammar:
+		out.write( res + " -> " + left + " " + right + "\n" )
+
+
+def read_filter_relation():
+	result = {}
+	GrammarFilterRelation.seek( 0 )
+	for line in GrammarFilterRelation:
+		parts = line[:-1].split()
+		if len( parts ) != 3:
+			# формат 0 < 22
+			continue
+		left, _less, right = parts
+		if left not in result:
+			result[left] = []
+		result[left].append( right )
+
+	return result
+
+
+
+def inflate_grammar( grammar, gr_filter_rel ):
+	new_rules = []
+	
+	def append_new_rule( nr ): # nr = new_rule
+		if nr not in new_rules and nr not in grammar:
+			new_rules.append( nr )
+
+	for (res, left, right) in grammar:
+		if res == left and left in gr_filter_rel:
+			variants = gr_filter_rel[left]
+			for v in variants:
+				append_new_rule( (v, v, right) )
+
+		elif res == right and right in gr_filter_rel:
+			variants = gr_filter_rel[right]
+			for v in variants:
+				append_new_rule( (v, left, v) )
+	return grammar + new_rules
+
+
+def nonterm( number ):
+	return "G" + number
+
+
+def term( number ):
+	return "t" + number
+
+def build_trivial_transfers( grammar, nfa ):
+	for (res, left, right) in grammar:
+		add_terminal_transfer( res, nfa )
+		add_terminal_transfer( left, nfa )
+		add_terminal_transfer( right, nfa )
+
+# Результирующее правило
+# G1 -> t1
+def add_terminal_transfer( number, nfa ):
+	non_term_name = nonterm( number )
+	if nfa.has_state( non_term_name ):
+		return
+	nfa.add_state( non_term_name )
+	nfa.add_trans( non_term_name, term(number), FINAL )
+
+
+def add_dependency( dependencies, dependent, independent ):
+	if independent not in dependencies:
+		dependencies[independent] = []
+	# независимый -> зависимый
+	dependencies[independent].append( dependent )
+
+# правое ядро: R -> L R
+def add_right_core_rules( left, right, dependencies, nfa ):
+	left_terminal = term( left )
+	right_non_term = nonterm( right )
+	# 1. Любой разбор может быть последним. (S -> R) => S -> l R
+	nfa.add_trans( fsm.START, left_terminal, right_non_term )
+	# 2. Правое ядро (R -> L R) => R -> l R
+	nfa.add_trans( right_non_term, left_terminal, right_non_term )
+
+# левое ядро: L -> L R
+def add_left_core_rules( left, right, dependencies, nfa ):
+	left_non_term = nonterm( left )
+	left_term = nonterm( left )
+	right_term = term( right )
+	# 1. Любой разбор может быть последним
+	state_before_final = right_term + "_FINAL"
+	nfa.add_trans( fsm.START, left_term, state_before_final )
+	nfa.add_trans( state_before_final, right_term, FINAL )
+	# 2. Саморекурсия. l r+
+	# L -> l R+
+	# R+ -> r R+ | r
+	right_recursive = nonterm( right ) + "+"
+	nfa.add_trans( left_non_term, left_term, right_recursive )
+	nfa.add_trans( right_recursive, right_term, right_recursive )
+	nfa.add_trans( right_recursive, right_term, FINAL )
+
+
+# саморекурсия: A -> A A (свободная итерация)
+# принимаем слова вида a a+, а в общем случае - последовательности разборов A.
+# Новых состояний не нужно: G_A уже означает "дальше идет A", поэтому
+# достаточно петли на G_A и входа в нее из START.
+# 1. Любой разбор может быть последним. (S -> A) => S -> a A
+# 2. A -> a A (после разобранного A снова может идти A)
+# Зависимые от A правила достаются через G_A, поэтому на фазе 2 правило не порождает
+# отложенных состояний (раньше каждое такое правило умножало их).
+# Ограничение: разборы A по левоядерным правилам (A -> A R) заканчиваются в общем
+# состоянии R+ и за ними петля не продолжается.
+def add_self_recursive_rules( number, nfa ):
+	terminal = term( number )
+	non_term = nonterm( number )
+	nfa.add_trans( fsm.START, terminal, non_term )	# 1
+	nfa.add_trans( non_term, terminal, non_term )	# 2
+
+
+# зависимость правоядерного от правоядерного
+# A -> B A
+# B -> C B
+# A зависит от B
+# принимаем слова вида (c+ b)+ a
+# отложенное состояние B_A (ведем себя как B, но обещаем вернуться в A)
+# 1. A -> c B>A (подстановка терминала)
+# 2. B>A -> c B>A (ведем себя как B - правоядерность)
+# 3. B>A -> b A (откладывали A - возвращаемся)
+def process_depend_right_right( left, right, dependent, nfa ):
+	dep_non_term = nonterm( dependent ) # A
+	deffered = nonterm( right ) + ">" + dep_non_term # B>A
+	left_term = term( left ) # c
+	final_term = term( right ) # b
+	# 1. A -> c B_A
+	nfa.add_trans( dep_non_term, left_term, deffered )
+	# 2. B_A -> c B_A
+	nfa.add_trans( deffered, left_term, deffered )
+	# 3. B_A -> b A
+	nfa.add_trans( deffered, final_term, dep_non_term )
+
+
+# зависимость правоядерного от левоядерного
+# A -> B A
+# B -> B С
+# A зависит от B
+# принимаем слова вида (b c+)+ a
+# отложенное состояние B^C+_A (ведем себя как B -> B C, но обещаем вернуться в A)
+# 1. A -> b B^C+_A
+# 2. B^C+_A -> c B^C+_A (ведем себя как B -> B C)
+# 3. B^C+_A -> c A (для рекурсии скобок (b c+)+ )
+# 4. B^C+_A -> a FINAL (откладывали a)
+def process_depend_right_left( left, right, dependent, nfa ):
+	dep_term = term( dependent ) # a
+	left_term = term( left ) # b
+	right_term = term( right ) # c
+	dep_non_term = nonterm( dependent ) # A
+	special_state = nonterm( left ) + "^" + nonterm( right ) + "+_" + dep_non_term # B^C+_A
+	nfa.add_trans( dep_non_term, left_term, special_state )		# 1
+	nfa.add_trans( special_state, right_term, special_state )	# 2
+	nfa.add_trans( special_state, right_term, dep_non_term )	# 3
+	nfa.add_trans( special_state, dep_term, FINAL )				# 4
+
+
+# зависимость левоядерного от правоядерного
+# A -> A B
+# B -> С B
+# A зависит от B
+# принимаем слова вида a(c+b)+
+# 1. A -> a C^B0
+# 2. C^B0 -> c C^B1
+# 3. C^B1 -> c C^B1
+# 4. C^B1 -> b C^B2
+# 5. C^B1 -> b FINAL
+# 6. C^B2 -> c C^B1
+def process_depend_left_right( left, right, dependent, nfa ):
+	dep_term = term( dependent ) # a
+	left_term = term( left ) # c
+	right_term = term( right ) # b
+	dep_non_term = nonterm( dependent ) # A
+	special = nonterm( left ) + "^" + nonterm( right )
+	special_0 = special + "0"
+	special_1 = special + "1"
+	special_2 = special + "2"
+	nfa.add_trans( dep_non_term, dep_term, special_0 )	# 1
+	nfa.add_trans( special_0, left_term, special_1 )	# 2
+	nfa.add_trans( special_1, left_term, special_1 )	# 3
+	nfa.add_trans( special_1, right_term, special_2 )	# 4
+	nfa.add_trans( special_1, right_term, FINAL )		# 5
+	nfa.add_trans( special_2, left_term, special_1 )	# 6
+
+# зависимость левоядерного от левоядерного
+# A -> A B
+# B -> B C
+# A зависит от B
+# принимаем слова вида a(bc+)+
+# 1. A -> a B^C+
+# 2. B^C+ -> b C+_B+
+# 3. C+_B+ -> c C+_B+
+# 4. C+_B+ -> c B^C+
+# 5. C+_B+ -> c FINAL
+def process_depend_left_left( left, right, dependent, nfa ):
+	dep_term = term( dependent ) # a
+	left_term = term( left ) # b
+	right_term = term( right ) # c
+	dep_non_term = nonterm( dependent ) # A
+	special_0 = nonterm( left ) + "^" + nonterm( right ) + "+"	# B^C+
+	special_1 = nonterm( right ) + "+_" + nonterm( left ) + "+"	# C+_B+
+	nfa.add_trans( dep_non_term, dep_term, special_0 )	# 1 
+	nfa.add_trans( special_0, left_term, special_1 )	# 2
+	nfa.add_trans( special_1, right_term, special_1 )	# 3
+	nfa.add_trans( special_1, right_term, special_0 )	# 4
+	nfa.add_trans( special_1, right_term, FINAL )		# 5
+
+
+def build_fsm( grammar ):
+	nfa = fsm.NFA()
+	nfa.add_state( FINAL )
+	nfa.set_final( FINAL )
+
+	build_trivial_transfers( grammar, nfa )
+	
+	right_dependencies = {}
+	left_dependencies = {}
+
+	# фаза 1. Простые правила. Зависимости будут обработаны на фазе 2.
+	for (res, left, right) in grammar:
+		if res == left == right:
+			# саморекурсия. Зависимостей не добавляет
+			add_self_recursive_rules( res, nfa )
+		elif res == right:
+			# правоядерное правило
+			add_right_core_rules( left, right, right_dependencies, nfa )
+			add_dependency( right_dependencies, right, left )
+		elif res == left:
+			# левоядерное правило
+			add_left_core_rules( left, right, left_dependencies, nfa )
+			add_dependency( left_dependencies, left, right)
+
+	# фаза 2. Обрабатываем зависимости
+	for (res, left, right) in grammar:
+		if res == left == right:
+			pass # петля на G_res уже построена на фазе 1
+		elif res == right:
+			# правоядерное правило
+			if res in right_dependencies:
+				for dependent in right_dependencies[res]:
+					process_depend_right_right( left, right, dependent, nfa )
+			if res in left_dependencies:
+				for dependent in left_dependencies[res]:
+					process_depend_right_left( left, right, dependent, nfa )
+		elif res == left:
+			# левоядерное правило
+			if res in right_dependencies:
+				for dependent in right_dependencies[res]:
+					process_depend_left_right( left, right, dependent, nfa )
+			if res in left_dependencies:
+				for dependent in left_dependencies[res]:
+					process_depend_left_left( left, right, dependent, nfa )
+
+	return nfa
+
+
+# tags - список, в который записываются тэги по номерам (для контейнера)
+def compile_dictionary( profiler = None, tags = None ):
+	builder = dic.DicDawgBuilder()
+	number = 1
+	tags_to_number = { "<>": 0 }
+	terminals_to_tag = {}
+	number_of_words = 0
+
+	for line in Dictionary:
+		number_of_words += 1
+		word, tag = line[:-1].split( maxsplit=1 )
+		if tag not in tags_to_number:
+			tags_to_number[tag] = number
+			number += 1
+
+		current_tag_number = tags_to_number[tag]
+
+		builder.add_word( word.strip( " " ), current_tag_number )
+
+		terminals = tag.strip( " <>" ).split()
+		for term_number in terminals:
+			term_name = term( term_number )
+			if term_name not in terminals_to_tag:
+				terminals_to_tag[term_name] = []
+			if current_tag_number not in terminals_to_tag[term_name]:
+				terminals_to_tag[term_name].append( current_tag_number )
+
+	dawg = builder.build()
+	if profiler is not None:
+		profiler.set( "dictionary_words", number_of_words )
+		profiler.set( "dictionary_tags", len( tags_to_number ) )
+		profiler.set( "dawg_nodes", len( builder.minimized_nodes ) + 1 )
+		profiler.set( "dawg_registry_hits", builder.registry_hits )
+		profiler.set( "dawg_registry_misses", builder.registry_misses )
+
+	with open( Language + "_dic.dawg", "wb" ) as dawg_out:
+		dawg_out.write( dawg.serialize() )
+
+	if tags is not None:
+		tags[:] = sorted( tags_to_number.keys(), key = lambda tag: tags_to_number[tag] )
+
+	return terminals_to_tag
+
+
+# Переход от терминалов грамматики к тэгам словаря: тэг подходит для всех своих терминалов.
+# Тэги с одинаковым набором терминалов неразличимы для автомата, поэтому
+# автомат строится над классами таких тэгов, а symbol_map переводит тэг в класс.
+# Детерминизация выполняется сразу (без промежуточного NFA над тэгами):
+# состояние результата - множество состояний исходного DFA
+def split_terminals_to_tags( dfsm, term_to_tag ):
+	# классы тэгов
+	tag_terms = {}
+	for term in term_to_tag.keys():
+		for tag in term_to_tag[term]:
+			if tag not in tag_terms:
+				tag_terms[tag] = set()
+			tag_terms[tag].add( term )
+
+	class_numbers = {} # { frozenset( терминалы ) : номер класса }
+	term_classes = {} # { терминал : [номера классов] }
+	symbol_map = {}
+	for tag in sorted( tag_terms.keys() ):
+		terms = frozenset( tag_terms[tag] )
+		if terms not in class_numbers:
+			class_numbers[terms] = len( class_numbers )
+			for term in terms:
+				if term not in term_classes:
+					term_classes[term] = []
+				term_classes[term].append( class_numbers[terms] )
+		symbol_map[tag] = class_numbers[terms]
+
+	def mangle( names ):
+		return "@" + "_".join( sorted( names ) )
+
+	new_dfa = fsm.DFA()
+	new_dfa.symbol_map = symbol_map
+	start = frozenset( [fsm.START] )
+	names = { start: fsm.START }
+
+	# обход в ширину (BFS)
+	to_process = collections.deque( [start] )
+	while len( to_process ) > 0:
+		subset = to_process.popleft()
+		current_name = names[subset]
+		transfers = {} # { класс : множество состояний исходного DFA }
+		for old_name in subset:
+			if old_name in dfsm.final:
+				new_dfa.set_final( current_name )
+			state = dfsm.states[old_name]
+			for term in state.keys():
+				for symbol_class in term_classes.get( term, () ):
+					if symbol_class not in transfers:
+						transfers[symbol_class] = set()
+					# в DFA state[term] - единственный элемент
+					transfers[symbol_class].add( state[term] )
+
+		for symbol_class in sorted( transfers.keys() ):
+			target = frozenset( transfers[symbol_class] )
+			if target not in names:
+				names[target] = mangle( target )
+				to_process.append( target )
+			new_dfa.add_trans( current_name, symbol_class, names[target] )
+	return new_dfa
+
+
+def parse_args():
+	parser = argparse.ArgumentParser( prog = "comp_grammar_compiler.py", description = DescriptionString )
+	parser.add_argument( "language",
+		help = "Language prefix of <language>_CompositeRules_Grammar.txt, <language>_GrammarFilterRel.txt and <language>_Dictionary.txt" )
+	parser.add_argument( "--dump",
+		choices = ["none", "text", "jsonl"], default = "text",
+		help = "Intermediate automata dumps: text (nfa.txt, ...), jsonl (nfa.jsonl, ...) or none" )
+	parser.add_argument( "--dump-dir",
+		help = "Directory for the dumps",
+		default = "." )
+	parser.add_argument( "--dot",
+		metavar = "STATE",
+		help = "Also write GraphViz neighbourhood of STATE for every dumped automaton (*.dot)",
+		default = None )
+	parser.add_argument( "--dot-radius",
+		type = int, default = 2,
+		help = "Neighbourhood radius in transitions for --dot" )
+	parser.add_argument( "--container",
+		action='store_const', const=True, default=False,
+		help = "Also pack dictionary, tag table and automaton into <language>.wfpack" )
+	parser.add_argument( "--compression",
+		choices = sorted( container.CompressionCodes.keys() ), default = "none",
+		help = "Section compression for --container" )
+	profiling.add_arguments( parser )
+	return parser.parse_args()
+
+
+DumpBufferSize = 1 << 20
+
+# промежуточный автомат в файлы <dump_dir>/<name>.txt|.jsonl|.dot
+def dump_fsm( args, name, automaton ):
+	if args.dump != "none" or args.dot is not None:
+		os.makedirs( args.dump_dir, exist_ok = True )
+	if args.dump != "none":
+		extension = ".txt" if args.dump == "text" else ".jsonl"
+		with open( os.path.join( args.dump_dir, name + extension ), "w", encoding="utf-8", buffering = DumpBufferSize ) as out:
+			if args.dump == "text":
+				automaton.write_as_text( out )
+			else:
+				automaton.write_as_jsonl( out )
+	if args.dot is not None and args.dot in automaton.states:
+		with open( os.path.join( args.dump_dir, name + ".dot" ), "w", encoding="utf-8" ) as out:
+			automaton.write_as_dot( out, args.dot, args.dot_radius )
+
+
+def fsm_stats( profiler, name, automaton ):
+	profiler.set( name + "_states", len( automaton.states ) )
+	profiler.set( name + "_transitions", automaton.transitions_count() )
+
+
+def main():
+	args = parse_args()
+	profiler = profiling.from_args( args )
+	open_sources( args.language )
+
+	with profiler.stage( "read" ):
+		grammar = read_grammar()
+		gr_filter_rel = read_filter_relation()
+	profiler.set( "grammar_rules", len( grammar ) )
+
+	with profiler.stage( "inflate" ):
+		grammar = inflate_grammar( grammar, gr_filter_rel )
+	profiler.set( "inflated_rules", len( grammar ) )
+
+	with profiler.stage( "build_fsm" ):
+		nfa = build_fsm( grammar )
+	fsm_stats( profiler, "nfa", nfa )
+	dump_fsm( args, "nfa", nfa )
+
+	with profiler.stage( "to_DFA" ):
+		dfa = nfa.to_DFA()
+	fsm_stats( profiler, "dfa", dfa )
+	dump_fsm( args, "dfa", dfa )
+
+	tags = []
+	with profiler.stage( "dawg" ):
+		term_to_tag = compile_dictionary( profiler, tags )
+	if args.dump != "none":
+		with open( os.path.join( args.dump_dir, "term_to_tag.txt" ), "w", encoding="utf-8" ) as out:
+			out.write( str( term_to_tag ) )
+
+	with profiler.stage( "split" ):
+		splitted_dfa = split_terminals_to_tags( dfa, term_to_tag )
+	with profiler.stage( "compress_alphabet" ):
+		splitted_dfa, report = splitted_dfa.compress_alphabet()
+	fsm_stats( profiler, "splitted_dfa", splitted_dfa )
+	profiler.set( "symbol_classes", report["classes"] )
+	profiler.set( "table_cells_before", report["table_cells_before"] )
+	profiler.set( "table_cells_after", report["table_cells_after"] )
+	dump_fsm( args, "splitted_dfa", splitted_dfa )
+	with open( Language + "_copm.dfa", "wb" ) as out:
+		splitted_dfa.serialize( out )
+
+	if args.container:
+		with profiler.stage( "container" ):
+			with open( Language + "_dic.dawg", "rb" ) as dawg_in:
+				container.pack_artifacts( Language + ".wfpack", dawg_in.read(), tags, splitted_dfa, args.compression )
+
+	profiling.finish( profiler, args )
+
+
+####################################################################################################
+
+import unittest
+import random
+
+class TestSelfRecursiveRules(unittest.TestCase):
+
+	def test_free_iteration(self):
+		grammar = [ ("1", "1", "1"), ("2", "3", "2") ]
+		dfa = build_fsm( grammar ).to_DFA()
+		t1, t2, t3 = term( "1" ), term( "2" ), term( "3" )
+		self.assertFalse( dfa.check( [t1] ) )
+		self.assertTrue( dfa.check( [t1, t1] ) )
+		self.assertTrue( dfa.check( [t1, t1, t1, t1] ) )
+		self.assertFalse( dfa.check( [t1, t2] ) )
+		# правоядерное правило не пострадало
+		self.assertTrue( dfa.check( [t3, t3, t2] ) )
+
+	def test_iteration_inside_right_core(self):
+		# 2 -> 1 2 и 1 -> 1 1: перед t2 любое число t1
+		grammar = [ ("1", "1", "1"), ("2", "1", "2") ]
+		dfa = build_fsm( grammar ).to_DFA()
+		t1, t2 = term( "1" ), term( "2" )
+		self.assertTrue( dfa.check( [t1, t2] ) )
+		self.assertTrue( dfa.check( [t1, t1, t1, t2] ) )
+
+	def test_states_bounded(self):
+		grammar = [ ("2", "1", "2"), ("2", "2", "3"), ("4", "3", "4") ]
+		base = build_fsm( grammar )
+		extended = build_fsm( grammar + [ (n, n, n) for n in [ "1", "2", "3", "4" ] ] )
+		self.assertEqual( len( extended.states ), len( base.states ) )
+
+
+class TestSplitTerminalsToTags(unittest.TestCase):
+
+	# прежнее построение: NFA над тэгами и полная детерминизация
+	def split_via_nfa(self, dfsm, term_to_tag):
+		new_nfa = fsm.NFA()
+		for current_name, state in dfsm.states.items():
+			if not new_nfa.has_state( current_name ):
+				new_nfa.add_state( current_name )
+			if current_name in dfsm.final:
+				new_nfa.set_final( current_name )
+			for term in state.keys():
+				for tag in term_to_tag.get( term, () ):
+					new_nfa.add_trans( current_name, tag, state[term] )
+		return new_nfa.to_DFA()
+
+	def test_same_language(self):
+		grammar = [ ("2", "1", "2"), ("2", "2", "3"), ("3", "3", "4"), ("1", "1", "5") ]
+		dfa = build_fsm( grammar ).to_DFA()
+		term_to_tag = { "t1": [1, 4], "t2": [2, 4], "t3": [3, 5], "t4": [6], "t5": [7, 8] }
+
+		splitted = split_terminals_to_tags( dfa, term_to_tag )
+		reference = self.split_via_nfa( dfa, term_to_tag )
+		# тэги 7 и 8 неразличимы
+		self.assertEqual( splitted.symbol_map[7], splitted.symbol_map[8] )
+		self.assertLessEqual( len( splitted.states ), len( reference.states ) )
+
+		rnd = random.Random( 1 )
+		tags = list( range( 1, 9 ) )
+		for _ in range( 2000 ):
+			word = [ rnd.choice( tags ) for _ in range( rnd.randint( 1, 6 ) ) ]
+			self.assertEqual( splitted.check( word ), reference.check( word ), word )
+			self.assertEqual( splitted.to_EncodedDFA().check( word ), reference.check( word ), word )
+
+
+if __name__ == '__main__':
 	main()
\ No newline at end of file
@@ -1,72 +1,279 @@
-#! python3
-
-import sys
-import argparse
-import dictionary
-import time
-import io
-
-DescriptionString = "Prefix Tree dictionary compiler."
-
-def parse_args():
-	parser = argparse.ArgumentParser( prog = "compile_dictionary.py", description = DescriptionString )
-	parser.add_argument( "-i", "--input",
-		type=argparse.FileType( "r", encoding='utf16' ),
-		help = "Path to UTF-8 text file. Words delimeted by any space symbol. If not set, stdin will be used",
-		default = sys.stdin )
-	parser.add_argument( "-o", "--output",
-		type=argparse.FileType( "wb" ),
-		help = "Path to output file. If not set, stdout will be used",
-		default = sys.stdout )
-	parser.add_argument( "--dawg",
-		action='store_const', const=True, default=False,
-		help = "Use DAWG(directed acyclic word graph) minimization" )
-
-	return parser.parse_args()
-
-def main():
-	args = parse_args()
-
-	collector = dictionary.DicDawgBuilder() if args.dawg else dictionary.DicTree()
-
-	input = args.input
-	input.seek( 0, io.SEEK_END )
-	total_bytes = input.tell()
-	input.seek( 0, io.SEEK_SET )
-
-	start = time.time()
-
-	i = 0
-	current_bytes = 0
-
-	for line in input:
-		for word in sorted(line[:-1].split()):
-			collector.add_word( word )
-			i += 1
-			current_bytes += len( line ) * 2
-		if i > 10000:
-			print( "{:.2%}".format( current_bytes / total_bytes ), end='\r' )
-			i = 0
-
-	binary = bytes()
-
-	build_end = time.time()
-
-	if args.dawg:
-		binary = collector.build().serialize()
-	else:
-		binary = collector.serialize()
-
-	serialize_end = time.time()
-
-	args.output.write( binary )
-
-	end = time.time()
-
-	print( "Building DAWG time: ", build_end - start, "s" )
-	print( "Serialization time: ", serialize_end - build_end, "s" )
-	print( "Total time: ", end - start, "s" )
-
-
-if __name__ == "__main__":
-	main()
+#! python3
+
+import sys
+import argparse
+import dictionary
+import time
+import profiling
+import lexicon_reader
+import folding as fold
+import suffix_histograms
+
+DescriptionString = "Prefix Tree dictionary compiler."
+
+def parse_args():
+	parser = argparse.ArgumentParser( prog = "compile_dictionary.py", description = DescriptionString )
+	parser.add_argument( "-i", "--input",
+		help = "Path to text file. Words delimeted by any space symbol. "
+			"UTF-8 or UTF-16 (detected by BOM), may be gzip/xz/bz2 compressed. If not set or '-', stdin will be used",
+		default = "-" )
+	parser.add_argument( "--encoding",
+		help = "Input encoding if the file has no BOM. Default: UTF-8",
+		default = None )
+	parser.add_argument( "-o", "--output",
+		type=argparse.FileType( "wb" ),
+		help = "Path to output file. If not set, stdout will be used",
+		default = sys.stdout.buffer )
+	parser.add_argument( "--dawg",
+		action='store_const', const=True, default=False,
+		help = "Use DAWG(directed acyclic word graph) minimization" )
+	parser.add_argument( "--tagged",
+		action='store_const', const=True, default=False,
+		help = "Input lines are 'word<TAB>tag'. Tags are numbered in order of appearance and stored as word attributes" )
+	parser.add_argument( "--tags-output",
+		help = "Path to tag table file for --tagged mode. Default: <output>.tags",
+		default = None )
+	parser.add_argument( "--reverse-output",
+		help = "Also write DAWG of reversed words to this path and suffix tag histograms to <path>.hist "
+			"(for suffix_index.py). Reversed words are sorted in memory",
+		default = None )
+	parser.add_argument( "--fold-lower",
+		action='store_const', const=True, default=False,
+		help = "Store words in lower case and look them up case-insensitively" )
+	parser.add_argument( "--fold-normalization",
+		choices = fold.Normalizations, default = None,
+		help = "Unicode normalization of stored words and queries" )
+	parser.add_argument( "--fold-map",
+		action = "append", metavar = "LETTER=REPLACEMENT",
+		help = "Letter replacement for stored words and queries, e.g. 'ё=е'. May be repeated" )
+	parser.add_argument( "--fold-alternative",
+		action = "append", metavar = "LETTER=ALTERNATIVES",
+		help = "Letters also tried in place of LETTER at lookup, e.g. 'е=ё'. May be repeated" )
+	profiling.add_arguments( parser )
+
+	args = parser.parse_args()
+	if args.tagged and args.tags_output is None:
+		if args.output is sys.stdout.buffer:
+			parser.error( "--tags-output is required when output is stdout" )
+		args.tags_output = args.output.name + ".tags"
+	try:
+		args.folding = make_folding( args )
+	except ValueError as e:
+		parser.error( str( e ) )
+	return args
+
+
+# свертка из параметров командной строки или None
+def make_folding( args ):
+	if not args.fold_lower and args.fold_normalization is None and not args.fold_map and not args.fold_alternative:
+		return None
+	return fold.Folding( args.fold_lower, args.fold_normalization,
+		fold.parse_pairs( args.fold_map ), fold.parse_pairs( args.fold_alternative ) )
+
+
+# Таблица тэгов: номер тэга - атрибут слова в словаре.
+# Нумерация как в comp_grammar_compiler.compile_dictionary: пустой тэг "<>" - 0 (DicNode.EmptyLeaf)
+class TagTable:
+
+	def __init__(self):
+		self.tags_to_number = { "<>": dictionary.DicNode.EmptyLeaf }
+		self.tags = [ "<>" ]
+
+
+	def intern(self, tag):
+		number = self.tags_to_number.get( tag, None )
+		if number is None:
+			number = len( self.tags )
+			self.tags_to_number[tag] = number
+			self.tags.append( tag )
+		return number
+
+
+	def __len__(self):
+		return len( self.tags )
+
+
+	# файл-спутник словаря: строки "номер<TAB>тэг" в UTF-8
+	def write(self, output):
+		for number, tag in enumerate( self.tags ):
+			output.write( "{}\t{}\n".format( number, tag ) )
+
+
+	@staticmethod
+	def read(input):
+		table = TagTable()
+		for line in input:
+			line = line.rstrip( "\r\n" )
+			if line == "":
+				continue
+			number, tag = line.split( "\t", 1 )
+			if int( number ) != table.intern( tag ):
+				raise ValueError( "Broken tag table at tag " + number )
+		return table
+
+
+# (word, attr) из потока строк
+def read_words( input, tags = None ):
+	for line in input:
+		if tags is None:
+			for word in sorted(line.split()):
+				yield (word, dictionary.DicNode.EmptyLeaf)
+		else:
+			word, _tab, tag = line.partition( "\t" )
+			word = word.strip()
+			if word == "":
+				continue
+			tag = tag.strip()
+			yield (word, tags.intern( tag if tag != "" else "<>" ))
+
+# DAWG перевернутых слов: [(перевернутое слово, атрибут)] сортируется на месте.
+# Повтор слова - последний атрибут, как в прямом словаре
+def build_reversed( reversed_words ):
+	reversed_words.sort( key = lambda item: item[0] )
+	builder = dictionary.DicDawgBuilder()
+	for (word, attr) in reversed_words:
+		builder.add_word( word, attr )
+	return builder.build()
+
+
+# прогресс пишется в stderr: stdout может быть занят результатом
+def print_progress( input ):
+	progress = input.progress()
+	if progress is not None:
+		print( "{:.2%}".format( progress ), end='\r', file=sys.stderr )
+	else:
+		print( "{:.1f} MB".format( input.bytes_read / (1 << 20) ), end='\r', file=sys.stderr )
+
+
+def main():
+	args = parse_args()
+	profiler = profiling.from_args( args )
+
+	folding = args.folding
+	# слова сворачиваются при чтении, поэтому свертка задается словарю только перед записью
+	# (DicTree.add_word свернул бы их еще раз)
+	collector = dictionary.DicDawgBuilder() if args.dawg else dictionary.DicTree()
+	# свертка меняет порядок слов, а DicDawgBuilder требует сортированный ввод:
+	# свернутые слова собираются и сортируются в памяти
+	folded_words = [] if args.dawg and folding is not None else None
+
+	input = lexicon_reader.open_lexicon( args.input, args.encoding )
+
+	start = time.time()
+
+	i = 0
+	words = 0
+
+	tags = TagTable() if args.tagged else None
+	# (перевернутое слово, атрибут) для --reverse-output
+	reversed_words = [] if args.reverse_output is not None else None
+
+	with profiler.stage( "read" ):
+		for (word, attr) in read_words( input, tags ):
+			if folding is not None:
+				word = folding.fold( word )
+			if folded_words is not None:
+				folded_words.append( (word, attr) )
+			else:
+				collector.add_word( word, attr )
+			if reversed_words is not None:
+				reversed_words.append( (word[::-1], attr) )
+			i += 1
+			if i > 10000:
+				print_progress( input )
+				words += i
+				i = 0
+	input.close()
+	if folded_words is not None:
+		folded_words.sort( key = lambda item: item[0] )
+		for (word, attr) in folded_words:
+			collector.add_word( word, attr )
+		folded_words = None
+	profiler.set( "words", words + i )
+	if tags is not None:
+		profiler.set( "tags", len( tags ) )
+	profiler.set( "input_bytes", input.bytes_read )
+
+	binary = bytes()
+
+	build_end = time.time()
+
+	# в раскладке 1 на атрибут отводится байт со знаком
+	layout = 1 if tags is None or len( tags ) <= 128 else 0
+	# статистика графа и свертка хранятся в расширенном заголовке версии 2
+	version = dictionary.DicSerializer.DefaultVersion
+
+	with profiler.stage( "serialize" ):
+		if args.dawg:
+			dawg = collector.build()
+			profiler.set( "dawg_nodes", len( collector.minimized_nodes ) + 1 )
+			profiler.set( "registry_hits", collector.registry_hits )
+			profiler.set( "registry_misses", collector.registry_misses )
+			dawg.folding = folding
+			binary = dawg.serialize( version, layout )
+		else:
+			collector.folding = folding
+			binary = collector.serialize( version, layout )
+	profiler.set( "output_bytes", len( binary ) )
+
+	serialize_end = time.time()
+
+	if reversed_words is not None:
+		with profiler.stage( "reverse" ):
+			reversed_dawg = build_reversed( reversed_words )
+			reversed_dawg.folding = folding
+			reverse_binary = reversed_dawg.serialize( version, layout )
+			reversed_words = reversed_dawg = None
+			histograms_binary = suffix_histograms.serialize_histograms( reverse_binary )
+		profiler.set( "reverse_output_bytes", len( reverse_binary ) )
+		profiler.set( "histograms_bytes", len( histograms_binary ) )
+
+	with profiler.stage( "write" ):
+		args.output.write( binary )
+		if tags is not None:
+			with open( args.tags_output, "w", encoding="utf-8" ) as tags_out:
+				tags.write( tags_out )
+		if args.reverse_output is not None:
+			with open( args.reverse_output, "wb" ) as reverse_out:
+				reverse_out.write( reverse_binary )
+			with open( args.reverse_output + ".hist", "wb" ) as histograms_out:
+				histograms_out.write( histograms_binary )
+
+	end = time.time()
+
+	print( "Building DAWG time: ", build_end - start, "s", file=sys.stderr )
+	print( "Serialization time: ", serialize_end - build_end, "s", file=sys.stderr )
+	print( "Total time: ", end - start, "s", file=sys.stderr )
+
+	profiling.finish( profiler, args )
+
+
+####################################################################################################
+
+import unittest
+import io
+
+class TestTaggedInput(unittest.TestCase):
+
+	def test_read_words(self):
+		tags = TagTable()
+		lines = [ "ball\t<2>", "foot\t<1 3>", "", "hand\t<2>", "man" ]
+		self.assertEqual( list( read_words( lines, tags ) ), [ ("ball", 1), ("foot", 2), ("hand", 1), ("man", 0) ] )
+		self.assertEqual( tags.tags, [ "<>", "<2>", "<1 3>" ] )
+
+	def test_build_reversed(self):
+		dawg = build_reversed( [ ("llab", 1), ("toof", 2), ("llabtoof", 1) ] )
+		self.assertEqual( list( dawg.iter_words( "llab" ) ), [ ("llab", 1), ("llabtoof", 1) ] )
+
+	def test_tag_table_round_trip(self):
+		tags = TagTable()
+		tags.intern( "<2>" )
+		tags.intern( "<1 3>" )
+		out = io.StringIO()
+		tags.write( out )
+		self.assertEqual( out.getvalue(), "0\t<>\n1\t<2>\n2\t<1 3>\n" )
+		self.assertEqual( TagTable.read( io.StringIO( out.getvalue() ) ).tags, tags.tags )
+
+
+if __name__ == "__main__":
+	main()
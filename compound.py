@@ -0,0 +1,74 @@
+#! python3
+
+import fsm
+
+# Разбор сложного слова (композита) на словарные части.
+# Атрибут словарного слова - номер тэга, последовательность тэгов частей
+# должна приниматься автоматом композитной грамматики (splitted DFA из comp_grammar_compiler).
+# Автомат - DFA, EncodedDFA или LazyDFA (нужны start_state, step, is_accepting).
+#
+# dictionary - любой объект с iter_prefixes (DicTree, DicDawg, DicReader)
+# Возвращает список частей [(start, end, attr)] или None
+def analyze_compound( dictionary, dfa, word ):
+	# пошаговый интерфейс автомата: состояния - целые числа (DFA, EncodedDFA)
+	step = dfa.step
+	is_accepting = dfa.is_accepting
+	# пары (позиция, состояние), из которых разбор уже не удался
+	failed = set()
+
+	def walk( start, state ):
+		if start == len( word ):
+			return [] if is_accepting( state ) else None
+		if (start, state) in failed:
+			return None
+		for (end, attr) in dictionary.iter_prefixes( word, start ):
+			next_state = step( state, attr )
+			if next_state == fsm.NoState:
+				continue
+			rest = walk( end, next_state )
+			if rest is not None:
+				return [(start, end, attr)] + rest
+		failed.add( (start, state) )
+		return None
+
+	if word == "":
+		return None
+	return walk( 0, dfa.start_state() )
+
+
+####################################################################################################
+
+import unittest
+import dictionary as dic
+
+class TestCompound(unittest.TestCase):
+	def setUp(self):
+		builder = dic.DicDawgBuilder()
+		builder.add_word( "ball", 2 )
+		builder.add_word( "foo", 1 )
+		builder.add_word( "foot", 1 )
+		builder.add_word( "tball", 3 )
+		self.dic = builder.build()
+		# 1+ 2
+		nfa = fsm.NFA()
+		nfa.add_trans( fsm.START, 1, "Q" )
+		nfa.add_trans( "Q", 1, "Q" )
+		nfa.add_trans( "Q", 2, "F" )
+		nfa.set_final( "F" )
+		self.dfa = nfa.to_DFA()
+
+	def test_split(self):
+		encoded = self.dfa.to_EncodedDFA()
+		self.assertEqual( analyze_compound( self.dic, encoded, "football" ), [ (0, 4, 1), (4, 8, 2) ] )
+		self.assertEqual( analyze_compound( self.dic, self.dfa, "football" ), [ (0, 4, 1), (4, 8, 2) ] )
+		self.assertEqual( analyze_compound( self.dic, self.dfa, "foofootball" ), [ (0, 3, 1), (3, 7, 1), (7, 11, 2) ] )
+
+	def test_reject(self):
+		self.assertIsNone( analyze_compound( self.dic, self.dfa, "" ) )
+		self.assertIsNone( analyze_compound( self.dic, self.dfa, "ball" ) )
+		self.assertIsNone( analyze_compound( self.dic, self.dfa, "ballfoot" ) )
+		self.assertIsNone( analyze_compound( self.dic, self.dfa, "footballs" ) )
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,384 @@
+#! python3
+
+import os
+import io
+import mmap
+import pickle
+import struct
+import tempfile
+import zlib
+import lzma
+import dictionary as dic
+
+# Один файл со всеми артефактами языка: словарь (DAWG), таблица тэгов, автомат композитов.
+#
+#	заголовок:  "WFPACK", версия (2 байта), число секций (4 байта)
+#	оглавление: по записи на секцию (SectionEntry)
+#	секции:     каждая с границы Alignment, так что ее можно отобразить через mmap отдельно
+#
+# Для каждой секции хранится CRC32 несжатых данных. Сжатые секции (zlib/lzma, для холодного
+# хранения) один раз распаковываются в файл-кэш - несжатый контейнер рядом с исходным.
+# Файлы пишутся во временный файл и подменяются через os.replace: читатель видит
+# либо старый контейнер, либо новый целиком.
+
+Magic = b"WFPACK"
+Version = 0
+# magic, версия, число секций
+Header = struct.Struct( "<6sHI" )
+# имя, сжатие, смещение, размер в файле, размер несжатых данных, CRC32 несжатых данных
+SectionEntry = struct.Struct( "<16sB7xQQQI4x" )
+
+Alignment = mmap.ALLOCATIONGRANULARITY
+
+# стандартные секции
+DawgSection = "dawg"
+TagsSection = "tags"
+DfaSection = "dfa"
+
+# код сжатия -> (название, упаковка, распаковка)
+Compressions = {
+	0: ("none", None, None),
+	1: ("zlib", lambda data: zlib.compress( data, 9 ), zlib.decompress),
+	2: ("lzma", lzma.compress, lzma.decompress),
+}
+CompressionCodes = { name: code for code, (name, _pack, _unpack) in Compressions.items() }
+
+
+class ContainerError(ValueError):
+	pass
+
+
+def _align( offset, alignment ):
+	return (offset + alignment - 1) // alignment * alignment
+
+
+def _write_atomic( path, write ):
+	directory = os.path.dirname( os.path.abspath( path ) )
+	fd, temp_path = tempfile.mkstemp( dir = directory, prefix = os.path.basename( path ) + "." )
+	try:
+		# mkstemp создает файл с правами 0600, как обычный open - по umask
+		umask = os.umask( 0 )
+		os.umask( umask )
+		os.chmod( temp_path, 0o666 & ~umask )
+		with os.fdopen( fd, "wb" ) as out:
+			write( out )
+			out.flush()
+			os.fsync( out.fileno() )
+		os.replace( temp_path, path )
+	except BaseException:
+		os.remove( temp_path )
+		raise
+
+
+# sections - [(имя, bytes)]
+# compression - название сжатия для всех секций или { имя секции : название }
+def write_container( path, sections, compression = "none", alignment = Alignment ):
+	entries = []
+	payloads = []
+	offset = _align( Header.size + SectionEntry.size * len( sections ), alignment )
+	for (name, data) in sections:
+		method = compression.get( name, "none" ) if isinstance( compression, dict ) else compression
+		if method not in CompressionCodes:
+			raise ContainerError( "Unknown compression: " + str( method ) )
+		code = CompressionCodes[method]
+		encoded_name = name.encode( "ascii" )
+		if len( encoded_name ) > 16:
+			raise ContainerError( "Section name is too long: " + name )
+		pack = Compressions[code][1]
+		stored = pack( data ) if pack is not None else data
+		entries.append( SectionEntry.pack( encoded_name, code, offset, len( stored ), len( data ), zlib.crc32( data ) ) )
+		payloads.append( (offset, stored) )
+		offset = _align( offset + len( stored ), alignment )
+
+	def write( out ):
+		out.write( Header.pack( Magic, Version, len( sections ) ) )
+		for entry in entries:
+			out.write( entry )
+		for (section_offset, stored) in payloads:
+			out.write( b"\0" * (section_offset - out.tell()) )
+			out.write( stored )
+
+	_write_atomic( path, write )
+
+
+# словарь, таблица тэгов (список тэгов по номерам) и автомат в один контейнер
+def pack_artifacts( path, dawg_bytes, tags = None, dfa = None, compression = "none" ):
+	sections = [ (DawgSection, bytes( dawg_bytes )) ]
+	if tags is not None:
+		sections.append( (TagsSection, "".join( "{}\t{}\n".format( n, t ) for n, t in enumerate( tags ) ).encode( "utf-8" )) )
+	if dfa is not None:
+		sections.append( (DfaSection, pickle.dumps( dfa )) )
+	write_container( path, sections, compression )
+
+
+def is_container( path ):
+	with open( path, "rb" ) as f:
+		return f.read( len( Magic ) ) == Magic
+
+
+def read_directory( data ):
+	magic, version, count = Header.unpack_from( data, 0 )
+	if magic != Magic:
+		raise ContainerError( "Not a container: " + str( magic ) )
+	if version != Version:
+		raise ContainerError( "Unsupported container version: " + str( version ) )
+	directory = {}
+	for i in range( count ):
+		name, code, offset, size, raw_size, crc = SectionEntry.unpack_from( data, Header.size + SectionEntry.size*i )
+		if code not in Compressions:
+			raise ContainerError( "Unknown compression code: " + str( code ) )
+		directory[name.rstrip( b"\0" ).decode( "ascii" )] = (code, offset, size, raw_size, crc)
+	return directory
+
+
+# оглавление из начала бинарного потока (без чтения секций)
+def read_directory_stream( stream ):
+	head = stream.read( Header.size )
+	if len( head ) < Header.size:
+		raise ContainerError( "Not a container: file is too short" )
+	_magic, _version, count = Header.unpack_from( head, 0 )
+	return read_directory( head + stream.read( SectionEntry.size * count ) )
+
+
+class Container:
+
+	def __init__(self, data, file = None):
+		self.data = data
+		self.file = file
+		self.view = memoryview( data )
+		self.directory = read_directory( self.view )
+		for name, (code, offset, size, _raw_size, _crc) in self.directory.items():
+			if offset + size > len( data ):
+				raise ContainerError( "Section " + name + " is truncated" )
+		self.sections = {}
+
+
+	# verify - проверить CRC32 всех секций при открытии.
+	# Сжатый контейнер распаковывается в cache_path (по умолчанию <path>.cache),
+	# если кэша еще нет, он от другого контейнера или поврежден
+	@staticmethod
+	def open(path, verify = True, cache_path = None):
+		container = Container._open_mmap( path )
+		if not container.is_compressed():
+			if verify:
+				container._verify_or_close()
+			return container
+
+		if cache_path is None:
+			cache_path = path + ".cache"
+		try:
+			cached = Container._open_cache( cache_path, container, verify )
+			if cached is not None:
+				return cached
+			# verify не нужен: CRC проверяется для каждой распакованной секции
+			sections = [ (name, container.section( name )) for name in container.names() ]
+			write_container( cache_path, sections )
+		finally:
+			container.close()
+		return Container._open_mmap( cache_path )
+
+
+	# кэш распакованного контейнера или None, если его нет, он устарел или поврежден
+	@staticmethod
+	def _open_cache(cache_path, container, verify):
+		if not os.path.exists( cache_path ):
+			return None
+		try:
+			cached = Container._open_mmap( cache_path )
+		except (ValueError, struct.error):
+			# обрезанный файл (в т.ч. пустой - его нельзя отобразить через mmap)
+			return None
+		if not cached.same_content( container ):
+			cached.close()
+			return None
+		if verify:
+			try:
+				cached._verify_or_close()
+			except ContainerError:
+				return None
+		return cached
+
+
+	@staticmethod
+	def _open_mmap(path):
+		file = open( path, "rb" )
+		try:
+			data = mmap.mmap( file.fileno(), 0, access=mmap.ACCESS_READ )
+			return Container( data, file )
+		except BaseException:
+			file.close()
+			raise
+
+
+	def close(self):
+		# mmap нельзя закрыть, пока на него есть memoryview
+		for section in self.sections.values():
+			if isinstance( section, memoryview ):
+				section.release()
+		self.sections = {}
+		if self.view is not None:
+			self.view.release()
+			self.view = None
+		if self.file is not None:
+			self.data.close()
+			self.file.close()
+			self.file = None
+		self.data = None
+
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+
+	def names(self):
+		return list( self.directory.keys() )
+
+
+	def __contains__(self, name):
+		return name in self.directory
+
+
+	def is_compressed(self):
+		return any( entry[0] != 0 for entry in self.directory.values() )
+
+
+	# те же секции с теми же данными (по размерам и CRC)
+	def same_content(self, other):
+		def content( container ):
+			return { name: (raw_size, crc) for name, (_code, _offset, _size, raw_size, crc) in container.directory.items() }
+		return content( self ) == content( other )
+
+
+	# данные секции: memoryview поверх mmap для несжатых секций, bytes - для сжатых
+	def section(self, name):
+		if name not in self.directory:
+			raise KeyError( "No section " + name )
+		section = self.sections.get( name, None )
+		if section is None:
+			code, offset, size, raw_size, crc = self.directory[name]
+			section = self.view[offset : offset + size]
+			unpack = Compressions[code][2]
+			if unpack is not None:
+				section = unpack( section )
+				if len( section ) != raw_size or zlib.crc32( section ) != crc:
+					raise ContainerError( "Section " + name + " is corrupted" )
+			self.sections[name] = section
+		return section
+
+
+	def verify(self):
+		for name, (_code, _offset, _size, raw_size, crc) in self.directory.items():
+			section = self.section( name )
+			if len( section ) != raw_size or zlib.crc32( section ) != crc:
+				raise ContainerError( "Section " + name + " is corrupted" )
+
+
+	def _verify_or_close(self):
+		try:
+			self.verify()
+		except BaseException:
+			self.close()
+			raise
+
+
+	# словарь читается прямо из секции, без копирования
+	def reader(self):
+		return dic.DicReader( self.section( DawgSection ) )
+
+
+	# список тэгов по номерам или None
+	def tags(self):
+		if TagsSection not in self.directory:
+			return None
+		tags = []
+		for line in io.StringIO( bytes( self.section( TagsSection ) ).decode( "utf-8" ) ):
+			number, tag = line.rstrip( "\n" ).split( "\t", 1 )
+			if int( number ) != len( tags ):
+				raise ContainerError( "Broken tag table at tag " + number )
+			tags.append( tag )
+		return tags
+
+
+	def dfa(self):
+		if DfaSection not in self.directory:
+			return None
+		return pickle.loads( self.section( DfaSection ) )
+
+
+####################################################################################################
+
+import unittest
+import fsm
+
+class TestContainer(unittest.TestCase):
+	def setUp(self):
+		builder = dic.DicDawgBuilder()
+		for (word, attr) in [ ("ball", 2), ("foot", 1), ("football", 1) ]:
+			builder.add_word( word, attr )
+		self.dawg_bytes = builder.build().serialize()
+		nfa = fsm.NFA()
+		nfa.add_trans( fsm.START, 1, "Q" )
+		nfa.add_trans( "Q", 2, "F" )
+		nfa.set_final( "F" )
+		self.dfa = nfa.to_DFA()
+		self.dir = tempfile.TemporaryDirectory()
+		self.path = os.path.join( self.dir.name, "xx.wfpack" )
+
+	def tearDown(self):
+		self.dir.cleanup()
+
+	def check(self, container):
+		reader = container.reader()
+		self.assertEqual( reader.get_attr( "foot" ), 1 )
+		self.assertEqual( list( reader.iter_words() ), [ ("ball", 2), ("foot", 1), ("football", 1) ] )
+		self.assertEqual( container.tags(), [ "<>", "<1>", "<2>" ] )
+		self.assertTrue( container.dfa().check( [1, 2] ) )
+
+	def test_roundtrip(self):
+		pack_artifacts( self.path, self.dawg_bytes, [ "<>", "<1>", "<2>" ], self.dfa )
+		with Container.open( self.path ) as container:
+			self.assertEqual( container.names(), [ DawgSection, TagsSection, DfaSection ] )
+			for (_code, offset, _size, _raw, _crc) in container.directory.values():
+				self.assertEqual( offset % Alignment, 0 )
+			self.check( container )
+
+	def test_compressed_cache(self):
+		pack_artifacts( self.path, self.dawg_bytes, [ "<>", "<1>", "<2>" ], self.dfa, { DawgSection: "lzma", DfaSection: "zlib" } )
+		with Container.open( self.path ) as container:
+			self.assertFalse( container.is_compressed() )
+			self.check( container )
+		cache_time = os.stat( self.path + ".cache" ).st_mtime_ns
+		# второй раз кэш используется повторно
+		with Container.open( self.path ) as container:
+			self.check( container )
+		self.assertEqual( os.stat( self.path + ".cache" ).st_mtime_ns, cache_time )
+
+	def test_corruption(self):
+		pack_artifacts( self.path, self.dawg_bytes )
+		with open( self.path, "r+b" ) as f:
+			f.seek( Alignment + len( self.dawg_bytes ) - 1 )
+			f.write( b"\xff" )
+		with self.assertRaises( ContainerError ):
+			Container.open( self.path )
+		with Container.open( self.path, verify = False ) as container:
+			self.assertEqual( container.names(), [ DawgSection ] )
+
+	def test_corrupted_cache(self):
+		pack_artifacts( self.path, self.dawg_bytes, [ "<>", "<1>", "<2>" ], self.dfa, { DawgSection: "zlib" } )
+		Container.open( self.path ).close()
+		cache_path = self.path + ".cache"
+		size = os.path.getsize( cache_path )
+		# испорченный байт, обрезанный и пустой кэш распаковываются заново
+		for damage in [ lambda f: (f.seek( Alignment ), f.write( b"\xff" )), lambda f: f.truncate( size // 2 ), lambda f: f.truncate( 0 ) ]:
+			with open( cache_path, "r+b" ) as f:
+				damage( f )
+			with Container.open( self.path ) as container:
+				self.check( container )
+			self.assertEqual( os.path.getsize( cache_path ), size )
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -1,531 +1,1477 @@
-﻿#! python3
-
-import bisect
-
-def add_to_hash( hash, to_add ):
-	return (( hash * 0x01000193 ) ^ to_add ) & 0xffffffff
-
-
-####################################################################################################
-
-class DicNode:
-
-	NotLeaf = -1
-	EmptyLeaf = 0
-
-	def __init__(self):
-		self.keys = []
-		self.children = []
-		self.data = None
-		self.hash = None
-
-
-	def next(self, letter):
-		i = bisect.bisect_left(self.keys, letter)
-		if i < len(self.keys) and self.keys[i] == letter:
-			return self.children[i]
-		return None
-
-
-	def add(self, letter):
-		i = bisect.bisect_left(self.keys, letter)
-		if i >= len(self.keys) or self.keys[i] != letter:
-			self.keys.insert(i, letter) 
-			self.children.insert(i, DicNode())
-		return self.children[i]
-
-
-	def replace(self, letter, child):
-		i = bisect.bisect_left(self.keys, letter)
-		if i >= len(self.keys) or self.keys[i] != letter:
-			raise Exception( "Error: child not found: " + letter + " in " + str( self.keys ) )
-		self.children[i] = child
-		self.hash = self._do_calc_hash()
-
-
-	def set_leaf(self, attr):
-		if attr is not None:
-			self.data = attr
-		else:
-			self.data = DicNode.EmptyLeaf
-
-
-	def is_leaf(self):
-		return self.data is not None
-
-
-	def __eq__(self, other):
-		return self.data == other.data and \
-			self.keys == other.keys and \
-			self.children == other.children
-
-
-	def __hash__(self):
-		if self.hash is None:
-			self.hash = self._do_calc_hash()
-		return self.hash
-
-	def _do_calc_hash(self):
-		h = 0x01000193
-		l = len( self.keys )
-		h = add_to_hash( h, l )
-		h = add_to_hash( h, self.data if self.data is not None else DicNode.NotLeaf )
-		
-		while l > 0:
-			l -= 1
-			h = add_to_hash( h, ord( self.keys[l] ) )
-			h = add_to_hash( h, hash( self.children[l] ) )
-		return h
-
-
-####################################################################################################
-
-class DicSerializer:
-
-	MagicTree = b'WFTREE'
-	MagicDawg = b'WFDAWG'
-	HeaderSize = len( MagicTree ) + 2
-
-	def __init__(self, v = 1):
-		self.init_version( v )
-		self.data = bytearray()
-
-
-	def init_version(self, v):
-		self.version = v
-		if v == 0:
-			self.child_count_bytes = 4
-			self.attr_bytes = 4
-			self.letter_bytes = 4
-			self.offset_bytes = 4
-		elif v == 1:
-			self.child_count_bytes = 1
-			self.attr_bytes = 1
-			self.letter_bytes = 2
-			self.offset_bytes = 4
-		else:
-			raise ValueError( "Unknown DicSerializer version: " + v )
-
-		self.before_table_bytes = self.child_count_bytes + self.attr_bytes
-		self.cell_size_bytes = self.letter_bytes + self.offset_bytes
-
-
-	def serialize_dawg(self, dic_dawg):
-		# magic
-		self.data = bytearray( DicSerializer.MagicDawg )
-		# version
-		self.data.extend( self.version.to_bytes( 2, byteorder='little'))
-		# tree
-		self.serialize_node( dic_dawg.root )
-		return self.data
-
-
-	def serialize_tree(self, dic_tree):
-		# magic
-		self.data = bytearray( DicSerializer.MagicTree )
-		# version
-		self.data.extend( self.version.to_bytes( 2, byteorder='little'))
-		# tree
-		self.serialize_node( dic_tree.root )
-		return self.data
-
-
-	def deserialize(self, data):
-		self.data = data
-		self.dawg_deserialization_cache = dict()
-		magic = data[0:len(DicSerializer.MagicTree)]
-		if magic == DicSerializer.MagicTree:
-			root = self.deserialize_node(DicSerializer.HeaderSize, False)
-			return DicTree( root )
-		elif magic == DicSerializer.MagicDawg:
-			root = self.deserialize_node(DicSerializer.HeaderSize, True)
-			return DicDawg( root )
-		else:
-			raise ValueError( "Unknown magic: " + str( magic ) )
-
-
-	def serialize_node(self, node):
-		# поддержка DAWG
-		if hasattr( node, "_serialization_offset" ):
-			return node._serialization_offset
-
-		# сохраняем текущее смещение - начало записи об этом узле
-		offset = len(self.data)
-		
-		# количество детей (child_count_bytes байтов)
-		self.write_int( offset, len(node.keys), self.child_count_bytes )
-
-		# данные в этом узле (attr_bytes байтов)
-		node_data = DicNode.NotLeaf if (node.data is None) else node.data
-		self.write_int( offset + self.child_count_bytes, node_data, self.attr_bytes )
-
-		# таблица детей
-		# по 4 байта на ключ и смещение (количество смещений равно количеству ключей)
-		# временно нули. Потом впишем в эту таблицу
-		self.data.extend( len( node.keys ) * self.cell_size_bytes * b'\x00' )
-
-		table_offset = offset + self.before_table_bytes
-		for i in range( len(node.keys) ):
-			child_offset = self.serialize_node( node.children[i] )
-			cell_offset = table_offset + self.cell_size_bytes*i
-			self.write_key( cell_offset, node.keys[i])
-			self.write_int( cell_offset + self.letter_bytes, child_offset, self.offset_bytes )
-
-		node._serialization_offset = offset
-		return offset
-
-
-	def deserialize_node(self, offset, is_dawg):
-		if is_dawg:
-			# имеет смысл поискать в кэше
-			node = self.dawg_deserialization_cache.get( offset, None )
-			if node is not None:
-				return node
-		
-		node = DicNode()
-		children_count = self.read_int( offset, self.child_count_bytes )
-		node_data = self.read_int( offset + self.child_count_bytes, self.attr_bytes )
-		node.data = node_data if node_data != DicNode.NotLeaf else None
-
-		table_offset = offset + self.before_table_bytes
-		for i in range( children_count ):
-			cell_offset = table_offset + self.cell_size_bytes*i
-			node.keys.append( self.read_key( cell_offset ) )
-			
-			child_offset = self.read_int( cell_offset + self.letter_bytes, self.offset_bytes )
-			child = self.deserialize_node( child_offset, is_dawg )
-			node.children.append( child )
-		
-		if is_dawg:
-			self.dawg_deserialization_cache[offset] = node
-
-		return node
-
-
-	def write_int(self, where, what, size):
-		self.data[where : where + size] = what.to_bytes( size, byteorder='little', signed=True )
-
-	def read_int(self, where, size):
-		return int.from_bytes( self.data[where : where + size], byteorder='little', signed=True )
-
-	def write_key( self, offset, letter ):
-		try:
-			self.write_int(offset, ord(letter), self.letter_bytes)
-		except OverflowError as e:
-			print( "Can't save letter", ord( letter ) )
-			raise e
-
-	def read_key( self, offset ):
-		return chr( self.read_int( offset, self.letter_bytes ) )
-
-
-####################################################################################################
-
-
-class DicTree:
-
-	def __init__(self, root = None):
-		self.root = root if (root is not None) else DicNode()
-
-
-	def add_word(self, word, attr = DicNode.EmptyLeaf):
-		assert word is not None and word != ""
-		curr_node = self.root
-		for letter in word:
-			curr_node = curr_node.add(letter)
-		curr_node.set_leaf(attr)
-
-
-	def check_word(self, word):
-		curr_node = self.root
-
-		for letter in word:
-			curr_node = curr_node.next(letter)
-			if curr_node is None:
-				return False
-
-		return curr_node.is_leaf()
-
-	def serialize(self):
-		s = DicSerializer()
-		return s.serialize_tree( self )
-
-
-	def deserialize(self, data):
-		s = DicSerializer()
-		tree = s.deserialize( data )
-		self.root = tree.root
-
-####################################################################################################
-
-class DicDawg:
-
-	def __init__(self, root = None):
-		self.root = root if (root is not None) else DicNode()
-
-	def check_word(self, word):
-		curr_node = self.root
-
-		for letter in word:
-			curr_node = curr_node.next(letter)
-			if curr_node is None:
-				return False
-
-		return curr_node.is_leaf()
-
-
-	def serialize(self):
-		s = DicSerializer()
-		return s.serialize_dawg( self )
-
-
-	def deserialize(self, data):
-		s = DicSerializer()
-		dawg = s.deserialize(data)
-		self.root = dawg.root
-
-
-####################################################################################################
-
-def common_prefix_length( s1, s2 ):
-	i = 0
-	l = min( len(s1), len(s2) )
-	while (i < l) and (s1[i] == s2[i]):
-		i += 1
-	return i
-
-debug = False
-
-class DicDawgBuilder:
-
-	def __init__(self):
-		self.root = DicNode()
-		self.previous_word = ""
-		
-		# список последних непроверенных узлов. Всегда в порядке возрастания глубины узла
-		self.unchecked = []
-		# узлы, которые точно нужны в DAWG. 
-		self.minimized_nodes = {}
-
-	def add_word(self, word, attr = DicNode.EmptyLeaf ):
-		if word < self.previous_word:
-			raise Exception( "Error: Words must be inserted in alphabetical order: ", word, self.previous_word )
-		self._do_add_word( word, attr )
-
-
-	def _do_add_word(self, word, attr):
-		common_prefix = common_prefix_length( word, self.previous_word )
-		self._minimize( common_prefix )
-
-		# [2] - это индекс в кортеже (parent, letter, node)
-		node = self.unchecked[-1][2] if len(self.unchecked) > 0 else self.root
-
-		# собственно, добавляем новые узлы
-		for letter in word[common_prefix:]:
-			next_node = node.add( letter )
-			self.unchecked.append( (node, letter, next_node) )
-			node = next_node
-
-		node.set_leaf( attr )
-		self.previous_word = word
-
-
-	def _minimize(self, depth):
-		for i in range( len(self.unchecked) - 1, depth - 1, -1 ):
-			(parent, letter, child) = self.unchecked[i]
-			
-			if child in self.minimized_nodes:
-				parent.replace( letter, self.minimized_nodes[child] )
-			else:
-				self.minimized_nodes[child] = child
-			self.unchecked.pop()
-
-
-	def build(self):
-		self._minimize( 0 )
-		return DicDawg( self.root )
-
-
-####################################################################################################
-
-import unittest
-
-class TestEmptyDictionary(unittest.TestCase):
-	def setUp(self):
-		self.dictionary = DicTree()
-
-	def test_empty_dictionary(self):
-		self.assertFalse(self.dictionary.check_word(""))
-		self.assertFalse(self.dictionary.check_word("any word"))
-		self.assertFalse(self.dictionary.check_word("a"))
-		self.assertFalse(self.dictionary.check_word(" "))
-
-
-###
-
-
-class TestDictionary(unittest.TestCase):
-
-	def test_one_word(self):
-		dic = DicTree()
-		self.assertFalse(dic.check_word("hello"))
-		dic.add_word("hello")
-		self.assertTrue(dic.check_word("hello"))
-
-	def test_multi_word(self):
-		dic = DicTree()
-		dic.add_word("any")
-		dic.add_word("anyone")
-		dic.add_word("anywhere")
-		dic.add_word("someone")
-		dic.add_word("somewhere")
-		self.assertTrue(dic.check_word("anyone"))
-		self.assertTrue(dic.check_word("anywhere"))
-		self.assertTrue(dic.check_word("any"))
-		self.assertTrue(dic.check_word("someone"))
-		self.assertTrue(dic.check_word("somewhere"))
-		self.assertFalse(dic.check_word("some"))
-		self.assertFalse(dic.check_word("a"))
-		self.assertFalse(dic.check_word("an"))
-		self.assertFalse(dic.check_word("anyo"))
-		self.assertFalse(dic.check_word("anyon"))
-
-
-###
-
-
-class TestDictionarySerialization(unittest.TestCase):
-
-	def test_empty(self):
-		dic = DicTree()
-		s = DicSerializer(v=0)
-		data = s.serialize_tree(dic)
-		# print( data )
-		self.assertEqual( len(data), DicSerializer.HeaderSize + 4 + 4 )
-		self.assertEqual( data, b'WFTREE\x00\x00\x00\x00\x00\x00\xff\xff\xff\xff' )
-
-
-	def test_one_letter(self):
-		dic = DicTree()
-		dic.add_word("a")
-		s = DicSerializer(v=0)
-		data = s.serialize_tree(dic)
-		# print( data )
-		self.assertEqual( len( data ), DicSerializer.HeaderSize + (4 + 4 + 1*(4 + 4)) + (4 + 4) )
-		self.assertEqual( data,
-			b'WFTREE\x00\x00\x01\x00\x00\x00\xff\xff\xff\xff\x61\x00\x00\x00\x18\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00' )
-		# 01000000 ffffffff 61000000 08000000 00000000 00000000
-		# ^^^^^^^^ - количество детей root
-		#           ^^^^^^^^ - атрибуты root (NotLeaf)
-		#                   ^^^^^^^^ - ключ ребенка
-		#                            ^^^^^^^^ - смещение ребенка
-		#                                     ^^^^^^^^ - у ребенка нет детей
-		#                                              ^^^^^^^^ - аттрибуты ребенка (EmptyLeaf)
-
-
-	def test_one_word(self):
-		dic = DicTree()
-		dic.add_word( "hello" )
-		s = DicSerializer(v=0)
-		data = s.serialize_tree(dic)
-		# 5 букв. Каждая по:
-		# 2 байта - количество детей
-		# 2 байта - данные в листе
-		# 2 байта - закодирована буква ребенка
-		# 2 байта - смещение ребенка
-		# корень совпадает с буквой
-		# листовой узел не имеет детей. (ровно 4 байта)
-		self.assertEqual( len(data), DicSerializer.HeaderSize + 5*(4+4+4+4) + (4+4) )
-
-	def test_one_word_reload(self):
-		dic = DicTree()
-		dic.add_word( "anyone" )
-		data = dic.serialize()
-		dic2 = DicTree()
-		dic2.deserialize( data )
-		self.assertTrue( dic2.check_word( "anyone" ) )
-		self.assertFalse( dic2.check_word( "any" ) )
-
-
-###
-
-
-class TestDawg(unittest.TestCase):
-	def setUp(self):
-		builder = DicDawgBuilder()
-		builder.add_word( "any" )
-		builder.add_word( "anyone" )
-		builder.add_word( "anywhere" )
-		builder.add_word( "someone" )
-		builder.add_word( "somewhere" )
-		self.builder = builder
-
-	def test_empty(self):
-		dic = DicDawg()
-		s = DicSerializer(v=0)
-		data = s.serialize_dawg(dic)
-		# print( data )
-		self.assertEqual( len(data), DicSerializer.HeaderSize + 4 + 4 )
-		self.assertEqual( data, b'WFDAWG\x00\x00\x00\x00\x00\x00\xff\xff\xff\xff' )
-
-	def test_one_final(self):
-		global debug
-		debug = True
-		tree = DicTree()
-		tree.add_word( "a" )
-		tree.add_word( "b" )
-		tree_data = tree.serialize()
-		
-		builder = DicDawgBuilder()
-		builder.add_word( "a" )
-		builder.add_word( "b" )
-		dawg = builder.build()
-		dawg_data = dawg.serialize()
-
-		self.assertLess( len( dawg_data ), len( tree_data ) )
-		debug = False
-
-	def test_words(self):
-		dawg = self.builder.build()
-		
-		self.assertTrue( dawg.check_word("anyone") )
-		self.assertTrue( dawg.check_word("anywhere") )
-		self.assertTrue( dawg.check_word("any") )
-		self.assertTrue( dawg.check_word("someone") )
-		self.assertTrue( dawg.check_word("somewhere") )
-		self.assertFalse( dawg.check_word("some") )
-		self.assertFalse( dawg.check_word("a") )
-		self.assertFalse( dawg.check_word("an") )
-		self.assertFalse( dawg.check_word("anyo") )
-		self.assertFalse( dawg.check_word("anyon") )
-
-
-	def test_reload(self):
-		dawg = self.builder.build()
-		dawg_data = dawg.serialize()
-		dawg2 = DicDawg()
-		dawg2.deserialize( dawg_data )
-
-		self.assertTrue( dawg2.check_word("anyone") )
-		self.assertTrue( dawg2.check_word("anywhere") )
-		self.assertTrue( dawg2.check_word("any") )
-		self.assertTrue( dawg2.check_word("someone") )
-		self.assertTrue( dawg2.check_word("somewhere") )
-		self.assertFalse( dawg2.check_word("some") )
-		self.assertFalse( dawg2.check_word("a") )
-		self.assertFalse( dawg2.check_word("an") )
-		self.assertFalse( dawg2.check_word("anyo") )
-		self.assertFalse( dawg2.check_word("anyon") )
-
-
-class TestCommonPrefix(unittest.TestCase):
-	def test_all(self):
-		self.assertEqual( common_prefix_length("","abc"), 0)
-		self.assertEqual( common_prefix_length("a","abc"), 1)
-		self.assertEqual( common_prefix_length("bac","abc"), 0)
-		self.assertEqual( common_prefix_length("abc","abc"), 3)
-		self.assertEqual( common_prefix_length("abcdef","abc"), 3)
-
-
-if __name__ == "__main__":
-	unittest.main()
+﻿#! python3
+
+import bisect
+import collections
+import json
+import mmap
+import folding as fold
+
+def add_to_hash( hash, to_add ):
+	return (( hash * 0x01000193 ) ^ to_add ) & 0xffffffff
+
+
+####################################################################################################
+
+class DicNode:
+
+	NotLeaf = -1
+	EmptyLeaf = 0
+
+	def __init__(self):
+		self.keys = []
+		self.children = []
+		self.data = None
+		self.hash = None
+
+
+	def next(self, letter):
+		i = bisect.bisect_left(self.keys, letter)
+		if i < len(self.keys) and self.keys[i] == letter:
+			return self.children[i]
+		return None
+
+
+	def add(self, letter):
+		i = bisect.bisect_left(self.keys, letter)
+		if i >= len(self.keys) or self.keys[i] != letter:
+			self.keys.insert(i, letter) 
+			self.children.insert(i, DicNode())
+		return self.children[i]
+
+
+	def replace(self, letter, child):
+		i = bisect.bisect_left(self.keys, letter)
+		if i >= len(self.keys) or self.keys[i] != letter:
+			raise Exception( "Error: child not found: " + letter + " in " + str( self.keys ) )
+		self.children[i] = child
+		self.hash = self._do_calc_hash()
+
+
+	def remove(self, letter):
+		i = bisect.bisect_left(self.keys, letter)
+		if i >= len(self.keys) or self.keys[i] != letter:
+			raise Exception( "Error: child not found: " + letter + " in " + str( self.keys ) )
+		del self.keys[i]
+		del self.children[i]
+		self.hash = None
+
+
+	# поверхностная копия: дети остаются общими
+	def clone(self):
+		node = DicNode()
+		node.keys = list( self.keys )
+		node.children = list( self.children )
+		node.data = self.data
+		return node
+
+
+	def set_leaf(self, attr):
+		if attr is not None:
+			self.data = attr
+		else:
+			self.data = DicNode.EmptyLeaf
+
+
+	def is_leaf(self):
+		return self.data is not None
+
+
+	def __eq__(self, other):
+		return self.data == other.data and \
+			self.keys == other.keys and \
+			self.children == other.children
+
+
+	def __hash__(self):
+		if self.hash is None:
+			self.hash = self._do_calc_hash()
+		return self.hash
+
+	def _do_calc_hash(self):
+		h = 0x01000193
+		l = len( self.keys )
+		h = add_to_hash( h, l )
+		h = add_to_hash( h, self.data if self.data is not None else DicNode.NotLeaf )
+		
+		while l > 0:
+			l -= 1
+			h = add_to_hash( h, ord( self.keys[l] ) )
+			h = add_to_hash( h, hash( self.children[l] ) )
+		return h
+
+
+# Узел, который читает свою таблицу детей из сериализованных данных при первом обращении
+# к keys/children/next. Дети, полученные через next(), берутся из кэша сериализатора
+# и могут быть вытеснены; обращение к children (в т.ч. при изменении узла) закрепляет их
+class LazyDicNode(DicNode):
+
+	def __init__(self, serializer, offset):
+		self.serializer = serializer
+		self.offset = offset
+		node_data = serializer.read_int( offset + serializer.child_count_bytes, serializer.attr_bytes )
+		self.data = node_data if node_data != DicNode.NotLeaf else None
+		self.hash = None
+		self._keys = None
+		self._child_offsets = None
+		self._children = None
+		# узел изменен на месте (DicTree.add_word) и уже не совпадает с записью по offset
+		self.modified = False
+
+
+	def _decode(self):
+		s = self.serializer
+		keys = []
+		child_offsets = []
+		table_offset = self.offset + s.before_table_bytes
+		for i in range( s.read_int( self.offset, s.child_count_bytes ) ):
+			cell_offset = table_offset + s.cell_size_bytes*i
+			keys.append( s.read_key( cell_offset ) )
+			child_offsets.append( s.read_int( cell_offset + s.letter_bytes, s.offset_bytes ) )
+		self._keys = keys
+		self._child_offsets = child_offsets
+
+
+	@property
+	def keys(self):
+		if self._keys is None:
+			self._decode()
+		return self._keys
+
+	@keys.setter
+	def keys(self, keys):
+		self._keys = keys
+		self.modified = True
+
+
+	@property
+	def children(self):
+		if self._children is None:
+			if self._child_offsets is None:
+				self._decode()
+			self._children = [self.serializer.lazy_node( o ) for o in self._child_offsets]
+		return self._children
+
+	@children.setter
+	def children(self, children):
+		self._children = children
+		self.modified = True
+
+
+	def add(self, letter):
+		self.modified = True
+		return DicNode.add( self, letter )
+
+	def replace(self, letter, child):
+		self.modified = True
+		DicNode.replace( self, letter, child )
+
+	def remove(self, letter):
+		self.modified = True
+		DicNode.remove( self, letter )
+
+	def set_leaf(self, attr):
+		self.modified = True
+		DicNode.set_leaf( self, attr )
+
+
+	def next(self, letter):
+		keys = self.keys
+		i = bisect.bisect_left(keys, letter)
+		if i < len(keys) and keys[i] == letter:
+			if self._children is not None:
+				return self._children[i]
+			return self.serializer.lazy_node( self._child_offsets[i] )
+		return None
+
+
+####################################################################################################
+
+# Кэш десериализованных узлов по смещению. max_size = None - без ограничения,
+# иначе вытесняются давно не использованные узлы (LRU)
+class NodeCache:
+
+	def __init__(self, max_size = None):
+		self.max_size = max_size
+		self.nodes = collections.OrderedDict()
+
+	def get(self, offset):
+		node = self.nodes.get( offset, None )
+		if node is not None and self.max_size is not None:
+			self.nodes.move_to_end( offset )
+		return node
+
+	def put(self, offset, node):
+		self.nodes[offset] = node
+		if self.max_size is not None and len( self.nodes ) > self.max_size:
+			self.nodes.popitem( last=False )
+
+	def __len__(self):
+		return len( self.nodes )
+
+
+####################################################################################################
+
+class DicSerializer:
+
+	MagicTree = b'WFTREE'
+	MagicDawg = b'WFDAWG'
+	HeaderSize = len( MagicTree ) + 2
+	# с версии 2 за версией идет расширение заголовка: длина (4 байта) и JSON в UTF-8
+	# (раскладка узлов, свертка, статистика графа)
+	ExtensionLengthBytes = 4
+	DefaultVersion = 2
+
+	# layout - размеры полей узла для версии 2: как в версии 0 или 1
+	def __init__(self, v = DefaultVersion, layout = None):
+		self.init_version( v, layout )
+		self.data = bytearray()
+		# смещения уже записанных узлов { ключ узла : offset } (поддержка DAWG), см. serialization_key
+		self.offsets = {}
+		# расширение заголовка последнего записанного или прочитанного словаря
+		self.extension = {}
+
+
+	def init_version(self, v, layout = None):
+		self.version = v
+		if v == 2:
+			self.layout = layout if layout is not None else 1
+		elif v == 0 or v == 1:
+			self.layout = v
+		else:
+			raise ValueError( "Unknown DicSerializer version: " + str( v ) )
+
+		if self.layout == 0:
+			self.child_count_bytes = 4
+			self.attr_bytes = 4
+			self.letter_bytes = 4
+			self.offset_bytes = 4
+		elif self.layout == 1:
+			self.child_count_bytes = 1
+			self.attr_bytes = 1
+			self.letter_bytes = 2
+			self.offset_bytes = 4
+		else:
+			raise ValueError( "Unknown DicSerializer layout: " + str( self.layout ) )
+
+		self.before_table_bytes = self.child_count_bytes + self.attr_bytes
+		self.cell_size_bytes = self.letter_bytes + self.offset_bytes
+
+
+	def serialize_dawg(self, dic_dawg):
+		return self.serialize_dictionary( DicSerializer.MagicDawg, dic_dawg )
+
+
+	def serialize_tree(self, dic_tree):
+		return self.serialize_dictionary( DicSerializer.MagicTree, dic_tree )
+
+
+	def serialize_dictionary(self, magic, dictionary):
+		# magic
+		self.data = bytearray( magic )
+		self.offsets = {}
+		# version
+		self.data.extend( self.version.to_bytes( 2, byteorder='little'))
+		self.write_extension( dictionary )
+		# tree
+		self.serialize_node( dictionary.root )
+		return self.data
+
+
+	def write_extension(self, dictionary):
+		extension = {}
+		if dictionary.folding is not None:
+			extension["folding"] = dictionary.folding.to_dict()
+		if self.version < 2:
+			if len( extension ) > 0:
+				raise ValueError( "Folding needs DicSerializer version 2" )
+			self.extension = extension
+			return
+		extension["layout"] = self.layout
+		# предварительный проход: заголовок пишется раньше узлов
+		extension["stats"] = dictionary.stats()
+		encoded = json.dumps( extension, ensure_ascii=False, sort_keys=True ).encode( "utf-8" )
+		self.data.extend( len( encoded ).to_bytes( DicSerializer.ExtensionLengthBytes, byteorder='little' ) )
+		self.data.extend( encoded )
+		self.extension = extension
+
+
+	# (magic, версия, расширение заголовка, смещение корня)
+	@staticmethod
+	def read_header(data):
+		magic = bytes( data[0:len(DicSerializer.MagicTree)] )
+		if magic != DicSerializer.MagicTree and magic != DicSerializer.MagicDawg:
+			raise ValueError( "Unknown magic: " + str( magic ) )
+		version = int.from_bytes( data[len(magic):DicSerializer.HeaderSize], byteorder='little' )
+		if version < 2:
+			return magic, version, {}, DicSerializer.HeaderSize
+		start = DicSerializer.HeaderSize + DicSerializer.ExtensionLengthBytes
+		length = int.from_bytes( data[DicSerializer.HeaderSize:start], byteorder='little' )
+		extension = json.loads( bytes( data[start:start + length] ).decode( "utf-8" ) )
+		return magic, version, extension, start + length
+
+
+	# lazy - узлы декодируются при первом обращении (LazyDicNode),
+	# cache_size - сколько узлов держать в кэше в ленивом режиме (None - все)
+	def deserialize(self, data, lazy = False, cache_size = None):
+		magic, version, extension, root_offset = DicSerializer.read_header( data )
+		self.init_version( version, extension.get( "layout", None ) )
+		self.extension = extension
+		self.data = data
+		self.dawg_deserialization_cache = NodeCache( cache_size if lazy else None )
+		is_dawg = magic == DicSerializer.MagicDawg
+		root = self.lazy_node(root_offset) if lazy else self.deserialize_node(root_offset, is_dawg)
+		dictionary = DicDawg( root ) if is_dawg else DicTree( root )
+		dictionary.folding = folding_from_extension( extension )
+		return dictionary
+
+
+	def lazy_node(self, offset):
+		node = self.dawg_deserialization_cache.get( offset )
+		if node is None:
+			node = LazyDicNode( self, offset )
+			self.dawg_deserialization_cache.put( offset, node )
+		return node
+
+
+	# Неизмененный ленивый узел идентифицируется исходным смещением: вытесненный из кэша узел
+	# возвращается новым объектом, и по id общие поддеревья записывались бы повторно
+	# (а id освобожденного узла мог бы достаться другому). Остальные узлы - по id:
+	# они достижимы из корня и живут до конца записи
+	@staticmethod
+	def serialization_key(node):
+		if isinstance( node, LazyDicNode ) and not node.modified:
+			return (node.serializer, node.offset)
+		return id( node )
+
+
+	def serialize_node(self, node):
+		# поддержка DAWG
+		key = DicSerializer.serialization_key( node )
+		offset = self.offsets.get( key, None )
+		if offset is not None:
+			return offset
+
+		# сохраняем текущее смещение - начало записи об этом узле
+		offset = len(self.data)
+		
+		# количество детей (child_count_bytes байтов)
+		self.write_int( offset, len(node.keys), self.child_count_bytes )
+
+		# данные в этом узле (attr_bytes байтов)
+		node_data = DicNode.NotLeaf if (node.data is None) else node.data
+		self.write_int( offset + self.child_count_bytes, node_data, self.attr_bytes )
+
+		# таблица детей
+		# по 4 байта на ключ и смещение (количество смещений равно количеству ключей)
+		# временно нули. Потом впишем в эту таблицу
+		self.data.extend( len( node.keys ) * self.cell_size_bytes * b'\x00' )
+
+		table_offset = offset + self.before_table_bytes
+		for i in range( len(node.keys) ):
+			child_offset = self.serialize_node( node.children[i] )
+			cell_offset = table_offset + self.cell_size_bytes*i
+			self.write_key( cell_offset, node.keys[i])
+			self.write_int( cell_offset + self.letter_bytes, child_offset, self.offset_bytes )
+
+		self.offsets[key] = offset
+		return offset
+
+
+	def deserialize_node(self, offset, is_dawg):
+		if is_dawg:
+			# имеет смысл поискать в кэше
+			node = self.dawg_deserialization_cache.get( offset )
+			if node is not None:
+				return node
+		
+		node = DicNode()
+		children_count = self.read_int( offset, self.child_count_bytes )
+		node_data = self.read_int( offset + self.child_count_bytes, self.attr_bytes )
+		node.data = node_data if node_data != DicNode.NotLeaf else None
+
+		table_offset = offset + self.before_table_bytes
+		for i in range( children_count ):
+			cell_offset = table_offset + self.cell_size_bytes*i
+			node.keys.append( self.read_key( cell_offset ) )
+			
+			child_offset = self.read_int( cell_offset + self.letter_bytes, self.offset_bytes )
+			child = self.deserialize_node( child_offset, is_dawg )
+			node.children.append( child )
+		
+		if is_dawg:
+			self.dawg_deserialization_cache.put( offset, node )
+
+		return node
+
+
+	def write_int(self, where, what, size):
+		self.data[where : where + size] = what.to_bytes( size, byteorder='little', signed=True )
+
+	def read_int(self, where, size):
+		return int.from_bytes( self.data[where : where + size], byteorder='little', signed=True )
+
+	def write_key( self, offset, letter ):
+		try:
+			self.write_int(offset, ord(letter), self.letter_bytes)
+		except OverflowError as e:
+			print( "Can't save letter", ord( letter ) )
+			raise e
+
+	def read_key( self, offset ):
+		return chr( self.read_int( offset, self.letter_bytes ) )
+
+
+def folding_from_extension( extension ):
+	if "folding" not in extension:
+		return None
+	return fold.Folding.from_dict( extension["folding"] )
+
+
+####################################################################################################
+
+# Чтение сериализованного словаря без десериализации (например, поверх mmap).
+# Узел - это смещение его записи в данных
+class DicReader:
+
+	def __init__(self, data):
+		magic, version, extension, root_offset = DicSerializer.read_header( data )
+		self.is_dawg = magic == DicSerializer.MagicDawg
+		self.format = DicSerializer( version, extension.get( "layout", None ) )
+		self.format.data = data
+		self.format.extension = extension
+		self.folding = folding_from_extension( extension )
+		self.data = data
+		self.root = root_offset
+		self.file = None
+		self.mmap = None
+
+
+	# открывает файл словаря через mmap: страницы подгружаются по мере обращения
+	@staticmethod
+	def open(path):
+		file = open( path, "rb" )
+		data = mmap.mmap( file.fileno(), 0, access=mmap.ACCESS_READ )
+		reader = DicReader( data )
+		reader.file = file
+		reader.mmap = data
+		return reader
+
+
+	def close(self):
+		if self.mmap is not None:
+			self.format.data = self.data = None
+			self.mmap.close()
+			self.file.close()
+			self.mmap = self.file = None
+
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+
+	def node_data(self, offset):
+		f = self.format
+		data = f.read_int( offset + f.child_count_bytes, f.attr_bytes )
+		return data if data != DicNode.NotLeaf else None
+
+
+	# дети узла в порядке возрастания букв: [(letter, child_offset)]
+	def node_items(self, offset):
+		f = self.format
+		table_offset = offset + f.before_table_bytes
+		items = []
+		for i in range( f.read_int( offset, f.child_count_bytes ) ):
+			cell_offset = table_offset + f.cell_size_bytes*i
+			items.append( (f.read_key( cell_offset ), f.read_int( cell_offset + f.letter_bytes, f.offset_bytes )) )
+		return items
+
+
+	# двоичный поиск по таблице детей (ключи отсортированы при сериализации)
+	def next(self, offset, letter):
+		f = self.format
+		code = ord( letter )
+		table_offset = offset + f.before_table_bytes
+		lo = 0
+		hi = f.read_int( offset, f.child_count_bytes )
+		while lo < hi:
+			mid = (lo + hi) // 2
+			cell_offset = table_offset + f.cell_size_bytes*mid
+			key = f.read_int( cell_offset, f.letter_bytes )
+			if key < code:
+				lo = mid + 1
+			elif key > code:
+				hi = mid
+			else:
+				return f.read_int( cell_offset + f.letter_bytes, f.offset_bytes )
+		return None
+
+
+	def find(self, word):
+		offset = self.root
+		for letter in word:
+			offset = self.next( offset, letter )
+			if offset is None:
+				return None
+		return offset
+
+
+	def check_word(self, word):
+		return self.get_attr( word ) is not None
+
+
+	# атрибут слова или None, если слова нет
+	def get_attr(self, word):
+		if self.folding is not None:
+			return fold.get_attr( self.next, self.node_data, self.root, word, self.folding )
+		offset = self.find( word )
+		if offset is None:
+			return None
+		return self.node_data( offset )
+
+
+	# все слова с заданным префиксом в алфавитном порядке: (word, attr)
+	def iter_words(self, prefix = ""):
+		if self.folding is not None:
+			starts = fold.find_nodes( self.next, self.root, self.folding.fold( prefix ), self.folding )
+		else:
+			offset = self.find( prefix )
+			starts = [(offset, prefix)] if offset is not None else []
+		for start in starts:
+			yield from self._iter_words( start )
+
+
+	def _iter_words(self, start):
+		to_process = [start]
+		while len( to_process ) > 0:
+			offset, word = to_process.pop()
+			data = self.node_data( offset )
+			if data is not None:
+				yield (word, data)
+			for letter, child in reversed( self.node_items( offset ) ):
+				to_process.append( (child, word + letter) )
+
+
+	# слова словаря, являющиеся префиксами text[start:]: (end, attr)
+	def iter_prefixes(self, text, start = 0):
+		if self.folding is not None:
+			yield from fold.iterate_prefixes( self.next, self.node_data, self.root, text, start, self.folding )
+			return
+		offset = self.root
+		for i in range( start, len( text ) ):
+			offset = self.next( offset, text[i] )
+			if offset is None:
+				return
+			data = self.node_data( offset )
+			if data is not None:
+				yield (i + 1, data)
+
+
+	def scan(self, text, longest = True, whole_words = False):
+		return scan_text( self.iter_prefixes, text, longest, whole_words )
+
+
+	# статистика из заголовка (версия 2) или, для старых файлов, полным обходом
+	def stats(self):
+		stats = self.format.extension.get( "stats", None )
+		if stats is None:
+			stats = graph_stats( *graph_access( self ) )
+		return stats
+
+
+####################################################################################################
+
+def find_node( root, word ):
+	curr_node = root
+	for letter in word:
+		curr_node = curr_node.next(letter)
+		if curr_node is None:
+			return None
+	return curr_node
+
+
+# обход в глубину без рекурсии. Ключи узлов отсортированы, поэтому слова идут по алфавиту
+def iterate_words( node, prefix ):
+	to_process = [(node, prefix)]
+	while len( to_process ) > 0:
+		node, word = to_process.pop()
+		if node.is_leaf():
+			yield (word, node.data)
+		for i in range( len( node.keys ) - 1, -1, -1 ):
+			to_process.append( (node.children[i], word + node.keys[i]) )
+
+
+def _node_next( node, letter ):
+	return node.next( letter )
+
+def _node_data( node ):
+	return node.data
+
+
+# то же с учетом свертки (folding = None - без свертки)
+def folded_get_attr( root, word, folding ):
+	if folding is None:
+		node = find_node( root, word )
+		return node.data if node is not None else None
+	return fold.get_attr( _node_next, _node_data, root, word, folding )
+
+
+def folded_iterate_words( root, prefix, folding ):
+	if folding is None:
+		node = find_node( root, prefix )
+		starts = [(node, prefix)] if node is not None else []
+	else:
+		starts = fold.find_nodes( _node_next, root, folding.fold( prefix ), folding )
+	for (node, path) in starts:
+		yield from iterate_words( node, path )
+
+
+def folded_iterate_prefixes( root, text, start, folding ):
+	if folding is None:
+		return iterate_prefixes( root, text, start )
+	return fold.iterate_prefixes( _node_next, _node_data, root, text, start, folding )
+
+
+def iterate_prefixes( root, text, start ):
+	curr_node = root
+	for i in range( start, len( text ) ):
+		curr_node = curr_node.next( text[i] )
+		if curr_node is None:
+			return
+		if curr_node.is_leaf():
+			yield (i + 1, curr_node.data)
+
+
+# Единый доступ к графу словаря: (root, items, data).
+# items( node ) - [(letter, child)] по возрастанию букв, data( node ) - атрибут или None.
+# Узел - DicNode для DicTree/DicDawg и смещение для DicReader
+def graph_access( dictionary ):
+	if isinstance( dictionary, DicReader ):
+		return dictionary.root, dictionary.node_items, dictionary.node_data
+	return dictionary.root, lambda node: list( zip( node.keys, node.children ) ), _node_data
+
+
+def _graph_key( node ):
+	# ленивые узлы могут пересоздаваться, их идентифицирует смещение
+	if isinstance( node, LazyDicNode ):
+		return node.offset
+	return node if isinstance( node, int ) else id( node )
+
+
+# Статистика графа словаря за один проход без рекурсии (узел обрабатывается после детей):
+# узлы, ребра, слова, максимальная глубина (длина самого длинного слова), размер алфавита.
+# Общие узлы DAWG считаются один раз, слова - по всем путям
+def graph_stats( root, items, data ):
+	# { ключ узла : (слов в поддереве, глубина поддерева, узел) }.
+	# Узел хранится, чтобы его id не достался новому объекту
+	done = {}
+	letters = set()
+	edges = 0
+	to_process = [(root, False)]
+	while len( to_process ) > 0:
+		node, children_done = to_process.pop()
+		key = _graph_key( node )
+		if key in done:
+			continue
+		children = items( node )
+		if not children_done:
+			to_process.append( (node, True) )
+			for (_letter, child) in children:
+				if _graph_key( child ) not in done:
+					to_process.append( (child, False) )
+			continue
+		words = 1 if data( node ) is not None else 0
+		depth = 0
+		for (letter, child) in children:
+			child_words, child_depth, _child = done[_graph_key( child )]
+			words += child_words
+			depth = max( depth, child_depth + 1 )
+			letters.add( letter )
+		edges += len( children )
+		done[key] = (words, depth, node)
+	words, depth, _root = done[_graph_key( root )]
+	return {
+		"nodes": len( done ),
+		"edges": edges,
+		"words": words,
+		"max_depth": depth,
+		"alphabet_size": len( letters ),
+	}
+
+
+# Поиск слов словаря в тексте без разбиения на токены (находятся и слова с пробелами и дефисами).
+# (start, end, attr) для text[start:end]:
+#	longest = True  - самое длинное совпадение с каждой позиции, совпадения не перекрываются;
+#	longest = False - все совпадения со всех позиций.
+# whole_words - совпадение не должно начинаться или заканчиваться внутри слова текста.
+#
+# Каждая позиция - отдельный проход от корня, время O(n*L), где L - длина самого длинного слова.
+# Суффиксные ссылки Ахо-Корасик на минимизированном DAWG не определены: узел общий для многих
+# префиксов, а ссылка зависит от префикса.
+def scan_text( iter_prefixes, text, longest = True, whole_words = False ):
+	def boundary( i ):
+		return i == 0 or i == len( text ) or not (text[i - 1].isalnum() and text[i].isalnum())
+
+	i = 0
+	while i < len( text ):
+		if whole_words and not boundary( i ):
+			i += 1
+			continue
+		matches = [(end, attr) for (end, attr) in iter_prefixes( text, i ) if not whole_words or boundary( end )]
+		if len( matches ) == 0:
+			i += 1
+		elif longest:
+			end, attr = matches[-1]
+			yield (i, end, attr)
+			i = end
+		else:
+			for (end, attr) in matches:
+				yield (i, end, attr)
+			i += 1
+
+
+####################################################################################################
+
+
+class DicTree:
+
+	# folding - свертка слов (folding.Folding): применяется к добавляемым словам и к запросам
+	def __init__(self, root = None, folding = None):
+		self.root = root if (root is not None) else DicNode()
+		self.folding = folding
+
+
+	def add_word(self, word, attr = DicNode.EmptyLeaf):
+		assert word is not None and word != ""
+		if self.folding is not None:
+			word = self.folding.fold( word )
+		curr_node = self.root
+		for letter in word:
+			curr_node = curr_node.add(letter)
+		curr_node.set_leaf(attr)
+
+
+	def check_word(self, word):
+		if self.folding is not None:
+			return self.get_attr( word ) is not None
+
+		curr_node = self.root
+
+		for letter in word:
+			curr_node = curr_node.next(letter)
+			if curr_node is None:
+				return False
+
+		return curr_node.is_leaf()
+
+
+	def get_attr(self, word):
+		return folded_get_attr( self.root, word, self.folding )
+
+
+	def iter_words(self, prefix = ""):
+		return folded_iterate_words( self.root, prefix, self.folding )
+
+
+	def iter_prefixes(self, text, start = 0):
+		return folded_iterate_prefixes( self.root, text, start, self.folding )
+
+
+	def scan(self, text, longest = True, whole_words = False):
+		return scan_text( self.iter_prefixes, text, longest, whole_words )
+
+
+	def stats(self):
+		return graph_stats( *graph_access( self ) )
+
+	# со сверткой - только версия 2 (свертка хранится в расширении заголовка)
+	def serialize(self, version = DicSerializer.DefaultVersion, layout = None):
+		s = DicSerializer( version, layout )
+		return s.serialize_tree( self )
+
+
+	def deserialize(self, data, lazy = False, cache_size = None):
+		s = DicSerializer()
+		tree = s.deserialize( data, lazy, cache_size )
+		self.root = tree.root
+		self.folding = tree.folding
+
+####################################################################################################
+
+class DicDawg:
+
+	# folding - свертка слов (folding.Folding). DicDawgBuilder ее не применяет: слова в нем
+	# уже должны быть свернуты (и отсортированы после свертки)
+	def __init__(self, root = None, minimized_nodes = None, folding = None):
+		self.root = root if (root is not None) else DicNode()
+		# реестр минимизированных узлов (как в DicDawgBuilder). Нужен для add_word/remove_word.
+		# Если не передан - строится при первом изменении
+		self.minimized_nodes = minimized_nodes
+		# замененные при правках узлы остаются в реестре; когда он перерастает этот предел,
+		# реестр строится заново из достижимых узлов
+		self.registry_limit = None
+		self.folding = folding
+
+	def check_word(self, word):
+		if self.folding is not None:
+			return self.get_attr( word ) is not None
+
+		curr_node = self.root
+
+		for letter in word:
+			curr_node = curr_node.next(letter)
+			if curr_node is None:
+				return False
+
+		return curr_node.is_leaf()
+
+
+	def get_attr(self, word):
+		return folded_get_attr( self.root, word, self.folding )
+
+
+	def iter_words(self, prefix = ""):
+		return folded_iterate_words( self.root, prefix, self.folding )
+
+
+	def iter_prefixes(self, text, start = 0):
+		return folded_iterate_prefixes( self.root, text, start, self.folding )
+
+
+	def scan(self, text, longest = True, whole_words = False):
+		return scan_text( self.iter_prefixes, text, longest, whole_words )
+
+
+	# добавляет слово в готовый DAWG без полной перестройки
+	def add_word(self, word, attr = DicNode.EmptyLeaf):
+		assert word is not None and word != ""
+		if self.folding is not None:
+			word = self.folding.fold( word )
+		root, path = self._clone_path( word )
+		path[-1][2].set_leaf( attr )
+		self._reminimize( root, path )
+
+
+	# удаляет слово из готового DAWG. Возвращает False, если слова не было
+	def remove_word(self, word):
+		if self.folding is not None:
+			word = self.folding.fold( word )
+		node = find_node( self.root, word ) if word != "" else None
+		if node is None or not node.is_leaf():
+			return False
+		root, path = self._clone_path( word )
+		path[-1][2].data = None
+		self._reminimize( root, path )
+		return True
+
+
+	# Узлы DAWG общие для многих слов, поэтому менять их на месте нельзя (copy-on-write).
+	# Копируем путь слова от корня, недостающие узлы создаем.
+	# Возвращает новый корень и список [(parent, letter, node)], как unchecked в DicDawgBuilder
+	def _clone_path(self, word):
+		root = self.root.clone()
+		path = []
+		node = root
+		for letter in word:
+			i = bisect.bisect_left( node.keys, letter )
+			if i < len( node.keys ) and node.keys[i] == letter:
+				child = node.children[i].clone()
+				node.children[i] = child
+			else:
+				child = node.add( letter )
+			path.append( (node, letter, child) )
+			node = child
+		return root, path
+
+
+	# минимизация скопированного пути снизу вверх (аналог DicDawgBuilder._minimize)
+	def _reminimize(self, root, path):
+		registry = self._get_minimized_nodes()
+		for i in range( len(path) - 1, -1, -1 ):
+			(parent, letter, child) = path[i]
+			# узел мог измениться после вычисления хэша
+			child.hash = None
+			if len( child.keys ) == 0 and not child.is_leaf():
+				# после удаления слова ветка опустела
+				parent.remove( letter )
+				continue
+			if child in registry:
+				parent.replace( letter, registry[child] )
+			else:
+				registry[child] = child
+		root.hash = None
+		# читатели видят либо старый, либо новый граф целиком
+		self.root = root
+		if self.registry_limit is None:
+			self.registry_limit = DicDawg.registry_limit_for( len( registry ) )
+		if len( registry ) > self.registry_limit:
+			self.minimized_nodes = None
+
+
+	# предел реестра: вдвое больше достижимых узлов - перестройка раз в O(размер графа) правок
+	@staticmethod
+	def registry_limit_for(reachable):
+		return max( 2 * reachable, 64 )
+
+
+	def _get_minimized_nodes(self):
+		if self.minimized_nodes is None:
+			# DAWG загружен из файла: все его узлы (кроме корня) уже минимальны
+			registry = {}
+			to_process = list( self.root.children )
+			while len( to_process ) > 0:
+				node = to_process.pop()
+				if node in registry:
+					continue
+				registry[node] = node
+				to_process.extend( node.children )
+			self.minimized_nodes = registry
+			self.registry_limit = DicDawg.registry_limit_for( len( registry ) )
+		return self.minimized_nodes
+
+
+	def stats(self):
+		return graph_stats( *graph_access( self ) )
+
+
+	def serialize(self, version = DicSerializer.DefaultVersion, layout = None):
+		s = DicSerializer( version, layout )
+		return s.serialize_dawg( self )
+
+
+	def deserialize(self, data, lazy = False, cache_size = None):
+		s = DicSerializer()
+		dawg = s.deserialize(data, lazy, cache_size)
+		self.root = dawg.root
+		self.minimized_nodes = None
+		self.folding = dawg.folding
+
+
+####################################################################################################
+
+def common_prefix_length( s1, s2 ):
+	i = 0
+	l = min( len(s1), len(s2) )
+	while (i < l) and (s1[i] == s2[i]):
+		i += 1
+	return i
+
+debug = False
+
+class DicDawgBuilder:
+
+	def __init__(self):
+		self.root = DicNode()
+		self.previous_word = ""
+		
+		# список последних непроверенных узлов. Всегда в порядке возрастания глубины узла
+		self.unchecked = []
+		# узлы, которые точно нужны в DAWG. 
+		self.minimized_nodes = {}
+		# статистика реестра minimized_nodes
+		self.registry_hits = 0
+		self.registry_misses = 0
+
+	def add_word(self, word, attr = DicNode.EmptyLeaf ):
+		if word < self.previous_word:
+			raise Exception( "Error: Words must be inserted in alphabetical order: ", word, self.previous_word )
+		self._do_add_word( word, attr )
+
+
+	def _do_add_word(self, word, attr):
+		common_prefix = common_prefix_length( word, self.previous_word )
+		self._minimize( common_prefix )
+
+		# [2] - это индекс в кортеже (parent, letter, node)
+		node = self.unchecked[-1][2] if len(self.unchecked) > 0 else self.root
+
+		# собственно, добавляем новые узлы
+		for letter in word[common_prefix:]:
+			next_node = node.add( letter )
+			self.unchecked.append( (node, letter, next_node) )
+			node = next_node
+
+		node.set_leaf( attr )
+		self.previous_word = word
+
+
+	def _minimize(self, depth):
+		for i in range( len(self.unchecked) - 1, depth - 1, -1 ):
+			(parent, letter, child) = self.unchecked[i]
+			
+			if child in self.minimized_nodes:
+				parent.replace( letter, self.minimized_nodes[child] )
+				self.registry_hits += 1
+			else:
+				self.minimized_nodes[child] = child
+				self.registry_misses += 1
+			self.unchecked.pop()
+
+
+	def build(self):
+		self._minimize( 0 )
+		return DicDawg( self.root, self.minimized_nodes )
+
+
+####################################################################################################
+
+import unittest
+import random
+
+class TestEmptyDictionary(unittest.TestCase):
+	def setUp(self):
+		self.dictionary = DicTree()
+
+	def test_empty_dictionary(self):
+		self.assertFalse(self.dictionary.check_word(""))
+		self.assertFalse(self.dictionary.check_word("any word"))
+		self.assertFalse(self.dictionary.check_word("a"))
+		self.assertFalse(self.dictionary.check_word(" "))
+
+
+###
+
+
+class TestDictionary(unittest.TestCase):
+
+	def test_one_word(self):
+		dic = DicTree()
+		self.assertFalse(dic.check_word("hello"))
+		dic.add_word("hello")
+		self.assertTrue(dic.check_word("hello"))
+
+	def test_multi_word(self):
+		dic = DicTree()
+		dic.add_word("any")
+		dic.add_word("anyone")
+		dic.add_word("anywhere")
+		dic.add_word("someone")
+		dic.add_word("somewhere")
+		self.assertTrue(dic.check_word("anyone"))
+		self.assertTrue(dic.check_word("anywhere"))
+		self.assertTrue(dic.check_word("any"))
+		self.assertTrue(dic.check_word("someone"))
+		self.assertTrue(dic.check_word("somewhere"))
+		self.assertFalse(dic.check_word("some"))
+		self.assertFalse(dic.check_word("a"))
+		self.assertFalse(dic.check_word("an"))
+		self.assertFalse(dic.check_word("anyo"))
+		self.assertFalse(dic.check_word("anyon"))
+
+
+###
+
+
+class TestDictionarySerialization(unittest.TestCase):
+
+	def test_empty(self):
+		dic = DicTree()
+		s = DicSerializer(v=0)
+		data = s.serialize_tree(dic)
+		# print( data )
+		self.assertEqual( len(data), DicSerializer.HeaderSize + 4 + 4 )
+		self.assertEqual( data, b'WFTREE\x00\x00\x00\x00\x00\x00\xff\xff\xff\xff' )
+
+
+	def test_one_letter(self):
+		dic = DicTree()
+		dic.add_word("a")
+		s = DicSerializer(v=0)
+		data = s.serialize_tree(dic)
+		# print( data )
+		self.assertEqual( len( data ), DicSerializer.HeaderSize + (4 + 4 + 1*(4 + 4)) + (4 + 4) )
+		self.assertEqual( data,
+			b'WFTREE\x00\x00\x01\x00\x00\x00\xff\xff\xff\xff\x61\x00\x00\x00\x18\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00' )
+		# 01000000 ffffffff 61000000 08000000 00000000 00000000
+		# ^^^^^^^^ - количество детей root
+		#           ^^^^^^^^ - атрибуты root (NotLeaf)
+		#                   ^^^^^^^^ - ключ ребенка
+		#                            ^^^^^^^^ - смещение ребенка
+		#                                     ^^^^^^^^ - у ребенка нет детей
+		#                                              ^^^^^^^^ - аттрибуты ребенка (EmptyLeaf)
+
+
+	def test_one_word(self):
+		dic = DicTree()
+		dic.add_word( "hello" )
+		s = DicSerializer(v=0)
+		data = s.serialize_tree(dic)
+		# 5 букв. Каждая по:
+		# 2 байта - количество детей
+		# 2 байта - данные в листе
+		# 2 байта - закодирована буква ребенка
+		# 2 байта - смещение ребенка
+		# корень совпадает с буквой
+		# листовой узел не имеет детей. (ровно 4 байта)
+		self.assertEqual( len(data), DicSerializer.HeaderSize + 5*(4+4+4+4) + (4+4) )
+
+	def test_one_word_reload(self):
+		dic = DicTree()
+		dic.add_word( "anyone" )
+		data = dic.serialize()
+		dic2 = DicTree()
+		dic2.deserialize( data )
+		self.assertTrue( dic2.check_word( "anyone" ) )
+		self.assertFalse( dic2.check_word( "any" ) )
+
+
+###
+
+
+class TestDawg(unittest.TestCase):
+	def setUp(self):
+		builder = DicDawgBuilder()
+		builder.add_word( "any" )
+		builder.add_word( "anyone" )
+		builder.add_word( "anywhere" )
+		builder.add_word( "someone" )
+		builder.add_word( "somewhere" )
+		self.builder = builder
+
+	def test_empty(self):
+		dic = DicDawg()
+		s = DicSerializer(v=0)
+		data = s.serialize_dawg(dic)
+		# print( data )
+		self.assertEqual( len(data), DicSerializer.HeaderSize + 4 + 4 )
+		self.assertEqual( data, b'WFDAWG\x00\x00\x00\x00\x00\x00\xff\xff\xff\xff' )
+
+	def test_one_final(self):
+		global debug
+		debug = True
+		tree = DicTree()
+		tree.add_word( "a" )
+		tree.add_word( "b" )
+		tree_data = tree.serialize()
+		
+		builder = DicDawgBuilder()
+		builder.add_word( "a" )
+		builder.add_word( "b" )
+		dawg = builder.build()
+		dawg_data = dawg.serialize()
+
+		self.assertLess( len( dawg_data ), len( tree_data ) )
+		debug = False
+
+	def test_words(self):
+		dawg = self.builder.build()
+		
+		self.assertTrue( dawg.check_word("anyone") )
+		self.assertTrue( dawg.check_word("anywhere") )
+		self.assertTrue( dawg.check_word("any") )
+		self.assertTrue( dawg.check_word("someone") )
+		self.assertTrue( dawg.check_word("somewhere") )
+		self.assertFalse( dawg.check_word("some") )
+		self.assertFalse( dawg.check_word("a") )
+		self.assertFalse( dawg.check_word("an") )
+		self.assertFalse( dawg.check_word("anyo") )
+		self.assertFalse( dawg.check_word("anyon") )
+
+
+	def test_reload(self):
+		dawg = self.builder.build()
+		dawg_data = dawg.serialize()
+		dawg2 = DicDawg()
+		dawg2.deserialize( dawg_data )
+
+		self.assertTrue( dawg2.check_word("anyone") )
+		self.assertTrue( dawg2.check_word("anywhere") )
+		self.assertTrue( dawg2.check_word("any") )
+		self.assertTrue( dawg2.check_word("someone") )
+		self.assertTrue( dawg2.check_word("somewhere") )
+		self.assertFalse( dawg2.check_word("some") )
+		self.assertFalse( dawg2.check_word("a") )
+		self.assertFalse( dawg2.check_word("an") )
+		self.assertFalse( dawg2.check_word("anyo") )
+		self.assertFalse( dawg2.check_word("anyon") )
+
+
+class TestDawgIncremental(unittest.TestCase):
+	Words = [ "any", "anyone", "anywhere", "someone", "somewhere" ]
+
+	def build(self, words):
+		builder = DicDawgBuilder()
+		for w in sorted( words ):
+			builder.add_word( w )
+		return builder.build()
+
+	def test_add(self):
+		dawg = self.build( self.Words )
+		dawg.add_word( "anybody" )
+		dawg.add_word( "some" )
+		for w in self.Words + [ "anybody", "some" ]:
+			self.assertTrue( dawg.check_word( w ) )
+		self.assertFalse( dawg.check_word( "anyb" ) )
+		self.assertFalse( dawg.check_word( "somebody" ) )
+
+	def test_add_is_minimal(self):
+		dawg = self.build( self.Words )
+		dawg.add_word( "nowhere" )
+		dawg.add_word( "noone" )
+		rebuilt = self.build( self.Words + [ "nowhere", "noone" ] )
+		self.assertEqual( dawg.serialize(), rebuilt.serialize() )
+
+	def test_remove(self):
+		dawg = self.build( self.Words )
+		self.assertTrue( dawg.remove_word( "anyone" ) )
+		self.assertFalse( dawg.remove_word( "anyone" ) )
+		self.assertFalse( dawg.remove_word( "some" ) )
+		self.assertFalse( dawg.check_word( "anyone" ) )
+		# общий суффикс "one" остался у someone
+		self.assertTrue( dawg.check_word( "someone" ) )
+		self.assertTrue( dawg.check_word( "any" ) )
+		rebuilt = self.build( [ "any", "anywhere", "someone", "somewhere" ] )
+		self.assertEqual( dawg.serialize(), rebuilt.serialize() )
+
+	def test_attr(self):
+		dawg = self.build( [] )
+		dawg.add_word( "ab", 3 )
+		dawg.add_word( "cb", 3 )
+		dawg.add_word( "db", 5 )
+		rebuilt = DicDawgBuilder()
+		rebuilt.add_word( "ab", 3 )
+		rebuilt.add_word( "cb", 3 )
+		rebuilt.add_word( "db", 5 )
+		self.assertEqual( dawg.serialize(), rebuilt.build().serialize() )
+
+	def test_after_reload(self):
+		data = self.build( self.Words ).serialize()
+		dawg = DicDawg()
+		dawg.deserialize( data )
+		dawg.add_word( "anything" )
+		self.assertTrue( dawg.remove_word( "somewhere" ) )
+		dawg2 = DicDawg()
+		dawg2.deserialize( dawg.serialize() )
+		self.assertTrue( dawg2.check_word( "anything" ) )
+		self.assertTrue( dawg2.check_word( "anywhere" ) )
+		self.assertFalse( dawg2.check_word( "somewhere" ) )
+
+	def test_registry_bounded(self):
+		dawg = self.build( self.Words )
+		for i in range( 2000 ):
+			dawg.add_word( "nobody" )
+			dawg.remove_word( "nobody" )
+			if dawg.minimized_nodes is not None:
+				self.assertLessEqual( len( dawg.minimized_nodes ), dawg.registry_limit )
+		self.assertLessEqual( dawg.registry_limit, 64 )
+		self.assertEqual( dawg.serialize(), self.build( self.Words ).serialize() )
+
+
+class TestLazyDeserialization(unittest.TestCase):
+	Words = [ "any", "anyone", "anywhere", "someone", "somewhere" ]
+
+	def test_tree(self):
+		tree = DicTree()
+		for w in self.Words:
+			tree.add_word( w )
+		data = tree.serialize()
+
+		lazy = DicTree()
+		lazy.deserialize( data, lazy = True, cache_size = 4 )
+		for w in self.Words:
+			self.assertTrue( lazy.check_word( w ) )
+		self.assertFalse( lazy.check_word( "anyo" ) )
+		self.assertEqual( list( lazy.iter_words() ), list( tree.iter_words() ) )
+
+		s = DicSerializer()
+		root = s.deserialize( data, lazy = True, cache_size = 4 ).root
+		for w in self.Words:
+			self.assertTrue( find_node( root, w ).is_leaf() )
+		self.assertLessEqual( len( s.dawg_deserialization_cache ), 4 )
+
+	def test_nothing_decoded_on_load(self):
+		s = DicSerializer()
+		dawg = s.deserialize( DicTree().serialize(), lazy = True )
+		self.assertIsNone( dawg.root._keys )
+		self.assertEqual( len( s.dawg_deserialization_cache ), 1 )
+
+	def test_edit(self):
+		tree = DicTree()
+		for w in self.Words:
+			tree.add_word( w )
+		lazy = DicTree()
+		lazy.deserialize( tree.serialize(), lazy = True, cache_size = 2 )
+		lazy.add_word( "anybody" )
+		lazy.add_word( "some" )
+		tree.add_word( "anybody" )
+		tree.add_word( "some" )
+		self.assertEqual( lazy.serialize(), tree.serialize() )
+
+	def test_dawg(self):
+		builder = DicDawgBuilder()
+		for w in self.Words:
+			builder.add_word( w )
+		data = builder.build().serialize()
+		lazy = DicDawg()
+		lazy.deserialize( data, lazy = True )
+		lazy.add_word( "nowhere" )
+		self.assertTrue( lazy.check_word( "nowhere" ) )
+		self.assertTrue( lazy.check_word( "somewhere" ) )
+
+	def test_dawg_round_trip(self):
+		generator = random.Random( 1 )
+		words = { "".join( generator.choice( "abcde" ) for _ in range( generator.randint( 2, 7 ) ) ) for _ in range( 300 ) }
+		builder = DicDawgBuilder()
+		for w in sorted( words ):
+			builder.add_word( w )
+		data = builder.build().serialize()
+		# общие поддеревья записываются один раз, хотя узлы вытесняются из кэша
+		lazy = DicDawg()
+		lazy.deserialize( data, lazy = True, cache_size = 8 )
+		self.assertEqual( lazy.serialize(), data )
+
+		rebuilt = DicDawg()
+		rebuilt.deserialize( data )
+		rebuilt.add_word( "abcdeab" )
+		lazy = DicDawg()
+		lazy.deserialize( data, lazy = True, cache_size = 8 )
+		lazy.add_word( "abcdeab" )
+		self.assertEqual( lazy.serialize(), rebuilt.serialize() )
+
+
+class TestDicReader(unittest.TestCase):
+	def setUp(self):
+		builder = DicDawgBuilder()
+		builder.add_word( "any", 1 )
+		builder.add_word( "anyone", 2 )
+		builder.add_word( "anywhere" )
+		builder.add_word( "someone", 2 )
+		self.dawg = builder.build()
+		self.reader = DicReader( self.dawg.serialize() )
+
+	def test_check_word(self):
+		for w in [ "any", "anyone", "anywhere", "someone" ]:
+			self.assertTrue( self.reader.check_word( w ) )
+		for w in [ "", "a", "anyo", "some", "someones", "x" ]:
+			self.assertFalse( self.reader.check_word( w ) )
+		self.assertEqual( self.reader.get_attr( "any" ), 1 )
+		self.assertEqual( self.reader.get_attr( "anyone" ), 2 )
+		self.assertEqual( self.reader.get_attr( "anywhere" ), DicNode.EmptyLeaf )
+
+	def test_iter_words(self):
+		expected = [ ("any", 1), ("anyone", 2), ("anywhere", 0), ("someone", 2) ]
+		self.assertEqual( list( self.reader.iter_words() ), expected )
+		self.assertEqual( list( self.dawg.iter_words() ), expected )
+		self.assertEqual( list( self.reader.iter_words( "anyw" ) ), [ ("anywhere", 0) ] )
+		self.assertEqual( list( self.dawg.iter_words( "b" ) ), [] )
+
+	def test_iter_prefixes(self):
+		self.assertEqual( list( self.reader.iter_prefixes( "xanyoneself", 1 ) ), [ (4, 1), (7, 2) ] )
+		self.assertEqual( list( self.dawg.iter_prefixes( "xanyoneself", 1 ) ), [ (4, 1), (7, 2) ] )
+
+
+class TestScan(unittest.TestCase):
+	Words = [ ("new", 1), ("new york", 2), ("york", 3), ("e-mail", 4), ("mail", 5), ("ma", 6) ]
+
+	def check(self, dictionary):
+		text = "New york: new york, e-mail"
+		self.assertEqual( list( dictionary.scan( text ) ),
+			[ (4, 8, 3), (10, 18, 2), (20, 26, 4) ] )
+		self.assertEqual( list( dictionary.scan( "e-mail", longest = False ) ),
+			[ (0, 6, 4), (2, 4, 6), (2, 6, 5) ] )
+		# "ma" внутри слова "mail" не считается
+		self.assertEqual( list( dictionary.scan( "mail new", longest = False, whole_words = True ) ),
+			[ (0, 4, 5), (5, 8, 1) ] )
+		self.assertEqual( list( dictionary.scan( "renew" ) ), [ (2, 5, 1) ] )
+		self.assertEqual( list( dictionary.scan( "renew", whole_words = True ) ), [] )
+
+	def test_scan(self):
+		tree = DicTree()
+		builder = DicDawgBuilder()
+		for (word, attr) in sorted( self.Words ):
+			tree.add_word( word, attr )
+			builder.add_word( word, attr )
+		dawg = builder.build()
+		self.check( tree )
+		self.check( dawg )
+		self.check( DicReader( dawg.serialize() ) )
+
+
+class TestFolding(unittest.TestCase):
+
+	def check(self, dictionary):
+		self.assertTrue( dictionary.check_word( "ЕЖИК" ) )
+		self.assertEqual( dictionary.get_attr( "Ёжик" ), 1 )
+		self.assertEqual( dictionary.get_attr( "éte" ), 2 )
+		self.assertFalse( dictionary.check_word( "еж" ) )
+		self.assertEqual( list( dictionary.iter_words( "ЕЖ" ) ), [ ("ежик", 1) ] )
+		self.assertEqual( list( dictionary.scan( "Ёжик и Ежик" ) ), [ (0, 4, 1), (7, 11, 1) ] )
+
+	def test_folding(self):
+		folding = fold.Folding( lower = True, normalization = "NFC", char_map = { "ё": "е" } )
+		tree = DicTree( folding = folding )
+		tree.add_word( "ёжик", 1 )
+		tree.add_word( "e\u0301te", 2 )
+		self.check( tree )
+
+		data = tree.serialize()
+		self.assertEqual( DicSerializer.read_header( data )[1], 2 )
+		self.check( DicReader( data ) )
+		loaded = DicTree()
+		loaded.deserialize( data, lazy = True )
+		self.assertEqual( loaded.folding, folding )
+		self.check( loaded )
+		with self.assertRaises( ValueError ):
+			tree.serialize( 1 )
+
+	def test_branching(self):
+		builder = DicDawgBuilder()
+		builder.add_word( "ель", 2 )
+		builder.add_word( "ёж", 1 )
+		dawg = builder.build()
+		dawg.folding = fold.Folding( alternatives = { "е": "ё" } )
+		for dictionary in [ dawg, DicReader( dawg.serialize() ) ]:
+			self.assertEqual( dictionary.get_attr( "еж" ), 1 )
+			self.assertEqual( dictionary.get_attr( "ель" ), 2 )
+			self.assertIsNone( dictionary.get_attr( "ёль" ) )
+			self.assertEqual( list( dictionary.iter_words( "е" ) ), [ ("ель", 2), ("ёж", 1) ] )
+			self.assertEqual( list( dictionary.iter_prefixes( "ежик" ) ), [ (2, 1) ] )
+
+	def test_layouts(self):
+		tree = DicTree()
+		tree.add_word( "ab", 300 )
+		for (version, layout) in [ (0, None), (2, 0) ]:
+			data = tree.serialize( version, layout )
+			loaded = DicTree()
+			loaded.deserialize( data )
+			self.assertEqual( loaded.get_attr( "ab" ), 300 )
+			self.assertEqual( DicReader( data ).get_attr( "ab" ), 300 )
+
+
+class TestStats(unittest.TestCase):
+
+	def test_stats(self):
+		tree = DicTree()
+		builder = DicDawgBuilder()
+		for word in [ "ab", "abc", "b", "bc" ]:
+			tree.add_word( word )
+			builder.add_word( word )
+		dawg = builder.build()
+		tree_stats = { "nodes": 6, "edges": 5, "words": 4, "max_depth": 3, "alphabet_size": 3 }
+		self.assertEqual( tree.stats(), tree_stats )
+		# "bc" и "c" после "ab" - общий узел
+		dawg_stats = dict( tree_stats, nodes = 4, edges = 4 )
+		self.assertEqual( dawg.stats(), dawg_stats )
+
+		data = dawg.serialize()
+		self.assertEqual( DicSerializer.read_header( data )[2]["stats"], dawg_stats )
+		self.assertEqual( DicReader( data ).stats(), dawg_stats )
+		self.assertEqual( DicReader( dawg.serialize( 1 ) ).stats(), dawg_stats )
+		lazy = DicDawg()
+		lazy.deserialize( data, lazy = True, cache_size = 2 )
+		self.assertEqual( lazy.stats(), dawg_stats )
+
+
+class TestCommonPrefix(unittest.TestCase):
+	def test_all(self):
+		self.assertEqual( common_prefix_length("","abc"), 0)
+		self.assertEqual( common_prefix_length("a","abc"), 1)
+		self.assertEqual( common_prefix_length("bac","abc"), 0)
+		self.assertEqual( common_prefix_length("abc","abc"), 3)
+		self.assertEqual( common_prefix_length("abcdef","abc"), 3)
+
+
+if __name__ == "__main__":
+	unittest.main()
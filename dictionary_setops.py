@@ -0,0 +1,165 @@
+#! python3
+
+import argparse
+import dictionary as dic
+
+DescriptionString = "Union, intersection and difference of two serialized dictionaries."
+
+# Операции над множествами слов двух словарей без выгрузки слов в текст.
+# Оба графа обходятся одновременно в глубину, дети узлов сливаются по буквам (они отсортированы),
+# так что слова результата получаются по алфавиту и сразу идут в DicDawgBuilder.
+# На каждом уровне хранится только список детей двух текущих узлов: память - O(длина слова),
+# а не O(размер словаря) (не считая самого строящегося DAWG).
+#
+# Словари - DicTree, DicDawg или DicReader (в том числе поверх mmap), в любом сочетании.
+
+Union = "union"
+Intersection = "intersection"
+Difference = "difference"
+
+Operations = [ Union, Intersection, Difference ]
+
+
+# атрибут слова, которое есть в обоих словарях: по умолчанию - из первого
+def first_attr( attr_a, attr_b ):
+	return attr_a
+
+
+# (word, attr) результата операции в алфавитном порядке
+def merge_words( a, b, operation, combine = first_attr ):
+	if operation not in Operations:
+		raise ValueError( "Unknown operation: " + str( operation ) )
+	root_a, items_a, data_a = dic.graph_access( a )
+	root_b, items_b, data_b = dic.graph_access( b )
+
+	# дети пары узлов: (word, child_a, child_b), child_* = None, если в словаре такой ветки нет
+	def children( word, node_a, node_b ):
+		left = items_a( node_a ) if node_a is not None else []
+		right = items_b( node_b ) if node_b is not None else []
+		i = 0
+		j = 0
+		while i < len( left ) or j < len( right ):
+			if j >= len( right ) or (i < len( left ) and left[i][0] < right[j][0]):
+				letter, child_a, child_b = left[i][0], left[i][1], None
+				i += 1
+			elif i >= len( left ) or right[j][0] < left[i][0]:
+				letter, child_a, child_b = right[j][0], None, right[j][1]
+				j += 1
+			else:
+				letter, child_a, child_b = left[i][0], left[i][1], right[j][1]
+				i += 1
+				j += 1
+			if child_a is None and operation != Union:
+				continue
+			if child_b is None and operation == Intersection:
+				continue
+			yield (word + letter, child_a, child_b)
+
+	# стек итераторов по детям: по одному на уровень
+	to_process = [children( "", root_a, root_b )]
+	while len( to_process ) > 0:
+		entry = next( to_process[-1], None )
+		if entry is None:
+			to_process.pop()
+			continue
+		word, node_a, node_b = entry
+		attr_a = data_a( node_a ) if node_a is not None else None
+		attr_b = data_b( node_b ) if node_b is not None else None
+		if attr_a is not None and attr_b is not None:
+			if operation != Difference:
+				yield (word, combine( attr_a, attr_b ))
+		elif attr_a is not None:
+			if operation != Intersection:
+				yield (word, attr_a)
+		elif attr_b is not None:
+			if operation == Union:
+				yield (word, attr_b)
+		to_process.append( children( word, node_a, node_b ) )
+
+
+def apply( a, b, operation, combine = first_attr ):
+	folding_a = getattr( a, "folding", None )
+	folding_b = getattr( b, "folding", None )
+	if folding_a != folding_b:
+		raise ValueError( "Dictionaries have different folding" )
+	builder = dic.DicDawgBuilder()
+	for (word, attr) in merge_words( a, b, operation, combine ):
+		builder.add_word( word, attr )
+	dawg = builder.build()
+	dawg.folding = folding_a
+	return dawg
+
+
+def union( a, b, combine = first_attr ):
+	return apply( a, b, Union, combine )
+
+
+def intersection( a, b, combine = first_attr ):
+	return apply( a, b, Intersection, combine )
+
+
+# слова a, которых нет в b
+def difference( a, b ):
+	return apply( a, b, Difference )
+
+
+def parse_args():
+	parser = argparse.ArgumentParser( prog = "dictionary_setops.py", description = DescriptionString )
+	parser.add_argument( "operation", choices = Operations )
+	parser.add_argument( "first", help = "Path to serialized dictionary. Its attributes win for common words" )
+	parser.add_argument( "second", help = "Path to serialized dictionary" )
+	parser.add_argument( "-o", "--output", required = True, help = "Path to output DAWG" )
+	return parser.parse_args()
+
+
+def main():
+	args = parse_args()
+	with dic.DicReader.open( args.first ) as a, dic.DicReader.open( args.second ) as b:
+		dawg = apply( a, b, args.operation )
+		layout = min( a.format.layout, b.format.layout )
+		binary = dawg.serialize( layout = layout )
+	with open( args.output, "wb" ) as out:
+		out.write( binary )
+
+
+####################################################################################################
+
+import unittest
+
+class TestSetOperations(unittest.TestCase):
+	A = [ ("any", 1), ("anyone", 2), ("ball", 3), ("foot", 4) ]
+	B = [ ("all", 5), ("any", 6), ("ball", 7), ("football", 8) ]
+
+	def dawg(self, words):
+		builder = dic.DicDawgBuilder()
+		for (word, attr) in words:
+			builder.add_word( word, attr )
+		return builder.build()
+
+	def check(self, a, b):
+		self.assertEqual( list( union( a, b ).iter_words() ),
+			[ ("all", 5), ("any", 1), ("anyone", 2), ("ball", 3), ("foot", 4), ("football", 8) ] )
+		self.assertEqual( list( intersection( a, b ).iter_words() ), [ ("any", 1), ("ball", 3) ] )
+		self.assertEqual( list( difference( a, b ).iter_words() ), [ ("anyone", 2), ("foot", 4) ] )
+		self.assertEqual( list( difference( b, a ).iter_words() ), [ ("all", 5), ("football", 8) ] )
+		self.assertEqual( list( union( a, b, max ).iter_words() )[1], ("any", 6) )
+
+	def test_operations(self):
+		a = self.dawg( self.A )
+		b = self.dawg( self.B )
+		self.check( a, b )
+		self.check( dic.DicReader( a.serialize() ), b )
+		tree = dic.DicTree()
+		for (word, attr) in self.A:
+			tree.add_word( word, attr )
+		self.check( tree, dic.DicReader( b.serialize() ) )
+
+	def test_empty(self):
+		a = self.dawg( self.A )
+		empty = dic.DicDawg()
+		self.assertEqual( list( intersection( a, empty ).iter_words() ), [] )
+		self.assertEqual( list( union( empty, a ).iter_words() ), self.A )
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,243 @@
+#! python3
+
+import threading
+import dictionary as dic
+import container
+
+# Словарь для многопоточного сервера с перезагрузкой на лету.
+#
+# DictionarySnapshot - неизменяемый снимок: сериализованные байты (bytes) и DicReader поверх них.
+# Чтение ничего не записывает ни в снимок, ни в узлы (в отличие от DicNode.hash и LazyDicNode),
+# так что снимок можно читать из любого числа потоков без блокировок.
+#
+# LiveDictionary - текущий снимок. Замена снимка - одно присваивание ссылки (атомарно):
+# читатель, взявший снимок, дочитывает его до конца, даже если снимок уже заменен,
+# и никогда не видит частично построенный словарь. Писатели (reload, update)
+# выполняются по очереди под writer_lock и читателей не блокируют.
+
+class DictionarySnapshot:
+
+	__slots__ = ( "data", "reader", "dfa", "generation" )
+
+	# data - сериализованный словарь, dfa - автомат композитов (или None)
+	def __init__(self, data, dfa = None, generation = 0):
+		data = bytes( data )
+		object.__setattr__( self, "data", data )
+		object.__setattr__( self, "reader", dic.DicReader( data ) )
+		object.__setattr__( self, "dfa", dfa )
+		object.__setattr__( self, "generation", generation )
+
+
+	def __setattr__(self, name, value):
+		raise AttributeError( "DictionarySnapshot is immutable" )
+
+
+	# словарь DicTree/DicDawg сериализуется, дальнейшие его изменения снимок не затрагивают
+	@staticmethod
+	def from_dictionary(dictionary, dfa = None, generation = 0):
+		return DictionarySnapshot( dictionary.serialize(), dfa, generation )
+
+
+	# файл словаря или контейнер (*.wfpack, тогда и автомат из него).
+	# Данные копируются в память: замена или порча файла не влияет на снимок
+	@staticmethod
+	def open(path, generation = 0):
+		if container.is_container( path ):
+			with container.Container.open( path ) as pack:
+				return DictionarySnapshot( pack.section( container.DawgSection ), pack.dfa(), generation )
+		with open( path, "rb" ) as dictionary_in:
+			return DictionarySnapshot( dictionary_in.read(), None, generation )
+
+
+	@property
+	def folding(self):
+		return self.reader.folding
+
+
+	def check_word(self, word):
+		return self.reader.check_word( word )
+
+	def get_attr(self, word):
+		return self.reader.get_attr( word )
+
+	def iter_words(self, prefix = ""):
+		return self.reader.iter_words( prefix )
+
+	def iter_prefixes(self, text, start = 0):
+		return self.reader.iter_prefixes( text, start )
+
+	def scan(self, text, longest = True, whole_words = False):
+		return self.reader.scan( text, longest, whole_words )
+
+	def stats(self):
+		return self.reader.stats()
+
+
+	# DicDawg для правок (узлы в памяти, копирование при изменении)
+	def to_dawg(self):
+		dawg = dic.DicDawg()
+		dawg.deserialize( self.data )
+		return dawg
+
+
+#------------------------------------------------------------------------------
+
+class LiveDictionary:
+
+	def __init__(self, snapshot, path = None):
+		self._snapshot = snapshot
+		# откуда перезагружать (reload без параметров)
+		self.path = path
+		self.writer_lock = threading.Lock()
+		# DicDawg последнего update: повторные правки не десериализуют снимок заново
+		self._dawg = None
+
+
+	@staticmethod
+	def open(path):
+		return LiveDictionary( DictionarySnapshot.open( path ), path )
+
+
+	# Текущий снимок. Несколько обращений к словарю в рамках одного запроса
+	# должны идти к одному снимку: snapshot = live.snapshot()
+	def snapshot(self):
+		return self._snapshot
+
+
+	# заменяет снимок, возвращает предыдущий
+	def swap(self, snapshot):
+		with self.writer_lock:
+			return self._swap( snapshot )
+
+
+	def _swap(self, snapshot):
+		previous = self._snapshot
+		self._snapshot = snapshot
+		self._dawg = None
+		return previous
+
+
+	# загружает новый снимок (с диска - вне блокировки) и подменяет текущий
+	def reload(self, path = None):
+		path = path if path is not None else self.path
+		if path is None:
+			raise ValueError( "LiveDictionary has no path to reload from" )
+		snapshot = DictionarySnapshot.open( path )
+		with self.writer_lock:
+			self.path = path
+			snapshot = DictionarySnapshot( snapshot.data, snapshot.dfa, self._snapshot.generation + 1 )
+			self._swap( snapshot )
+		return snapshot
+
+
+	# Добавляет и удаляет слова и публикует новый снимок.
+	# add - [(word, attr)], remove - [word]. Правки вносятся в DicDawg с копированием пути
+	# (старый граф не меняется), снимок строится сериализацией всего словаря - правки
+	# выгодно собирать в пачки
+	def update(self, add = (), remove = ()):
+		with self.writer_lock:
+			current = self._snapshot
+			dawg = self._dawg if self._dawg is not None else current.to_dawg()
+			for (word, attr) in add:
+				dawg.add_word( word, attr )
+			for word in remove:
+				dawg.remove_word( word )
+			snapshot = DictionarySnapshot( dawg.serialize( current.reader.format.version, current.reader.format.layout ),
+				current.dfa, current.generation + 1 )
+			self._swap( snapshot )
+			self._dawg = dawg
+		return snapshot
+
+
+	# отдельные запросы - каждый к текущему снимку
+	def check_word(self, word):
+		return self._snapshot.check_word( word )
+
+	def get_attr(self, word):
+		return self._snapshot.get_attr( word )
+
+	def iter_words(self, prefix = ""):
+		return self._snapshot.iter_words( prefix )
+
+	def iter_prefixes(self, text, start = 0):
+		return self._snapshot.iter_prefixes( text, start )
+
+
+####################################################################################################
+
+import unittest
+import os
+import tempfile
+
+class TestSnapshot(unittest.TestCase):
+	def setUp(self):
+		builder = dic.DicDawgBuilder()
+		builder.add_word( "ball", 1 )
+		builder.add_word( "foot", 2 )
+		self.snapshot = DictionarySnapshot.from_dictionary( builder.build() )
+
+	def test_immutable(self):
+		with self.assertRaises( AttributeError ):
+			self.snapshot.data = b""
+		self.assertEqual( self.snapshot.get_attr( "foot" ), 2 )
+		self.assertEqual( list( self.snapshot.iter_words() ), [ ("ball", 1), ("foot", 2) ] )
+
+	def test_update(self):
+		live = LiveDictionary( self.snapshot )
+		old = live.snapshot()
+		new = live.update( add = [ ("hand", 3) ], remove = [ "ball" ] )
+		self.assertEqual( new.generation, 1 )
+		self.assertEqual( list( live.iter_words() ), [ ("foot", 2), ("hand", 3) ] )
+		# старый снимок не изменился
+		self.assertEqual( list( old.iter_words() ), [ ("ball", 1), ("foot", 2) ] )
+		live.update( add = [ ("arm", 4) ] )
+		self.assertEqual( live.get_attr( "arm" ), 4 )
+		self.assertTrue( live.check_word( "hand" ) )
+
+	def test_reload(self):
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join( directory, "xx_dic.dawg" )
+			with open( path, "wb" ) as out:
+				out.write( self.snapshot.data )
+			live = LiveDictionary.open( path )
+			self.assertTrue( live.check_word( "ball" ) )
+			tree = dic.DicTree()
+			tree.add_word( "hand", 3 )
+			with open( path, "wb" ) as out:
+				out.write( tree.serialize() )
+			snapshot = live.reload()
+			self.assertEqual( snapshot.generation, 1 )
+			self.assertFalse( live.check_word( "ball" ) )
+			self.assertEqual( live.get_attr( "hand" ), 3 )
+
+	def test_concurrent_readers(self):
+		live = LiveDictionary( self.snapshot )
+		errors = []
+		stop = threading.Event()
+
+		def read():
+			while not stop.is_set():
+				snapshot = live.snapshot()
+				# в каждом снимке "foot" есть, а "hand" - только вместе с "arm"
+				if not snapshot.check_word( "foot" ) or snapshot.check_word( "hand" ) != snapshot.check_word( "arm" ):
+					errors.append( snapshot.generation )
+
+		readers = [ threading.Thread( target = read ) for _ in range( 4 ) ]
+		for t in readers:
+			t.start()
+		try:
+			for i in range( 30 ):
+				if i % 2 == 0:
+					live.update( add = [ ("arm", 1), ("hand", 2) ] )
+				else:
+					live.update( remove = [ "arm", "hand" ] )
+		finally:
+			stop.set()
+			for t in readers:
+				t.join()
+		self.assertEqual( errors, [] )
+		self.assertEqual( live.snapshot().generation, 30 )
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,158 @@
+#! python3
+
+import unicodedata
+
+# Свертка слов при поиске в словаре: регистр, нормализация Unicode, замена букв (ё -> е).
+# Словарь строится из свернутых слов, запрос сворачивается на лету - один компактный словарь
+# отвечает на все варианты написания. Настройки хранятся в заголовке сериализованного словаря.
+#
+# alternatives - ветвление: в узле кроме буквы запроса пробуются ее альтернативы
+# (например, { "е": "ё" } - словарь хранит "ёж", а в запросе "еж").
+#
+# Узлы обходятся через функцию next( node, letter ), так что одни и те же функции
+# работают и с DicNode, и со смещениями DicReader.
+
+Normalizations = [ "NFC", "NFD", "NFKC", "NFKD" ]
+
+
+class Folding:
+
+	def __init__(self, lower = False, normalization = None, char_map = None, alternatives = None):
+		if normalization is not None and normalization not in Normalizations:
+			raise ValueError( "Unknown normalization: " + str( normalization ) )
+		self.lower = lower
+		self.normalization = normalization
+		# { буква : замена }
+		self.char_map = dict( char_map ) if char_map else {}
+		# { буква : строка альтернативных букв }
+		self.alternatives = { letter: "".join( alts ) for letter, alts in (alternatives or {}).items() }
+		self._table = str.maketrans( self.char_map ) if len( self.char_map ) > 0 else None
+		self._candidates = { letter: letter + alts for letter, alts in self.alternatives.items() }
+
+
+	def fold(self, word):
+		if self.normalization is not None:
+			word = unicodedata.normalize( self.normalization, word )
+		return self.fold_letters( word )
+
+
+	# без нормализации: она меняет длину текста, а смещения в тексте должны сохраняться
+	def fold_letters(self, text):
+		if self.lower:
+			text = text.lower()
+		if self._table is not None:
+			text = text.translate( self._table )
+		return text
+
+
+	# буквы, которые пробуются в узле для буквы запроса
+	def candidates(self, letter):
+		return self._candidates.get( letter, letter )
+
+
+	def is_branching(self):
+		return len( self.alternatives ) > 0
+
+
+	def to_dict(self):
+		result = {}
+		if self.lower:
+			result["lower"] = True
+		if self.normalization is not None:
+			result["normalization"] = self.normalization
+		if len( self.char_map ) > 0:
+			result["char_map"] = self.char_map
+		if len( self.alternatives ) > 0:
+			result["alternatives"] = self.alternatives
+		return result
+
+
+	@staticmethod
+	def from_dict(d):
+		return Folding( d.get( "lower", False ), d.get( "normalization", None ), d.get( "char_map", None ), d.get( "alternatives", None ) )
+
+
+	def __eq__(self, other):
+		return isinstance( other, Folding ) and self.to_dict() == other.to_dict()
+
+
+# разбор "ё=е" (для параметров командной строки): { "ё" : "е" }
+def parse_pairs( pairs ):
+	result = {}
+	for pair in pairs or []:
+		letter, sep, value = pair.partition( "=" )
+		if sep == "" or len( letter ) != 1:
+			raise ValueError( "Expected 'letter=letters': " + pair )
+		result[letter] = value
+	return result
+
+
+# узлы, в которые ведет слово (уже свернутое): [(node, слово в словаре)].
+# Без альтернатив - не больше одного узла
+def find_nodes( next, root, word, folding ):
+	found = []
+	to_process = [(root, 0, "")]
+	while len( to_process ) > 0:
+		node, i, path = to_process.pop()
+		if i == len( word ):
+			found.append( (node, path) )
+			continue
+		# в обратном порядке, чтобы сама буква запроса проверялась первой
+		for letter in reversed( folding.candidates( word[i] ) ):
+			child = next( node, letter )
+			if child is not None:
+				to_process.append( (child, i + 1, path + letter) )
+	return found
+
+
+# атрибут первого найденного варианта слова или None
+def get_attr( next, node_data, root, word, folding ):
+	for (node, _path) in find_nodes( next, root, folding.fold( word ), folding ):
+		data = node_data( node )
+		if data is not None:
+			return data
+	return None
+
+
+# как iterate_prefixes: (end, attr) для слов словаря, являющихся префиксами text[start:].
+# Буквы сворачиваются по одной, нормализация не применяется
+def iterate_prefixes( next, node_data, root, text, start, folding ):
+	frontier = [root]
+	for i in range( start, len( text ) ):
+		for letter in folding.fold_letters( text[i] ):
+			frontier = [child for node in frontier for candidate in folding.candidates( letter )
+				for child in (next( node, candidate ),) if child is not None]
+		if len( frontier ) == 0:
+			return
+		for node in frontier:
+			data = node_data( node )
+			if data is not None:
+				yield (i + 1, data)
+				break
+
+
+####################################################################################################
+
+import unittest
+
+class TestFolding(unittest.TestCase):
+
+	def test_fold(self):
+		folding = Folding( lower = True, normalization = "NFC", char_map = { "ё": "е" } )
+		self.assertEqual( folding.fold( "Ёжик" ), "ежик" )
+		self.assertEqual( folding.fold( "é" ), "é" )
+		self.assertEqual( Folding.from_dict( folding.to_dict() ), folding )
+
+	def test_find_nodes(self):
+		# словарь в виде { префикс : атрибут или None }
+		words = { "": None, "е": None, "ё": None, "ёж": 1, "еж": 2 }
+		next = lambda node, letter: node + letter if node + letter in words else None
+		folding = Folding( alternatives = { "е": "ё" } )
+		self.assertEqual( find_nodes( next, "", "еж", folding ), [ ("еж", "еж"), ("ёж", "ёж") ] )
+		self.assertEqual( get_attr( next, words.get, "", "еж", folding ), 2 )
+		self.assertEqual( get_attr( next, words.get, "", "ёж", folding ), 1 )
+		self.assertEqual( parse_pairs( [ "е=ёэ" ] ), { "е": "ёэ" } )
+
+
+if __name__ == "__main__":
+	unittest.main()
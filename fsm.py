@@ -1,309 +1,875 @@
-#! python3
-
-import pickle
-
-START = "S"
-
-class FSM:
-
-	def __init__(self):
-		self.states = { START: {} }
-		self.final = set()
-		self.terminal_alphabet = set()
-
-	def has_state(self, name):
-		return name in self.states
-
-	def add_state(self, state_name):
-		if state_name in self.states:
-			raise Exception( "Error: State already in machine" )
-		self.states[state_name] = {}
-
-	def check_has_state(self, state_name):
-		if state_name not in self.states:
-			raise Exception( "Error: Unknown state: " + state_name )
-
-	def set_final(self, state_name):
-		self.check_has_state( state_name )
-		self.final.add( state_name )
-
-#------------------------------------------------------------------------------
-
-# Детерминированный КА.
-# Каждое состояние - { term_elem : state_name }
-# + set конечных состояний
-# + множество терминалов (алфавит)
-class DFA(FSM):
-
-	def add_trans(self, from_state, terminal, to_state):
-		self.terminal_alphabet.add( terminal )
-		self.check_has_state( from_state )
-		if not self.has_state( to_state ):
-			self.add_state( to_state )
-		if terminal in self.states[from_state] and self.states[from_state][terminal] != to_state:
-			print( from_state, terminal, to_state )
-			print( self.states[from_state][terminal] )
-			raise Exception( "Error. DFA already has transition: " + from_state  + " , " + str( terminal ) )
-		self.states[from_state][terminal] = to_state
-
-
-	def check(self, word):
-		current = START
-		for w in word:
-			if w not in self.terminal_alphabet:
-				raise Exception( "Error. Symbol not in terminal alphabet: " + w )
-			state = self.states[current]
-			if w not in state:
-				return False
-			current = state[w]
-			# детерминированность
-			assert isinstance( current, str )
-		return current in self.final
-
-	def serialize(self, out_stream):
-		pickler.dump( self, out_stream )
-
-	def deserialize( in_stream ):
-		return unpickler.load( in_stream )
-
-	# выводит себя в текстовый поток
-	def write_as_text(self, output):
-		for state_name in self.states.keys():
-			state = self.states[state_name]
-			for terminal in state.keys():
-				target = state[terminal]
-				output.write( state_name + " : " + str(terminal) + " -> " + target + "\n" )
-
-	def from_start(self):
-		return DFA.State( self, START )
-
-	# вложенный класс DFA.State для доступа к отдельным состояниям
-	class State:
-
-		def __init__(self, dfa, state_name):
-			self.dfa = dfa
-			self.state_name = state_name
-
-		def next(self, term):
-			state = self.dfa.states[self.state_name]
-			if term not in state:
-				return None
-			next_state = state[term]
-			# детерминированность
-			assert isinstance( next_state, str )
-			return DFA.State( self.dfa, next_state )
-
-		def is_final(self):
-			return self.state_name in self.dfa.final
-
-
-#------------------------------------------------------------------------------
-
-
-# Недетерминированный КА.
-# Каждое состояние - { term_elem : [state_names] }
-# + set конечных состояний
-# + множество терминалов (алфавит)
-class NFA(FSM):
-
-	def add_trans(self, from_state, terminal, to_state):
-		self.terminal_alphabet.add( terminal )
-		self.check_has_state( from_state )
-		if not self.has_state( to_state ):
-			self.add_state( to_state )
-		if terminal not in self.states[from_state]:
-			self.states[from_state][terminal] = []
-		if to_state not in self.states[from_state][terminal]:
-			self.states[from_state][terminal].append( to_state )
-
-
-	def check(self, word):
-		current = START
-		for w in word:
-			if w not in self.terminal_alphabet:
-				raise Exception( "Error. Symbol not in terminal alphabet: " + w )
-			state = self.states[current]
-			# print( w, state )
-			if w not in state:
-				return False
-			current = state[w]
-			if len( current ) > 1:
-				raise Exception( "Error. Checking by non-determinant NFA. Please, convert to_DFA.")
-			current = current[0]
-		return current in self.final
-
-
-	# пока не поддерживаем epsilon-переходы
-	def to_DFA(self):
-
-		# вспомогательная функция для кодирования имен сложных состояний
-		def mangle( names ):
-			names = sorted( names )
-			return "@" + "_".join( names )
-
-		dfa = DFA()
-		dfa.terminal_alphabet= self.terminal_alphabet
-		
-		processed = set()
-		# список к обработке [ (имя в новом автомате, [список имен состояний в старом автомате]) ]
-		states_to_process = [(START, [START])]
-		
-		while len( states_to_process ) > 0:
-			new_state, old_states = states_to_process.pop(0)
-			processed.add( new_state )
-			
-			transfers = {} # { terminal : [имена состояний]}
-			is_final = False
-			# перебираем старые состояния, которые объединяем в new_state
-			for old_state_name in old_states:
-				
-				# проверка, что объединение будет финализирующим состоянием
-				is_final |= (old_state_name in self.final)
-				
-				# объект состояния
-				old_state = self.states[old_state_name]
-				# перебираем все переходы
-				for term in old_state.keys():
-					if term not in transfers:
-						transfers[term] = []
-					# недетерминизм. по term имеется несколько альтернатив
-					for old_target_name in old_state[term]:
-						if old_target_name not in transfers[term]:
-							transfers[term].append( old_target_name )
-			
-			if is_final:
-				dfa.set_final( new_state )
-
-			for term in transfers.keys():
-				union_state = mangle( transfers[term] )
-				dfa.add_trans( new_state, term, union_state )
-				if union_state not in processed:
-					states_to_process.append( (union_state, transfers[term]) )
-
-		return dfa
-
-	# выводит себя в текстовый поток
-	def write_as_text(self, output):
-		for state_name in self.states.keys():
-			state = self.states[state_name]
-			for terminal in state.keys():
-				transfers = state[terminal]
-				for tr in transfers:
-					output.write( state_name + " : " + str(terminal) + " -> " + tr + "\n" )
-
-#------------------------------------------------------------------------------
-
-import unittest
-
-class TestNFA(unittest.TestCase):
-	def setUp(self):
-		fsm = NFA()
-		fsm.add_trans( START, "a", START )
-		fsm.add_trans( START, "b", START )
-		fsm.add_trans( START, "a", "Q1" )
-		fsm.add_trans( "Q1", "b", "Q2" )
-		fsm.set_final( "Q2" )
-
-		self.dfa = fsm.to_DFA()
-
-	def test_any_ab(self):
-		dfa = self.dfa
-
-		self.assertFalse( dfa.check( "" ) )
-		self.assertFalse( dfa.check( "a" ) )
-		self.assertFalse( dfa.check( "b" ) )
-		self.assertTrue( dfa.check( "ab" ) )
-		self.assertTrue( dfa.check( "aab" ) )
-		self.assertTrue( dfa.check( "bab" ) )
-		self.assertFalse( dfa.check( "aba" ) )
-		self.assertFalse( dfa.check( "bba" ) )
-
-	# проверяем интерфейс NFA.State
-	def test_per_state_interface(self):
-		dfa = self.dfa
-
-		state = dfa.from_start()
-		self.assertIsNotNone( state )
-		self.assertFalse( state.is_final() )
-		
-		state = state.next( "a" )
-		self.assertIsNotNone( state )
-		self.assertFalse( state.is_final() )
-
-		state = state.next( "a" )
-		self.assertIsNotNone( state )
-		self.assertFalse( state.is_final() )
-
-		state = state.next( "b" )
-		self.assertIsNotNone( state )
-		self.assertTrue( state.is_final() )
-
-
-	# автомат принимает число, первая цифра которого повторяется в этом числе
-	def test_any_digits_last_was_before(self):
-		fsm = NFA()
-		fsm.add_trans( START, "1", "Q1" )
-		fsm.add_trans( START, "2", "Q2" )
-		fsm.add_trans( START, "3", "Q3" )
-		fsm.add_trans( "Q1", "1", "F" )
-		fsm.add_trans( "Q2", "2", "F" )
-		fsm.add_trans( "Q3", "3", "F" )
-		fsm.add_trans( "Q1", "2", "Q1" )
-		fsm.add_trans( "Q1", "3", "Q1" )
-		fsm.add_trans( "Q2", "1", "Q2" )
-		fsm.add_trans( "Q2", "3", "Q2" )
-		fsm.add_trans( "Q3", "2", "Q3" )
-		fsm.add_trans( "Q3", "1", "Q3" )
-		fsm.add_trans( "F", "1", "F" )
-		fsm.add_trans( "F", "2", "F" )
-		fsm.add_trans( "F", "3", "F" )
-		fsm.set_final( "F" )
-
-		dfa = fsm.to_DFA()
-		
-		self.assertFalse( dfa.check( "123" ) )
-		self.assertFalse( dfa.check( "13" ) )
-		self.assertFalse( dfa.check( "2111111111" ) )
-		self.assertTrue( dfa.check( "11" ) )
-		self.assertTrue( dfa.check( "213213" ) )
-		self.assertTrue( dfa.check( "31111113" ) )
-		self.assertFalse( dfa.check( "213131313" ) )
-		self.assertFalse( dfa.check( "322221111" ) )
-
-	# автомат принимает число, первая цифра которого повторяется в этом числе
-	def test_number_terminal(self):
-		fsm = NFA()
-		fsm.add_trans( START, 1, "Q1" )
-		fsm.add_trans( START, 2, "Q2" )
-		fsm.add_trans( "Q1", 1, "F" )
-		fsm.add_trans( "Q2", 2, "F" )
-		fsm.add_trans( "Q1", 2, "Q1" )
-		fsm.add_trans( "Q2", 1, "Q2" )
-		fsm.add_trans( "F", 1, "F" )
-		fsm.add_trans( "F", 2, "F" )
-		fsm.set_final( "F" )
-
-		dfa = fsm.to_DFA()
-		
-		self.assertFalse( dfa.check( [1,2] ) )
-		self.assertFalse( dfa.check( [2,1] ) )
-		self.assertFalse( dfa.check( [2,1,1,1] ) )
-		self.assertTrue( dfa.check( [1,1] ) )
-		self.assertTrue( dfa.check( [2,1,2,1] ) )
-
-	def test_encoded(self):
-		enc = self.dfa.to_EncodedDFA()
-
-		a = ord("a")
-		b = ord("b")
-		self.assertFalse( enc.check( [] ) )
-		self.assertFalse( enc.check( [a] ) )
-		self.assertFalse( enc.check( [b] ) )
-		self.assertTrue( enc.check( [a,b] ) )
-		self.assertTrue( enc.check( [a, a, b] ) )
-		self.assertTrue( enc.check( [b, a, b] ) )
-		self.assertFalse( enc.check( [a, b, a] ) )
-		self.assertFalse( enc.check( [b, b, a] ) )
-
-if __name__ == "__main__":
+#! python3
+
+import pickle
+import array
+import collections
+import itertools
+import json
+
+try:
+	import numpy
+except ImportError:
+	# пакетная проверка работает и без numpy, но медленнее
+	numpy = None
+
+START = "S"
+
+# нет перехода (для пошагового интерфейса step)
+NoState = -1
+
+# пишет строки в поток пачками по chunk_size
+def write_lines( output, lines, chunk_size = 4096 ):
+	lines = iter( lines )
+	while True:
+		chunk = list( itertools.islice( lines, chunk_size ) )
+		if len( chunk ) == 0:
+			break
+		output.writelines( chunk )
+
+class FSM:
+
+	def __init__(self):
+		self.states = { START: {} }
+		self.final = set()
+		self.terminal_alphabet = set()
+
+	def has_state(self, name):
+		return name in self.states
+
+	def add_state(self, state_name):
+		if state_name in self.states:
+			raise Exception( "Error: State already in machine" )
+		self.states[state_name] = {}
+		self._cursor = None
+
+	def check_has_state(self, state_name):
+		if state_name not in self.states:
+			raise Exception( "Error: Unknown state: " + state_name )
+
+	def set_final(self, state_name):
+		self.check_has_state( state_name )
+		self.final.add( state_name )
+		self._cursor = None
+
+	# (from_state, terminal, to_state) для всех переходов
+	def iter_transitions(self):
+		for state_name, state in self.states.items():
+			for terminal, target in state.items():
+				# в NFA - список состояний, в DFA - одно имя
+				if isinstance( target, list ):
+					for tr in target:
+						yield (state_name, terminal, tr)
+				else:
+					yield (state_name, terminal, target)
+
+	# Дампы для отладки. Строки генерируются по одной и пишутся пачками (write_lines),
+	# так что большой автомат не собирается в памяти целиком
+
+	def iter_text_lines(self):
+		for (state_name, terminal, target) in self.iter_transitions():
+			yield state_name + " : " + str(terminal) + " -> " + target + "\n"
+
+	# выводит себя в текстовый поток
+	def write_as_text(self, output):
+		write_lines( output, self.iter_text_lines() )
+
+	# компактный дамп, по JSON-массиву на строку:
+	# ["T", from, terminal, to] - переход, ["F", state] - конечное состояние
+	def iter_jsonl_lines(self):
+		for transition in self.iter_transitions():
+			yield json.dumps( ["T"] + list( transition ), ensure_ascii=False, separators=(",", ":") ) + "\n"
+		for state_name in self.final:
+			yield json.dumps( ["F", state_name], ensure_ascii=False, separators=(",", ":") ) + "\n"
+
+	def write_as_jsonl(self, output):
+		write_lines( output, self.iter_jsonl_lines() )
+
+	# GraphViz: только состояния на расстоянии не больше radius переходов
+	# (в любую сторону) от center, не больше max_states состояний
+	def write_as_dot(self, output, center = START, radius = 2, max_states = 200):
+		self.check_has_state( center )
+		neighbours = {}
+		for (state_name, _terminal, target) in self.iter_transitions():
+			neighbours.setdefault( state_name, set() ).add( target )
+			neighbours.setdefault( target, set() ).add( state_name )
+
+		included = { center: 0 }
+		to_process = collections.deque( [center] )
+		while len( to_process ) > 0 and len( included ) < max_states:
+			state_name = to_process.popleft()
+			if included[state_name] >= radius:
+				continue
+			for n in sorted( neighbours.get( state_name, () ) ):
+				if n not in included and len( included ) < max_states:
+					included[n] = included[state_name] + 1
+					to_process.append( n )
+
+		# несколько терминалов между одной парой состояний - на одной стрелке
+		labels = {}
+		for (state_name, terminal, target) in self.iter_transitions():
+			if state_name in included and target in included:
+				labels.setdefault( (state_name, target), [] ).append( str( terminal ) )
+
+		def quote( text ):
+			return '"' + text.replace( "\\", "\\\\" ).replace( '"', '\\"' ) + '"'
+
+		lines = ["digraph fsm {\n", "\trankdir=LR;\n"]
+		for state_name in included:
+			shape = "doublecircle" if state_name in self.final else "circle"
+			style = ", style=bold" if state_name == center else ""
+			lines.append( "\t" + quote( state_name ) + " [shape=" + shape + style + "];\n" )
+		for (state_name, target), terminals in labels.items():
+			lines.append( "\t" + quote( state_name ) + " -> " + quote( target ) + " [label=" + quote( ",".join( terminals ) ) + "];\n" )
+		lines.append( "}\n" )
+		write_lines( output, lines )
+
+	def transitions_count(self):
+		count = 0
+		for state in self.states.values():
+			for target in state.values():
+				# в NFA - список состояний, в DFA - одно имя
+				count += len( target ) if isinstance( target, list ) else 1
+		return count
+
+#------------------------------------------------------------------------------
+
+# Детерминированный КА.
+# Каждое состояние - { term_elem : state_name }
+# + set конечных состояний
+# + множество терминалов (алфавит)
+class DFA(FSM):
+
+	# Классы символов: { внешний символ : терминал автомата }.
+	# None - символы подаются на вход как есть. Иначе check/step/State.next
+	# сначала переводят символ в его класс (см. split_terminals_to_tags)
+	symbol_map = None
+
+	def _symbol(self, symbol):
+		if self.symbol_map is None:
+			return symbol
+		return self.symbol_map.get( symbol, None )
+
+	def add_trans(self, from_state, terminal, to_state):
+		self.terminal_alphabet.add( terminal )
+		self.check_has_state( from_state )
+		if not self.has_state( to_state ):
+			self.add_state( to_state )
+		if terminal in self.states[from_state] and self.states[from_state][terminal] != to_state:
+			print( from_state, terminal, to_state )
+			print( self.states[from_state][terminal] )
+			raise Exception( "Error. DFA already has transition: " + from_state  + " , " + str( terminal ) )
+		self.states[from_state][terminal] = to_state
+		self._cursor = None
+
+
+	def check(self, word):
+		current = START
+		symbol_map = self.symbol_map
+		for w in word:
+			if symbol_map is not None:
+				if w not in symbol_map:
+					raise Exception( "Error. Symbol not in terminal alphabet: " + str( w ) )
+				w = symbol_map[w]
+			next_name = self.states[current].get( w, None )
+			if next_name is None:
+				# алфавит проверяем только при отсутствии перехода
+				if w not in self.terminal_alphabet:
+					raise Exception( "Error. Symbol not in terminal alphabet: " + str( w ) )
+				return False
+			current = next_name
+		return current in self.final
+
+
+	# Пошаговый интерфейс без создания объектов: состояние - целое число,
+	# start_state() - начальное, step() возвращает следующее или NoState.
+	# Таблицы строятся при первом обращении и сбрасываются при изменении автомата
+	def _cursor_tables(self):
+		cursor = getattr( self, "_cursor", None )
+		if cursor is None:
+			names = [START] + [name for name in self.states.keys() if name != START]
+			numbers = { name: i for i, name in enumerate( names ) }
+			transitions = [{ term: numbers[target] for term, target in self.states[name].items() } for name in names]
+			final = [name in self.final for name in names]
+			cursor = (names, transitions, final)
+			self._cursor = cursor
+		return cursor
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state["_cursor"] = None
+		return state
+
+	def start_state(self):
+		return 0
+
+	def step(self, state, symbol):
+		if self.symbol_map is not None:
+			symbol = self.symbol_map.get( symbol, None )
+		return self._cursor_tables()[1][state].get( symbol, NoState )
+
+	def is_accepting(self, state):
+		return self._cursor_tables()[2][state]
+
+	def state_name(self, state):
+		return self._cursor_tables()[0][state]
+
+	# длина самого длинного принимаемого префикса или -1
+	def longest_accepting_prefix(self, word):
+		_names, transitions, final = self._cursor_tables()
+		if self.symbol_map is not None:
+			word = [self._symbol( w ) for w in word]
+		return longest_accepting_prefix( lambda state, symbol: transitions[state].get( symbol, NoState ), final.__getitem__, 0, word )
+
+	def serialize(self, out_stream):
+		pickle.dump( self, out_stream )
+
+	@staticmethod
+	def deserialize( in_stream ):
+		return pickle.load( in_stream )
+
+	# + классы символов
+	def iter_text_lines(self):
+		yield from FSM.iter_text_lines( self )
+		if self.symbol_map is not None:
+			for symbol, terminal in self.symbol_map.items():
+				yield str(symbol) + " => " + str(terminal) + "\n"
+
+	# + ["M", symbol, terminal] - класс символа
+	def iter_jsonl_lines(self):
+		yield from FSM.iter_jsonl_lines( self )
+		if self.symbol_map is not None:
+			for symbol, terminal in self.symbol_map.items():
+				yield json.dumps( ["M", symbol, terminal], ensure_ascii=False, separators=(",", ":") ) + "\n"
+
+	def from_start(self):
+		return DFA.State( self, START )
+
+	# Сжатие алфавита: терминалы, которые в каждом состоянии ведут в одно и то же
+	# состояние (или никуда), объединяются в класс. Возвращает (новый DFA, отчет).
+	# Новый DFA работает над номерами классов, symbol_map переводит в них исходные символы
+	def compress_alphabet(self):
+		# сигнатура терминала - все его переходы: [(номер состояния, цель)]
+		signatures = { t: [] for t in self.terminal_alphabet }
+		for i, state in enumerate( self.states.values() ):
+			for terminal, target in state.items():
+				signatures[terminal].append( (i, target) )
+
+		classes = {} # { сигнатура : номер класса }
+		terminal_class = {}
+		for terminal in sorted( self.terminal_alphabet, key=str ):
+			signature = tuple( signatures[terminal] )
+			if signature not in classes:
+				classes[signature] = len( classes )
+			terminal_class[terminal] = classes[signature]
+
+		dfa = DFA()
+		dfa.terminal_alphabet = set( classes.values() )
+		for name, state in self.states.items():
+			if name not in dfa.states:
+				dfa.add_state( name )
+			for terminal, target in state.items():
+				dfa.add_trans( name, terminal_class[terminal], target )
+		for name in self.final:
+			dfa.set_final( name )
+		if self.symbol_map is None:
+			dfa.symbol_map = terminal_class
+		else:
+			dfa.symbol_map = { s: terminal_class[t] for s, t in self.symbol_map.items() if t in terminal_class }
+
+		states = len( self.states )
+		before = states * len( self.terminal_alphabet )
+		# таблица (состояние, класс) плюс отображение символ -> класс
+		after = states * len( classes ) + len( dfa.symbol_map )
+		report = {
+			"states": states,
+			"symbols": len( dfa.symbol_map ),
+			"terminals": len( self.terminal_alphabet ),
+			"classes": len( classes ),
+			"table_cells_before": before,
+			"table_cells_after": after,
+			"savings": 1.0 - after / before if before > 0 else 0.0,
+		}
+		return dfa, report
+
+	# плотная таблица переходов над целыми кодами символов.
+	# compress_alphabet - столбцы по классам символов (см. compress_alphabet)
+	def to_EncodedDFA(self, compress_alphabet = False):
+		if compress_alphabet:
+			return self.compress_alphabet()[0].to_EncodedDFA()
+		# START всегда получает номер 0
+		names = [START] + [name for name in self.states.keys() if name != START]
+		numbers = { name: i for i, name in enumerate( names ) }
+		# столбец таблицы - терминал автомата (с symbol_map - класс символов)
+		terminals = sorted( self.terminal_alphabet, key=str )
+		columns = { t: i for i, t in enumerate( terminals ) }
+		width = len( terminals )
+		if self.symbol_map is None:
+			code_columns = { encode_symbol( t ): columns[t] for t in terminals }
+		else:
+			code_columns = { encode_symbol( s ): columns[t] for s, t in self.symbol_map.items() if t in columns }
+
+		table = array.array( "i", [EncodedDFA.NoState] ) * (len( names ) * width)
+		for name, state in self.states.items():
+			row = numbers[name] * width
+			for terminal, target in state.items():
+				table[row + columns[terminal]] = numbers[target]
+		final = [name in self.final for name in names]
+		return EncodedDFA( code_columns, width, table, final )
+
+	# вложенный класс DFA.State для доступа к отдельным состояниям
+	class State:
+
+		def __init__(self, dfa, state_name):
+			self.dfa = dfa
+			self.state_name = state_name
+
+		def next(self, term):
+			state = self.dfa.states[self.state_name]
+			term = self.dfa._symbol( term )
+			if term not in state:
+				return None
+			return DFA.State( self.dfa, state[term] )
+
+		def is_final(self):
+			return self.state_name in self.dfa.final
+
+
+#------------------------------------------------------------------------------
+
+def longest_accepting_prefix( step, is_accepting, state, word ):
+	longest = 0 if is_accepting( state ) else -1
+	for i, symbol in enumerate( word ):
+		state = step( state, symbol )
+		if state == NoState:
+			break
+		if is_accepting( state ):
+			longest = i + 1
+	return longest
+
+
+# Код символа для EncodedDFA: числа как есть, односимвольные строки - ord
+def encode_symbol( symbol ):
+	if isinstance( symbol, int ):
+		return symbol
+	if isinstance( symbol, str ) and len( symbol ) == 1:
+		return ord( symbol )
+	raise ValueError( "Error. Can't encode symbol: " + str( symbol ) )
+
+
+# Набор последовательностей разной длины в плоском виде: (symbols, offsets),
+# i-я последовательность - symbols[offsets[i] : offsets[i+1]]
+def pack_sequences( sequences ):
+	symbols = []
+	offsets = [0]
+	for seq in sequences:
+		symbols.extend( encode_symbol( s ) for s in seq )
+		offsets.append( len( symbols ) )
+	return symbols, offsets
+
+
+# ДКА в виде плотной таблицы: состояния - номера (START = 0), символы - целые коды.
+# table[state * width + column] - номер следующего состояния или NoState
+class EncodedDFA:
+
+	NoState = NoState
+
+	# columns - { код символа : столбец }, несколько кодов могут делить столбец
+	def __init__(self, columns, width, table, final):
+		self.codes = sorted( columns.keys() )
+		self.columns = columns
+		self.width = width
+		self.table = table
+		self.final = final
+		self.states_count = len( final )
+		self._vectorized = None
+
+
+	# в отличие от DFA.check неизвестный символ - просто отказ
+	def check(self, codes):
+		width = self.width
+		state = 0
+		for code in codes:
+			column = self.columns.get( code, None )
+			if column is None:
+				return False
+			state = self.table[state * width + column]
+			if state == EncodedDFA.NoState:
+				return False
+		return self.final[state]
+
+
+	def start_state(self):
+		return 0
+
+	def step(self, state, code):
+		column = self.columns.get( code, None )
+		if column is None:
+			return NoState
+		return self.table[state * self.width + column]
+
+	def is_accepting(self, state):
+		return self.final[state]
+
+	def longest_accepting_prefix(self, codes):
+		return longest_accepting_prefix( self.step, self.is_accepting, 0, codes )
+
+
+	# Проверка сразу многих последовательностей (см. pack_sequences).
+	# С numpy все последовательности продвигаются по таблице одновременно,
+	# на каждом шаге - одна векторная выборка. Возвращает маску принятых
+	def check_batch(self, symbols, offsets, vectorized = None):
+		if vectorized is None:
+			vectorized = numpy is not None
+		if not vectorized:
+			return [self.check( symbols[offsets[i]:offsets[i + 1]] ) for i in range( len( offsets ) - 1 )]
+
+		table, final, codes, code_columns = self._vectorized_tables()
+		symbols = numpy.asarray( symbols, dtype=numpy.int64 )
+		offsets = numpy.asarray( offsets, dtype=numpy.int64 )
+		unknown_column = self.width
+
+		# коды -> столбцы, неизвестные символы - в отдельный столбец, ведущий в тупик
+		positions = numpy.searchsorted( codes, symbols )
+		found = positions < len( codes )
+		found[found] = codes[positions[found]] == symbols[found]
+		columns = numpy.full( len( symbols ), unknown_column, dtype=numpy.int64 )
+		columns[found] = code_columns[positions[found]]
+
+		starts = offsets[:-1]
+		lengths = offsets[1:] - starts
+		# длинные последовательности вперед: активные на шаге t - это префикс order
+		order = numpy.argsort( -lengths, kind="stable" )
+		starts = starts[order]
+		lengths = lengths[order]
+		state = numpy.zeros( len( lengths ), dtype=numpy.int64 )
+		max_length = int( lengths[0] ) if len( lengths ) > 0 else 0
+		for t in range( max_length ):
+			active = int( numpy.count_nonzero( lengths > t ) )
+			state[:active] = table[state[:active], columns[starts[:active] + t]]
+
+		result = numpy.empty( len( lengths ), dtype=bool )
+		result[order] = final[state]
+		return result
+
+
+	# таблица (состояния + тупик) x (столбцы + неизвестный символ)
+	def _vectorized_tables(self):
+		if self._vectorized is None:
+			width = self.width
+			dead_state = self.states_count
+			table = numpy.full( (self.states_count + 1, width + 1), dead_state, dtype=numpy.int64 )
+			dense = numpy.asarray( self.table, dtype=numpy.int64 ).reshape( self.states_count, width )
+			table[:self.states_count, :width] = numpy.where( dense == EncodedDFA.NoState, dead_state, dense )
+			final = numpy.zeros( self.states_count + 1, dtype=bool )
+			final[:self.states_count] = self.final
+			codes = numpy.asarray( self.codes, dtype=numpy.int64 )
+			code_columns = numpy.asarray( [self.columns[c] for c in self.codes], dtype=numpy.int64 )
+			self._vectorized = (table, final, codes, code_columns)
+		return self._vectorized
+
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state["_vectorized"] = None
+		return state
+
+
+#------------------------------------------------------------------------------
+
+
+# Недетерминированный КА.
+# Каждое состояние - { term_elem : [state_names] }
+# + set конечных состояний
+# + множество терминалов (алфавит)
+class NFA(FSM):
+
+	def add_trans(self, from_state, terminal, to_state):
+		self.terminal_alphabet.add( terminal )
+		self.check_has_state( from_state )
+		if not self.has_state( to_state ):
+			self.add_state( to_state )
+		if terminal not in self.states[from_state]:
+			self.states[from_state][terminal] = []
+		if to_state not in self.states[from_state][terminal]:
+			self.states[from_state][terminal].append( to_state )
+
+
+	def check(self, word):
+		current = START
+		for w in word:
+			if w not in self.terminal_alphabet:
+				raise Exception( "Error. Symbol not in terminal alphabet: " + w )
+			state = self.states[current]
+			# print( w, state )
+			if w not in state:
+				return False
+			current = state[w]
+			if len( current ) > 1:
+				raise Exception( "Error. Checking by non-determinant NFA. Please, convert to_DFA.")
+			current = current[0]
+		return current in self.final
+
+
+	# пока не поддерживаем epsilon-переходы
+	def to_DFA(self):
+
+		# вспомогательная функция для кодирования имен сложных состояний
+		def mangle( names ):
+			names = sorted( names )
+			return "@" + "_".join( names )
+
+		dfa = DFA()
+		dfa.terminal_alphabet= self.terminal_alphabet
+		
+		processed = set()
+		# список к обработке [ (имя в новом автомате, [список имен состояний в старом автомате]) ]
+		states_to_process = [(START, [START])]
+		
+		while len( states_to_process ) > 0:
+			new_state, old_states = states_to_process.pop(0)
+			processed.add( new_state )
+			
+			transfers = {} # { terminal : [имена состояний]}
+			is_final = False
+			# перебираем старые состояния, которые объединяем в new_state
+			for old_state_name in old_states:
+				
+				# проверка, что объединение будет финализирующим состоянием
+				is_final |= (old_state_name in self.final)
+				
+				# объект состояния
+				old_state = self.states[old_state_name]
+				# перебираем все переходы
+				for term in old_state.keys():
+					if term not in transfers:
+						transfers[term] = []
+					# недетерминизм. по term имеется несколько альтернатив
+					for old_target_name in old_state[term]:
+						if old_target_name not in transfers[term]:
+							transfers[term].append( old_target_name )
+			
+			if is_final:
+				dfa.set_final( new_state )
+
+			for term in transfers.keys():
+				union_state = mangle( transfers[term] )
+				dfa.add_trans( new_state, term, union_state )
+				if union_state not in processed:
+					states_to_process.append( (union_state, transfers[term]) )
+
+		return dfa
+
+	# ДКА, который строится по ходу проверки (см. LazyDFA)
+	def to_lazy_DFA(self, max_states = 100000):
+		return LazyDFA( self, max_states )
+
+
+#------------------------------------------------------------------------------
+
+# Ленивая детерминизация: состояния ДКА (множества состояний NFA) строятся
+# только когда до них доходит проверка. Найденные состояния и их переходы хранятся
+# в таблице не более чем из max_states записей, давно не использованные вытесняются
+# и при необходимости строятся заново. Интерфейс как у DFA: check, from_start, State
+class LazyDFA:
+
+	def __init__(self, nfa, max_states = 100000):
+		self.nfa = nfa
+		self.terminal_alphabet = nfa.terminal_alphabet
+		self.max_states = max_states
+		# { frozenset(имена NFA) : (is_final, { terminal : frozenset или None }) }
+		self.cache = collections.OrderedDict()
+		self.built = 0
+		self.evicted = 0
+		self.start = frozenset( [START] )
+
+
+	def _entry(self, subset):
+		entry = self.cache.get( subset, None )
+		if entry is not None:
+			self.cache.move_to_end( subset )
+			return entry
+		entry = (any( name in self.nfa.final for name in subset ), {})
+		self.cache[subset] = entry
+		self.built += 1
+		if len( self.cache ) > self.max_states:
+			self.cache.popitem( last=False )
+			self.evicted += 1
+		return entry
+
+
+	def next_subset(self, subset, term):
+		transitions = self._entry( subset )[1]
+		if term in transitions:
+			return transitions[term]
+		targets = set()
+		for name in subset:
+			targets.update( self.nfa.states[name].get( term, () ) )
+		target = frozenset( targets ) if len( targets ) > 0 else None
+		transitions[term] = target
+		return target
+
+
+	def is_final_subset(self, subset):
+		return self._entry( subset )[0]
+
+
+	# пошаговый интерфейс как у DFA, состояние - frozenset
+	def start_state(self):
+		return self.start
+
+	def step(self, state, symbol):
+		target = self.next_subset( state, symbol )
+		return target if target is not None else NoState
+
+	def is_accepting(self, state):
+		return self.is_final_subset( state )
+
+	def longest_accepting_prefix(self, word):
+		return longest_accepting_prefix( self.step, self.is_accepting, self.start, word )
+
+
+	def check(self, word):
+		current = self.start
+		for w in word:
+			if w not in self.terminal_alphabet:
+				raise Exception( "Error. Symbol not in terminal alphabet: " + str( w ) )
+			current = self.next_subset( current, w )
+			if current is None:
+				return False
+		return self.is_final_subset( current )
+
+
+	def from_start(self):
+		return LazyDFA.State( self, self.start )
+
+
+	class State:
+
+		def __init__(self, dfa, subset):
+			self.dfa = dfa
+			self.subset = subset
+
+		# имя как у состояний NFA.to_DFA
+		@property
+		def state_name(self):
+			if self.subset == self.dfa.start:
+				return START
+			return "@" + "_".join( sorted( self.subset ) )
+
+		def next(self, term):
+			subset = self.dfa.next_subset( self.subset, term )
+			if subset is None:
+				return None
+			return LazyDFA.State( self.dfa, subset )
+
+		def is_final(self):
+			return self.dfa.is_final_subset( self.subset )
+
+
+#------------------------------------------------------------------------------
+
+import unittest
+
+class TestNFA(unittest.TestCase):
+	def setUp(self):
+		fsm = NFA()
+		fsm.add_trans( START, "a", START )
+		fsm.add_trans( START, "b", START )
+		fsm.add_trans( START, "a", "Q1" )
+		fsm.add_trans( "Q1", "b", "Q2" )
+		fsm.set_final( "Q2" )
+
+		self.nfa = fsm
+		self.dfa = fsm.to_DFA()
+
+	def test_any_ab(self):
+		dfa = self.dfa
+
+		self.assertFalse( dfa.check( "" ) )
+		self.assertFalse( dfa.check( "a" ) )
+		self.assertFalse( dfa.check( "b" ) )
+		self.assertTrue( dfa.check( "ab" ) )
+		self.assertTrue( dfa.check( "aab" ) )
+		self.assertTrue( dfa.check( "bab" ) )
+		self.assertFalse( dfa.check( "aba" ) )
+		self.assertFalse( dfa.check( "bba" ) )
+
+	# проверяем интерфейс NFA.State
+	def test_per_state_interface(self):
+		dfa = self.dfa
+
+		state = dfa.from_start()
+		self.assertIsNotNone( state )
+		self.assertFalse( state.is_final() )
+		
+		state = state.next( "a" )
+		self.assertIsNotNone( state )
+		self.assertFalse( state.is_final() )
+
+		state = state.next( "a" )
+		self.assertIsNotNone( state )
+		self.assertFalse( state.is_final() )
+
+		state = state.next( "b" )
+		self.assertIsNotNone( state )
+		self.assertTrue( state.is_final() )
+
+
+	# автомат принимает число, первая цифра которого повторяется в этом числе
+	def test_any_digits_last_was_before(self):
+		fsm = NFA()
+		fsm.add_trans( START, "1", "Q1" )
+		fsm.add_trans( START, "2", "Q2" )
+		fsm.add_trans( START, "3", "Q3" )
+		fsm.add_trans( "Q1", "1", "F" )
+		fsm.add_trans( "Q2", "2", "F" )
+		fsm.add_trans( "Q3", "3", "F" )
+		fsm.add_trans( "Q1", "2", "Q1" )
+		fsm.add_trans( "Q1", "3", "Q1" )
+		fsm.add_trans( "Q2", "1", "Q2" )
+		fsm.add_trans( "Q2", "3", "Q2" )
+		fsm.add_trans( "Q3", "2", "Q3" )
+		fsm.add_trans( "Q3", "1", "Q3" )
+		fsm.add_trans( "F", "1", "F" )
+		fsm.add_trans( "F", "2", "F" )
+		fsm.add_trans( "F", "3", "F" )
+		fsm.set_final( "F" )
+
+		dfa = fsm.to_DFA()
+		
+		self.assertFalse( dfa.check( "123" ) )
+		self.assertFalse( dfa.check( "13" ) )
+		self.assertFalse( dfa.check( "2111111111" ) )
+		self.assertTrue( dfa.check( "11" ) )
+		self.assertTrue( dfa.check( "213213" ) )
+		self.assertTrue( dfa.check( "31111113" ) )
+		self.assertFalse( dfa.check( "213131313" ) )
+		self.assertFalse( dfa.check( "322221111" ) )
+
+	# автомат принимает число, первая цифра которого повторяется в этом числе
+	def test_number_terminal(self):
+		fsm = NFA()
+		fsm.add_trans( START, 1, "Q1" )
+		fsm.add_trans( START, 2, "Q2" )
+		fsm.add_trans( "Q1", 1, "F" )
+		fsm.add_trans( "Q2", 2, "F" )
+		fsm.add_trans( "Q1", 2, "Q1" )
+		fsm.add_trans( "Q2", 1, "Q2" )
+		fsm.add_trans( "F", 1, "F" )
+		fsm.add_trans( "F", 2, "F" )
+		fsm.set_final( "F" )
+
+		dfa = fsm.to_DFA()
+		
+		self.assertFalse( dfa.check( [1,2] ) )
+		self.assertFalse( dfa.check( [2,1] ) )
+		self.assertFalse( dfa.check( [2,1,1,1] ) )
+		self.assertTrue( dfa.check( [1,1] ) )
+		self.assertTrue( dfa.check( [2,1,2,1] ) )
+
+	def test_encoded(self):
+		enc = self.dfa.to_EncodedDFA()
+
+		a = ord("a")
+		b = ord("b")
+		self.assertFalse( enc.check( [] ) )
+		self.assertFalse( enc.check( [a] ) )
+		self.assertFalse( enc.check( [b] ) )
+		self.assertTrue( enc.check( [a,b] ) )
+		self.assertTrue( enc.check( [a, a, b] ) )
+		self.assertTrue( enc.check( [b, a, b] ) )
+		self.assertFalse( enc.check( [a, b, a] ) )
+		self.assertFalse( enc.check( [b, b, a] ) )
+
+	def test_lazy_dfa(self):
+		fsm = NFA()
+		fsm.add_trans( START, "a", START )
+		fsm.add_trans( START, "b", START )
+		fsm.add_trans( START, "a", "Q1" )
+		fsm.add_trans( "Q1", "b", "Q2" )
+		fsm.set_final( "Q2" )
+		lazy = fsm.to_lazy_DFA( max_states = 2 )
+		for word in [ "", "a", "b", "ab", "aab", "bab", "aba", "bba", "abab", "bbbbbbab" ]:
+			self.assertEqual( lazy.check( word ), self.dfa.check( word ), word )
+		self.assertLessEqual( len( lazy.cache ), 2 )
+		self.assertGreater( lazy.evicted, 0 )
+
+		state = lazy.from_start().next( "a" ).next( "b" )
+		self.assertTrue( state.is_final() )
+		self.assertIsNone( lazy.from_start().next( "c" ) )
+
+	def test_cursor(self):
+		enc = self.dfa.to_EncodedDFA()
+		lazy = self.nfa.to_lazy_DFA()
+		for machine, encode in [ (self.dfa, str), (enc, ord), (lazy, str) ]:
+			state = machine.start_state()
+			self.assertFalse( machine.is_accepting( state ) )
+			state = machine.step( state, encode( "a" ) )
+			state = machine.step( state, encode( "b" ) )
+			self.assertTrue( machine.is_accepting( state ) )
+			self.assertEqual( machine.step( state, encode( "c" ) ), NoState )
+			word = [ encode( c ) for c in "babbaba" ]
+			self.assertEqual( machine.longest_accepting_prefix( word ), 6 )
+			self.assertEqual( machine.longest_accepting_prefix( word[:2] ), -1 )
+
+	def test_cursor_after_change(self):
+		dfa = DFA()
+		dfa.add_trans( START, "a", "F" )
+		self.assertEqual( dfa.step( dfa.start_state(), "a" ), 1 )
+		self.assertFalse( dfa.is_accepting( 1 ) )
+		dfa.set_final( "F" )
+		self.assertTrue( dfa.is_accepting( 1 ) )
+		self.assertEqual( dfa.state_name( 1 ), "F" )
+
+	def test_compress_alphabet(self):
+		fsm = NFA()
+		for digit in "0123456789":
+			fsm.add_trans( START, digit, "N" )
+			fsm.add_trans( "N", digit, "N" )
+		for letter in "abc":
+			fsm.add_trans( "N", letter, "F" )
+		fsm.add_trans( "F", "a", "F" )
+		fsm.set_final( "F" )
+		dfa = fsm.to_DFA()
+		compressed, report = dfa.compress_alphabet()
+		# цифры, "a", "b" и "c" вместе
+		self.assertEqual( report["classes"], 3 )
+		self.assertEqual( report["terminals"], 13 )
+		self.assertLess( report["table_cells_after"], report["table_cells_before"] )
+		enc = dfa.to_EncodedDFA( compress_alphabet = True )
+		self.assertEqual( enc.width, 3 )
+		for word in [ "1a", "12b", "1ca", "1cb", "a1", "", "5", "9aaa" ]:
+			self.assertEqual( compressed.check( word ), dfa.check( word ), word )
+			self.assertEqual( enc.check( [ ord( c ) for c in word ] ), dfa.check( word ), word )
+
+	def test_dumps(self):
+		import io
+		text = io.StringIO()
+		self.nfa.write_as_text( text )
+		self.assertIn( "S : a -> Q1\n", text.getvalue() )
+		self.assertEqual( len( text.getvalue().splitlines() ), self.nfa.transitions_count() )
+
+		jsonl = io.StringIO()
+		self.dfa.write_as_jsonl( jsonl )
+		records = [ json.loads( line ) for line in jsonl.getvalue().splitlines() ]
+		self.assertEqual( len( [ r for r in records if r[0] == "T" ] ), self.dfa.transitions_count() )
+		self.assertEqual( [ r[1] for r in records if r[0] == "F" ], list( self.dfa.final ) )
+
+		dot = io.StringIO()
+		self.nfa.write_as_dot( dot, "Q2", radius = 1 )
+		self.assertIn( '"Q1" -> "Q2" [label="b"]', dot.getvalue() )
+		self.assertIn( '"Q2" [shape=doublecircle, style=bold]', dot.getvalue() )
+		self.assertNotIn( '"S"', dot.getvalue() )
+
+	def test_encoded_batch(self):
+		enc = self.dfa.to_EncodedDFA()
+		words = [ "", "a", "ab", "aab", "bab", "aba", "bba", "abc", "bbbbab" ]
+		expected = [ False, False, True, True, True, False, False, False, True ]
+		symbols, offsets = pack_sequences( words )
+		self.assertEqual( list( enc.check_batch( symbols, offsets, vectorized = False ) ), expected )
+		if numpy is not None:
+			self.assertEqual( list( enc.check_batch( symbols, offsets, vectorized = True ) ), expected )
+			self.assertEqual( list( enc.check_batch( [], [0], vectorized = True ) ), [] )
+
+if __name__ == "__main__":
 	unittest.main()
\ No newline at end of file
@@ -0,0 +1,160 @@
+#! python3
+
+import heapq
+import dictionary as dic
+import folding as fold
+
+# Словарь из нескольких слоев: большой базовый DAWG (обычно mmap) и небольшие
+# дополнения DicTree поверх него. Верхний слой перекрывает нижние.
+# Удаление слова - "надгробие" (Tombstone) в верхнем слое, базовый файл не меняется.
+# Свертка слов (folding) у всех слоев та же, что у базового словаря: иначе слово
+# и его надгробие попали бы в разные слои в разном виде.
+class LayeredDictionary:
+
+	Tombstone = -2
+
+	def __init__(self, base, overlays = None):
+		self.base = base
+		# в порядке снизу вверх
+		self.overlays = []
+		for overlay in overlays or []:
+			self.add_overlay( overlay )
+
+
+	@staticmethod
+	def open(path, overlays = None):
+		return LayeredDictionary( dic.DicReader.open( path ), overlays )
+
+
+	def close(self):
+		if isinstance( self.base, dic.DicReader ):
+			self.base.close()
+
+
+	# слои сверху вниз
+	def layers(self):
+		return list( reversed( self.overlays ) ) + [self.base]
+
+
+	@property
+	def folding(self):
+		return getattr( self.base, "folding", None )
+
+
+	def add_overlay(self, overlay = None):
+		if overlay is None:
+			overlay = dic.DicTree( folding = self.folding )
+		elif getattr( overlay, "folding", None ) != self.folding:
+			raise ValueError( "Overlay folding differs from the base dictionary" )
+		self.overlays.append( overlay )
+		return overlay
+
+
+	def top_overlay(self):
+		if len( self.overlays ) == 0:
+			return self.add_overlay()
+		return self.overlays[-1]
+
+
+	def add_word(self, word, attr = dic.DicNode.EmptyLeaf):
+		self.top_overlay().add_word( word, attr )
+
+
+	def remove_word(self, word):
+		if not self.check_word( word ):
+			return False
+		self.top_overlay().add_word( word, LayeredDictionary.Tombstone )
+		return True
+
+
+	def get_attr(self, word):
+		for layer in self.layers():
+			attr = layer.get_attr( word )
+			if attr is not None:
+				return attr if attr != LayeredDictionary.Tombstone else None
+		return None
+
+
+	def check_word(self, word):
+		return self.get_attr( word ) is not None
+
+
+	# слияние отсортированных потоков слов всех слоев.
+	# Для одинаковых слов первым приходит верхний слой - он и решает
+	def iter_words(self, prefix = ""):
+		def tagged( layer_index, words ):
+			for (word, attr) in words:
+				yield (word, layer_index, attr)
+
+		streams = [tagged( i, layer.iter_words( prefix ) ) for i, layer in enumerate( self.layers() )]
+		previous = None
+		for (word, _layer_index, attr) in heapq.merge( *streams ):
+			if word == previous:
+				continue
+			previous = word
+			if attr != LayeredDictionary.Tombstone:
+				yield (word, attr)
+
+
+####################################################################################################
+
+import unittest
+import os
+import tempfile
+
+class TestLayeredDictionary(unittest.TestCase):
+	def setUp(self):
+		builder = dic.DicDawgBuilder()
+		builder.add_word( "any", 1 )
+		builder.add_word( "anyone", 2 )
+		builder.add_word( "someone", 2 )
+		fd, self.path = tempfile.mkstemp( suffix = "_dic.dawg" )
+		with os.fdopen( fd, "wb" ) as out:
+			out.write( builder.build().serialize() )
+		self.dic = LayeredDictionary.open( self.path )
+
+	def tearDown(self):
+		self.dic.close()
+		os.remove( self.path )
+
+	def test_base_only(self):
+		self.assertTrue( self.dic.check_word( "anyone" ) )
+		self.assertFalse( self.dic.check_word( "anyo" ) )
+		self.assertEqual( self.dic.get_attr( "any" ), 1 )
+
+	def test_overlays(self):
+		self.dic.add_word( "anybody", 3 )
+		self.assertTrue( self.dic.remove_word( "anyone" ) )
+		self.assertFalse( self.dic.remove_word( "nobody" ) )
+
+		self.dic.add_overlay()
+		self.dic.add_word( "any", 4 )
+
+		self.assertTrue( self.dic.check_word( "anybody" ) )
+		self.assertFalse( self.dic.check_word( "anyone" ) )
+		self.assertEqual( self.dic.get_attr( "any" ), 4 )
+		self.assertEqual( list( self.dic.iter_words( "any" ) ), [ ("any", 4), ("anybody", 3) ] )
+		self.assertEqual( list( self.dic.iter_words() ), [ ("any", 4), ("anybody", 3), ("someone", 2) ] )
+
+		# вернуть удаленное слово
+		self.dic.add_word( "anyone", 5 )
+		self.assertEqual( self.dic.get_attr( "anyone" ), 5 )
+
+	def test_folded_base(self):
+		builder = dic.DicDawgBuilder()
+		builder.add_word( "ежик", 1 )
+		builder.add_word( "кот", 2 )
+		base = builder.build()
+		base.folding = fold.Folding( lower = True, char_map = { "ё": "е" } )
+		layered = LayeredDictionary( dic.DicReader( base.serialize() ) )
+		self.assertTrue( layered.remove_word( "Ёжик" ) )
+		self.assertIsNone( layered.get_attr( "ежик" ) )
+		layered.add_word( "Ёлка", 5 )
+		self.assertEqual( layered.get_attr( "елка" ), 5 )
+		self.assertEqual( list( layered.iter_words() ), [ ("елка", 5), ("кот", 2) ] )
+		with self.assertRaises( ValueError ):
+			layered.add_overlay( dic.DicTree() )
+
+
+if __name__ == "__main__":
+	unittest.main()
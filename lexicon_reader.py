@@ -0,0 +1,177 @@
+#! python3
+
+import sys
+import io
+import os
+import codecs
+import gzip
+import lzma
+import bz2
+
+# Потоковое чтение словарных файлов: файл или stdin (в том числе pipe),
+# сжатие gzip/xz/bz2 определяется по сигнатуре, кодировка - по BOM.
+# Прогресс считается в байтах исходного (сжатого) потока.
+
+ChunkSize = 1 << 20
+
+# сигнатура, название, распаковка
+Compressions = [
+	(b"\x1f\x8b", "gzip", lambda stream: gzip.GzipFile( fileobj = stream )),
+	(b"\xfd7zXZ\x00", "xz", lzma.LZMAFile),
+	(b"BZh", "bz2", bz2.BZ2File),
+]
+
+# BOM -> кодировка (декодер сам пропускает BOM)
+BOMs = [
+	(codecs.BOM_UTF8, "utf-8-sig"),
+	(codecs.BOM_UTF16_LE, "utf-16"),
+	(codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+
+# считает байты, прочитанные из исходного потока
+class CountingStream(io.RawIOBase):
+
+	def __init__(self, stream):
+		self.stream = stream
+		self.bytes_read = 0
+
+	def readable(self):
+		return True
+
+	def readinto(self, buffer):
+		data = self.stream.read( len( buffer ) )
+		n = len( data )
+		buffer[:n] = data
+		self.bytes_read += n
+		return n
+
+
+# (название, распаковка) или (None, None)
+def detect_compression( stream ):
+	head = stream.peek( 6 )[:6]
+	for (magic, name, decompressor) in Compressions:
+		if head.startswith( magic ):
+			if magic == b"BZh" and not head[3:4].isdigit():
+				continue
+			return name, decompressor
+	return None, None
+
+
+def detect_encoding( head, default ):
+	for (bom, encoding) in BOMs:
+		if head.startswith( bom ):
+			return encoding
+	if default is not None:
+		return default
+	# UTF-16 без BOM: каждый второй байт нулевой (для латиницы и цифр)
+	sample = head[:1024]
+	if len( sample ) >= 2 and sample[1::2].count( 0 ) > len( sample ) // 4:
+		return "utf-16-le"
+	if len( sample ) >= 2 and sample[0::2].count( 0 ) > len( sample ) // 4:
+		return "utf-16-be"
+	return "utf-8"
+
+
+class LexiconReader:
+
+	# stream - бинарный поток, total_bytes - его размер (None для pipe)
+	def __init__(self, stream, total_bytes = None, encoding = None, chunk_size = ChunkSize):
+		self.source = CountingStream( stream )
+		self.total_bytes = total_bytes
+		self.chunk_size = chunk_size
+		buffered = io.BufferedReader( self.source, buffer_size = chunk_size )
+		self.compression, decompressor = detect_compression( buffered )
+		self.stream = decompressor( buffered ) if decompressor is not None else buffered
+		self.first_chunk = self.stream.read( chunk_size )
+		self.encoding = detect_encoding( self.first_chunk, encoding )
+
+
+	@property
+	def bytes_read(self):
+		return self.source.bytes_read
+
+
+	# доля прочитанного или None, если размер неизвестен
+	def progress(self):
+		if not self.total_bytes:
+			return None
+		return min( 1.0, self.bytes_read / self.total_bytes )
+
+
+	# строки без символов перевода строки
+	def __iter__(self):
+		decoder = codecs.getincrementaldecoder( self.encoding )()
+		pending = ""
+		chunk = self.first_chunk
+		self.first_chunk = None
+		while True:
+			final = len( chunk ) == 0
+			text = pending + decoder.decode( chunk, final )
+			lines = text.split( "\n" )
+			pending = lines.pop()
+			for line in lines:
+				yield line[:-1] if line.endswith( "\r" ) else line
+			if final:
+				break
+			chunk = self.stream.read( self.chunk_size )
+		if pending != "":
+			yield pending
+
+
+	def close(self):
+		self.stream.close()
+
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+
+# path - путь к файлу или "-" (stdin)
+def open_lexicon( path, encoding = None, chunk_size = ChunkSize ):
+	if path is None or path == "-":
+		return LexiconReader( sys.stdin.buffer, None, encoding, chunk_size )
+	stream = open( path, "rb" )
+	return LexiconReader( stream, os.fstat( stream.fileno() ).st_size, encoding, chunk_size )
+
+
+####################################################################################################
+
+import unittest
+
+class TestLexiconReader(unittest.TestCase):
+	Text = "ёжик\nанна\r\nbob\n\nпоследняя"
+	Lines = [ "ёжик", "анна", "bob", "", "последняя" ]
+
+	def read(self, data, encoding = None, chunk_size = 4):
+		reader = LexiconReader( io.BytesIO( data ), len( data ), encoding, chunk_size )
+		lines = list( reader )
+		self.assertEqual( reader.bytes_read, len( data ) )
+		self.assertEqual( reader.progress(), 1.0 )
+		return lines
+
+	def test_encodings(self):
+		self.assertEqual( self.read( self.Text.encode( "utf-8" ) ), self.Lines )
+		self.assertEqual( self.read( self.Text.encode( "utf-8-sig" ) ), self.Lines )
+		self.assertEqual( self.read( self.Text.encode( "utf-16" ) ), self.Lines )
+		self.assertEqual( self.read( codecs.BOM_UTF16_BE + self.Text.encode( "utf-16-be" ) ), self.Lines )
+		self.assertEqual( self.read( self.Text.encode( "cp1251" ), "cp1251" ), self.Lines )
+		self.assertEqual( self.read( "abc\ndef\n".encode( "utf-16-le" ) ), [ "abc", "def" ] )
+
+	def test_compressed(self):
+		data = self.Text.encode( "utf-16" )
+		self.assertEqual( self.read( gzip.compress( data ), chunk_size = 64 ), self.Lines )
+		self.assertEqual( self.read( lzma.compress( data ), chunk_size = 64 ), self.Lines )
+		self.assertEqual( self.read( bz2.compress( data ), chunk_size = 64 ), self.Lines )
+
+	def test_unknown_size(self):
+		reader = LexiconReader( io.BytesIO( b"a\nb\n" ) )
+		self.assertIsNone( reader.progress() )
+		self.assertEqual( list( reader ), [ "a", "b" ] )
+
+
+if __name__ == "__main__":
+	unittest.main()
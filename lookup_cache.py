@@ -0,0 +1,262 @@
+#! python3
+
+import sys
+import collections
+import threading
+import compound
+
+# Кэш результатов поиска. В реальном тексте частоты слов распределены по Ципфу,
+# поэтому небольшой кэш перехватывает большую часть запросов.
+#
+# Ограничения: max_entries (записей) и/или max_bytes (оценка через estimate_size).
+# segmented = True - сегментированный LRU: новые записи попадают в испытательный сегмент,
+# повторно запрошенные - в защищенный. Однократные слова не вытесняют частые.
+
+def estimate_size( value ):
+	size = sys.getsizeof( value )
+	if isinstance( value, (list, tuple) ):
+		size += sum( estimate_size( v ) for v in value )
+	elif isinstance( value, dict ):
+		size += sum( estimate_size( k ) + estimate_size( v ) for k, v in value.items() )
+	return size
+
+
+class LruCache:
+
+	_Missing = object()
+
+	def __init__(self, max_entries = None, max_bytes = None, segmented = False, protected_ratio = 0.8, size_of = estimate_size):
+		if max_entries is None and max_bytes is None:
+			raise ValueError( "LruCache needs max_entries or max_bytes" )
+		self.max_entries = max_entries
+		self.max_bytes = max_bytes
+		self.segmented = segmented
+		self.protected_ratio = protected_ratio
+		self.size_of = size_of
+		self.lock = threading.Lock()
+		# { key : (value, size) }, от давних к свежим
+		self.probation = collections.OrderedDict()
+		self.protected = collections.OrderedDict()
+		self.bytes = 0
+		# из них в защищенном сегменте
+		self.protected_bytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+
+	def __len__(self):
+		return len( self.probation ) + len( self.protected )
+
+
+	def get(self, key, default = None):
+		with self.lock:
+			entry = self.protected.get( key, None )
+			if entry is not None:
+				self.protected.move_to_end( key )
+			else:
+				entry = self.probation.get( key, None )
+				if entry is None:
+					self.misses += 1
+					return default
+				if self.segmented:
+					del self.probation[key]
+					self.protected[key] = entry
+					self.protected_bytes += entry[1]
+					self._demote()
+				else:
+					self.probation.move_to_end( key )
+			self.hits += 1
+			return entry[0]
+
+
+	def put(self, key, value):
+		size = self.size_of( key ) + self.size_of( value )
+		with self.lock:
+			for segment in (self.probation, self.protected):
+				old = segment.pop( key, None )
+				if old is not None:
+					self.bytes -= old[1]
+					if segment is self.protected:
+						self.protected_bytes -= old[1]
+			self.probation[key] = (value, size)
+			self.bytes += size
+			self._evict()
+
+
+	# значение из кэша или compute( key ), сохраненное в кэше. None тоже кэшируется
+	def get_or_compute(self, key, compute):
+		value = self.get( key, LruCache._Missing )
+		if value is LruCache._Missing:
+			value = compute( key )
+			self.put( key, value )
+		return value
+
+
+	def clear(self):
+		with self.lock:
+			self.probation.clear()
+			self.protected.clear()
+			self.bytes = 0
+			self.protected_bytes = 0
+
+
+	def stats(self):
+		with self.lock:
+			requests = self.hits + self.misses
+			return {
+				"hits": self.hits,
+				"misses": self.misses,
+				"evictions": self.evictions,
+				"hit_rate": self.hits / requests if requests > 0 else 0.0,
+				"entries": len( self.probation ) + len( self.protected ),
+				"bytes": self.bytes,
+			}
+
+
+	# защищенный сегмент переполнен (по записям или по байтам) - самые давние записи
+	# возвращаются в испытательный. Последняя запись остается, даже если она больше доли
+	def _demote(self):
+		while len( self.protected ) > 1 and self._protected_over_limit():
+			key, entry = self.protected.popitem( last=False )
+			self.protected_bytes -= entry[1]
+			self.probation[key] = entry
+
+
+	def _protected_over_limit(self):
+		if self.max_entries is not None and len( self.protected ) > max( 1, int( self.max_entries * self.protected_ratio ) ):
+			return True
+		return self.max_bytes is not None and self.protected_bytes > self.max_bytes * self.protected_ratio
+
+
+	def _over_limit(self):
+		if self.max_entries is not None and len( self.probation ) + len( self.protected ) > self.max_entries:
+			return True
+		return self.max_bytes is not None and self.bytes > self.max_bytes
+
+
+	def _evict(self):
+		while self._over_limit():
+			segment = self.probation if len( self.probation ) > 0 else self.protected
+			_key, (_value, size) = segment.popitem( last=False )
+			self.bytes -= size
+			if segment is self.protected:
+				self.protected_bytes -= size
+			self.evictions += 1
+
+
+#------------------------------------------------------------------------------
+
+# Словарь (и автомат композитов) с кэшем результатов перед ним
+class CachedDictionary:
+
+	def __init__(self, dictionary, dfa = None, cache = None):
+		self.dictionary = dictionary
+		self.dfa = dfa
+		self.cache = cache if cache is not None else LruCache( max_entries = 100000, segmented = True )
+
+
+	def get_attr(self, word):
+		return self.cache.get_or_compute( ("attr", word), lambda key: self.dictionary.get_attr( key[1] ) )
+
+
+	def check_word(self, word):
+		return self.get_attr( word ) is not None
+
+
+	def analyze_compound(self, word):
+		return self.cache.get_or_compute( ("compound", word),
+			lambda key: compound.analyze_compound( self.dictionary, self.dfa, key[1] ) )
+
+
+	def stats(self):
+		return self.cache.stats()
+
+
+####################################################################################################
+
+import unittest
+
+class TestLruCache(unittest.TestCase):
+
+	def test_lru(self):
+		cache = LruCache( max_entries = 2 )
+		cache.put( "a", 1 )
+		cache.put( "b", 2 )
+		self.assertEqual( cache.get( "a" ), 1 )
+		cache.put( "c", 3 )
+		# "b" - самый давний
+		self.assertIsNone( cache.get( "b" ) )
+		self.assertEqual( cache.get( "c" ), 3 )
+		self.assertEqual( cache.stats()["evictions"], 1 )
+		self.assertEqual( cache.stats()["hits"], 2 )
+		self.assertEqual( cache.stats()["misses"], 1 )
+
+	def test_segmented(self):
+		cache = LruCache( max_entries = 4, segmented = True, protected_ratio = 0.5 )
+		cache.put( "hot", 1 )
+		cache.get( "hot" )
+		# поток однократных слов не вытесняет "hot"
+		for i in range( 20 ):
+			cache.put( i, i )
+		self.assertEqual( cache.get( "hot" ), 1 )
+		self.assertEqual( len( cache ), 4 )
+
+	def test_segmented_bytes_limit(self):
+		cache = LruCache( max_bytes = 100, segmented = True, protected_ratio = 0.5, size_of = lambda v: 10 )
+		for key in "abcde":
+			cache.put( key, key )
+			cache.get( key )
+		# защищенный сегмент занимает не больше половины байтов, новые слова остаются в кэше
+		self.assertLessEqual( cache.protected_bytes, 50 )
+		cache.put( "new", 0 )
+		self.assertEqual( cache.get( "new" ), 0 )
+		self.assertEqual( cache.get( "e" ), "e" )
+
+	def test_bytes_limit(self):
+		cache = LruCache( max_bytes = 100, size_of = len )
+		cache.put( "x", "a" * 60 )
+		cache.put( "y", "b" * 30 )
+		self.assertEqual( cache.stats()["bytes"], 92 )
+		cache.put( "z", "c" * 30 )
+		self.assertIsNone( cache.get( "x" ) )
+		self.assertLessEqual( cache.stats()["bytes"], 100 )
+
+	def test_none_is_cached(self):
+		calls = []
+		cache = LruCache( max_entries = 10 )
+		compute = lambda key: calls.append( key )
+		self.assertIsNone( cache.get_or_compute( "k", compute ) )
+		self.assertIsNone( cache.get_or_compute( "k", compute ) )
+		self.assertEqual( calls, [ "k" ] )
+
+	def test_threads(self):
+		cache = LruCache( max_entries = 50, segmented = True )
+		def work():
+			for i in range( 2000 ):
+				cache.get_or_compute( i % 70, lambda key: key * 2 )
+		threads = [ threading.Thread( target = work ) for _ in range( 4 ) ]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+		stats = cache.stats()
+		self.assertEqual( stats["hits"] + stats["misses"], 8000 )
+		self.assertLessEqual( stats["entries"], 50 )
+
+
+class TestCachedDictionary(unittest.TestCase):
+
+	def test_cached(self):
+		import dictionary as dic
+		builder = dic.DicDawgBuilder()
+		builder.add_word( "any", 1 )
+		cached = CachedDictionary( builder.build(), cache = LruCache( max_entries = 10 ) )
+		self.assertTrue( cached.check_word( "any" ) )
+		self.assertFalse( cached.check_word( "none" ) )
+		self.assertEqual( cached.get_attr( "any" ), 1 )
+		self.assertEqual( cached.stats()["hits"], 1 )
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,422 @@
+#! python3
+
+import sys
+import argparse
+import asyncio
+import collections
+import json
+import time
+import fsm
+import dictionary as dic
+import compound
+import container
+import dictionary_snapshot as snap
+
+DescriptionString = "Dictionary lookup server. Line-delimited JSON over TCP or Unix socket."
+
+# Протокол: одна строка JSON на запрос и на ответ.
+#   {"id": 1, "word": "football"}  ->  {"id": 1, "word": "football", "found": false, "attr": null, "compound": [[0, 4, 1], [4, 8, 2]]}
+#   {"id": 2, "cmd": "stats"}      ->  {"id": 2, "stats": {...}}
+#   {"id": 3, "cmd": "reload"}     ->  {"id": 3, "generation": 1}   (только с --live)
+# Ответы на одном соединении могут приходить не в порядке запросов - сопоставляйте по id.
+
+# Словарь и автомат загружаются один раз, запросы обрабатываются пачками.
+# dictionary может быть LiveDictionary: тогда пачка целиком обрабатывается одним снимком,
+# а reload подменяет снимок, не останавливая поиск
+class LookupService:
+
+	def __init__(self, dictionary, dfa = None):
+		self.dictionary = dictionary
+		self.dfa = dfa
+		# контейнер, из которого загружены словарь и автомат
+		self.container = None
+
+
+	# dictionary_path - словарь (*_dic.dawg) или контейнер (*.wfpack) со словарем и автоматом
+	# live - словарь в памяти (DictionarySnapshot) с перезагрузкой из того же файла
+	@staticmethod
+	def load(dictionary_path, dfa_path = None, live = False):
+		if live:
+			service = LookupService( snap.LiveDictionary.open( dictionary_path ) )
+		elif container.is_container( dictionary_path ):
+			pack = container.Container.open( dictionary_path )
+			service = LookupService( pack.reader(), pack.dfa() )
+			service.container = pack
+		else:
+			service = LookupService( dic.DicReader.open( dictionary_path ) )
+		if dfa_path is not None:
+			with open( dfa_path, "rb" ) as dfa_in:
+				service.dfa = fsm.DFA.deserialize( dfa_in )
+		return service
+
+
+	# (словарь, автомат) для очередной пачки запросов
+	def current(self):
+		get_snapshot = getattr( self.dictionary, "snapshot", None )
+		if get_snapshot is None:
+			return (self.dictionary, self.dfa)
+		snapshot = get_snapshot()
+		return (snapshot, snapshot.dfa if snapshot.dfa is not None else self.dfa)
+
+
+	def close(self):
+		if self.container is not None:
+			self.container.close()
+			self.container = None
+		elif hasattr( self.dictionary, "close" ):
+			self.dictionary.close()
+
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+
+	def lookup(self, word):
+		return self._lookup( *self.current(), word )
+
+
+	# return_exceptions - ошибка одного слова возвращается на его месте, а не прерывает всю пачку
+	def lookup_batch(self, words, return_exceptions = False):
+		dictionary, dfa = self.current()
+		if not return_exceptions:
+			return [self._lookup( dictionary, dfa, w ) for w in words]
+		results = []
+		for w in words:
+			try:
+				results.append( self._lookup( dictionary, dfa, w ) )
+			except Exception as e:
+				results.append( e )
+		return results
+
+
+	def _lookup(self, dictionary, dfa, word):
+		attr = dictionary.get_attr( word )
+		result = { "word": word, "found": attr is not None, "attr": attr }
+		if dfa is not None:
+			parts = compound.analyze_compound( dictionary, dfa, word )
+			result["compound"] = [list( p ) for p in parts] if parts is not None else None
+		return result
+
+
+	# перечитывает словарь (LiveDictionary), возвращает номер нового снимка
+	def reload(self):
+		if not hasattr( self.dictionary, "reload" ):
+			raise ValueError( "Dictionary is not live, start the server with --live" )
+		return self.dictionary.reload().generation
+
+
+#------------------------------------------------------------------------------
+
+class LookupStats:
+
+	# сколько последних задержек хранить для перцентилей
+	LatencyWindow = 10000
+
+	def __init__(self):
+		self.started = time.monotonic()
+		self.requests = 0
+		self.errors = 0
+		self.batches = 0
+		self.max_batch_size = 0
+		self.latencies = collections.deque( maxlen=LookupStats.LatencyWindow )
+
+
+	def add_batch(self, size):
+		self.batches += 1
+		self.max_batch_size = max( self.max_batch_size, size )
+
+
+	def add_request(self, latency):
+		self.requests += 1
+		self.latencies.append( latency )
+
+
+	def percentile(self, p):
+		if len( self.latencies ) == 0:
+			return None
+		values = sorted( self.latencies )
+		return values[min( len( values ) - 1, int( p * len( values ) ) )]
+
+
+	def to_dict(self):
+		uptime = time.monotonic() - self.started
+		return {
+			"requests": self.requests,
+			"errors": self.errors,
+			"batches": self.batches,
+			"mean_batch_size": self.requests / self.batches if self.batches > 0 else 0.0,
+			"max_batch_size": self.max_batch_size,
+			"throughput_rps": self.requests / uptime if uptime > 0 else 0.0,
+			"latency_p50_s": self.percentile( 0.5 ),
+			"latency_p99_s": self.percentile( 0.99 ),
+			"latency_max_s": max( self.latencies ) if len( self.latencies ) > 0 else None,
+		}
+
+
+#------------------------------------------------------------------------------
+
+# Сервер собирает одновременные запросы в пачки: ждет не дольше max_delay
+# секунд после первого запроса или до max_batch запросов
+class LookupServer:
+
+	def __init__(self, service, max_batch = 256, max_delay = 0.002):
+		self.service = service
+		self.max_batch = max_batch
+		self.max_delay = max_delay
+		self.stats = LookupStats()
+		self.queue = None
+		self.batcher = None
+		self.server = None
+
+
+	async def start(self, host = "127.0.0.1", port = 0, unix_path = None):
+		self.queue = asyncio.Queue()
+		self.batcher = asyncio.ensure_future( self._process_batches() )
+		if unix_path is not None:
+			self.server = await asyncio.start_unix_server( self._handle_client, path=unix_path )
+		else:
+			self.server = await asyncio.start_server( self._handle_client, host, port )
+		return self.server
+
+
+	def address(self):
+		return self.server.sockets[0].getsockname()
+
+
+	async def close(self):
+		self.server.close()
+		await self.server.wait_closed()
+		self.batcher.cancel()
+		try:
+			await self.batcher
+		except asyncio.CancelledError:
+			pass
+
+
+	async def lookup(self, word):
+		future = asyncio.get_running_loop().create_future()
+		await self.queue.put( (word, future, time.monotonic()) )
+		return await future
+
+
+	async def _process_batches(self):
+		loop = asyncio.get_running_loop()
+		while True:
+			batch = [await self.queue.get()]
+			deadline = loop.time() + self.max_delay
+			while len( batch ) < self.max_batch:
+				timeout = deadline - loop.time()
+				if timeout <= 0:
+					break
+				try:
+					batch.append( await asyncio.wait_for( self.queue.get(), timeout ) )
+				except asyncio.TimeoutError:
+					break
+
+			self.stats.add_batch( len( batch ) )
+			try:
+				results = self.service.lookup_batch( [word for (word, _f, _t) in batch], return_exceptions = True )
+			except Exception as e:
+				for (_word, future, _t) in batch:
+					if not future.done():
+						future.set_exception( e )
+				continue
+			now = time.monotonic()
+			for (_word, future, received), result in zip( batch, results ):
+				self.stats.add_request( now - received )
+				if future.done():
+					continue
+				if isinstance( result, Exception ):
+					future.set_exception( result )
+				else:
+					future.set_result( result )
+
+
+	async def _handle_client(self, reader, writer):
+		write_lock = asyncio.Lock()
+		tasks = set()
+
+		async def respond( response ):
+			async with write_lock:
+				writer.write( (json.dumps( response, ensure_ascii=False ) + "\n").encode( "utf-8" ) )
+				await writer.drain()
+
+		async def process( request ):
+			response = { "id": None }
+			try:
+				if not isinstance( request, dict ):
+					raise ValueError( "Request must be a JSON object" )
+				response["id"] = request.get( "id" )
+				if request.get( "cmd" ) == "stats":
+					response["stats"] = self.stats.to_dict()
+				elif request.get( "cmd" ) == "reload":
+					# чтение файла - в другом потоке, поиск в это время идет по старому снимку
+					response["generation"] = await asyncio.get_running_loop().run_in_executor( None, self.service.reload )
+				else:
+					response.update( await self.lookup( request["word"] ) )
+			except Exception as e:
+				self.stats.errors += 1
+				response["error"] = str( e )
+			await respond( response )
+
+		try:
+			while True:
+				line = await reader.readline()
+				if not line:
+					break
+				try:
+					request = json.loads( line )
+				except ValueError as e:
+					self.stats.errors += 1
+					await respond( { "id": None, "error": str( e ) } )
+					continue
+				task = asyncio.ensure_future( process( request ) )
+				tasks.add( task )
+				task.add_done_callback( tasks.discard )
+			if len( tasks ) > 0:
+				await asyncio.wait( list( tasks ) )
+		finally:
+			writer.close()
+
+
+#------------------------------------------------------------------------------
+
+def parse_args():
+	parser = argparse.ArgumentParser( prog = "lookup_server.py", description = DescriptionString )
+	parser.add_argument( "dictionary", help = "Path to serialized dictionary (*_dic.dawg) or artifact container (*.wfpack)" )
+	parser.add_argument( "--dfa", help = "Path to compound grammar automaton (*_copm.dfa)", default = None )
+	parser.add_argument( "--host", default = "127.0.0.1" )
+	parser.add_argument( "--port", type = int, default = 8765 )
+	parser.add_argument( "--unix", help = "Listen on Unix socket instead of TCP", default = None )
+	parser.add_argument( "--max-batch", type = int, default = 256 )
+	parser.add_argument( "--max-delay", type = float, default = 0.002, help = "Seconds to wait for a batch to fill" )
+	parser.add_argument( "--live",
+		action='store_const', const=True, default=False,
+		help = "Keep the dictionary in memory and allow {\"cmd\": \"reload\"} to swap in a rebuilt file" )
+	return parser.parse_args()
+
+
+async def serve( args ):
+	service = LookupService.load( args.dictionary, args.dfa, args.live )
+	server = LookupServer( service, args.max_batch, args.max_delay )
+	await server.start( args.host, args.port, args.unix )
+	print( "Listening on", server.address(), file=sys.stderr )
+	async with server.server:
+		await server.server.serve_forever()
+
+
+def main():
+	asyncio.run( serve( parse_args() ) )
+
+
+####################################################################################################
+
+import unittest
+
+class TestLookupServer(unittest.TestCase):
+	def setUp(self):
+		builder = dic.DicDawgBuilder()
+		builder.add_word( "ball", 2 )
+		builder.add_word( "foot", 1 )
+		nfa = fsm.NFA()
+		nfa.add_trans( fsm.START, 1, "Q" )
+		nfa.add_trans( "Q", 2, "F" )
+		nfa.set_final( "F" )
+		reader = dic.DicReader( builder.build().serialize() )
+		self.service = LookupService( reader, nfa.to_DFA() )
+
+	def test_load_container(self):
+		import os
+		import tempfile
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join( directory, "xx.wfpack" )
+			container.pack_artifacts( path, self.service.dictionary.data, None, self.service.dfa )
+			service = LookupService.load( path )
+			self.assertEqual( service.lookup( "football" )["compound"], [ [0, 4, 1], [4, 8, 2] ] )
+			service.container.close()
+
+	def test_live_reload(self):
+		import os
+		import tempfile
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join( directory, "xx.wfpack" )
+			container.pack_artifacts( path, self.service.dictionary.data, None, self.service.dfa )
+			service = LookupService.load( path, live = True )
+			self.assertEqual( service.lookup( "football" )["compound"], [ [0, 4, 1], [4, 8, 2] ] )
+			builder = dic.DicDawgBuilder()
+			builder.add_word( "hand", 1 )
+			container.pack_artifacts( path, builder.build().serialize(), None, self.service.dfa )
+			self.assertEqual( service.reload(), 1 )
+			self.assertFalse( service.lookup( "foot" )["found"] )
+			self.assertEqual( service.lookup( "handball" )["compound"], None )
+			self.assertTrue( service.lookup( "hand" )["found"] )
+		with self.assertRaises( ValueError ):
+			self.service.reload()
+
+	def test_service(self):
+		results = self.service.lookup_batch( [ "foot", "football", "x" ] )
+		self.assertEqual( results[0], { "word": "foot", "found": True, "attr": 1, "compound": None } )
+		self.assertEqual( results[1]["compound"], [ [0, 4, 1], [4, 8, 2] ] )
+		self.assertFalse( results[2]["found"] )
+
+	def test_server(self):
+		async def run():
+			server = LookupServer( self.service, max_batch = 16, max_delay = 0.05 )
+			await server.start()
+			host, port = server.address()[:2]
+			reader, writer = await asyncio.open_connection( host, port )
+			words = [ "foot", "ball", "football", "none" ]
+			for i, w in enumerate( words ):
+				writer.write( (json.dumps( { "id": i, "word": w } ) + "\n").encode( "utf-8" ) )
+			writer.write( b"not json\n" )
+			await writer.drain()
+			responses = {}
+			for _ in range( len( words ) + 1 ):
+				response = json.loads( await reader.readline() )
+				responses[response["id"]] = response
+			writer.write( b'{"id": "s", "cmd": "stats"}\n' )
+			await writer.drain()
+			stats = json.loads( await reader.readline() )["stats"]
+			writer.close()
+			await server.close()
+			return responses, stats
+
+		responses, stats = asyncio.run( run() )
+		self.assertTrue( responses[0]["found"] )
+		self.assertEqual( responses[2]["compound"], [ [0, 4, 1], [4, 8, 2] ] )
+		self.assertFalse( responses[3]["found"] )
+		self.assertIn( "error", responses[None] )
+		self.assertEqual( stats["requests"], 4 )
+		self.assertEqual( stats["errors"], 1 )
+		# все четыре запроса пришли одновременно и попали в одну пачку
+		self.assertEqual( stats["batches"], 1 )
+
+	def test_bad_requests(self):
+		async def run():
+			server = LookupServer( self.service, max_batch = 16, max_delay = 0.05 )
+			await server.start()
+			host, port = server.address()[:2]
+			reader, writer = await asyncio.open_connection( host, port )
+			# неверное слово в одной пачке с верным, запрос - не объект JSON
+			writer.write( b'{"id": 1, "word": "foot"}\n{"id": 2, "word": 5}\n[1, 2]\n' )
+			await writer.drain()
+			responses = {}
+			for _ in range( 3 ):
+				response = json.loads( await reader.readline() )
+				responses[response["id"]] = response
+			writer.close()
+			await server.close()
+			return responses
+
+		responses = asyncio.run( run() )
+		self.assertTrue( responses[1]["found"] )
+		self.assertNotIn( "error", responses[1] )
+		self.assertIn( "error", responses[2] )
+		self.assertIn( "error", responses[None] )
+
+
+if __name__ == "__main__":
+	main()
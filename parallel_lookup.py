@@ -0,0 +1,147 @@
+#! python3
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import time
+import dictionary as dic
+import lookup_server
+
+DescriptionString = "Parallel dictionary lookup. Measures scaling over worker processes."
+
+# Каждый рабочий процесс открывает один и тот же файл словаря через mmap:
+# страницы файла общие для всех процессов (page cache), граф DicNode не строится.
+
+# состояние рабочего процесса
+_service = None
+
+# ready - multiprocessing.Barrier: процесс сообщает, что словарь открыт (для замеров)
+def _init_worker( dictionary_path, dfa_path, ready = None ):
+	global _service
+	_service = lookup_server.LookupService.load( dictionary_path, dfa_path )
+	if ready is not None:
+		ready.wait()
+
+def _check_chunk( words ):
+	return [_service.dictionary.check_word( w ) for w in words]
+
+def _lookup_chunk( words ):
+	return _service.lookup_batch( words )
+
+
+def chunks( words, chunk_size ):
+	words = iter( words )
+	while True:
+		chunk = list( itertools.islice( words, chunk_size ) )
+		if len( chunk ) == 0:
+			return
+		yield chunk
+
+
+def _run_parallel( worker, words, dictionary_path, processes, chunk_size, dfa_path ):
+	with multiprocessing.Pool( processes, _init_worker, (dictionary_path, dfa_path) ) as pool:
+		yield from _run_in_pool( pool, worker, words, chunk_size )
+
+
+def _run_in_pool( pool, worker, words, chunk_size ):
+	# imap сохраняет порядок и отдает результаты по мере готовности
+	for results in pool.imap( worker, chunks( words, chunk_size ) ):
+		yield from results
+
+
+# check_word для каждого слова, результаты в порядке слов
+def parallel_check( words, dictionary_path, processes = None, chunk_size = 4096 ):
+	return _run_parallel( _check_chunk, words, dictionary_path, processes, chunk_size, None )
+
+
+# то же, что LookupService.lookup (атрибут и разбор композита) для каждого слова
+def parallel_lookup( words, dictionary_path, processes = None, chunk_size = 1024, dfa_path = None ):
+	return _run_parallel( _lookup_chunk, words, dictionary_path, processes, chunk_size, dfa_path )
+
+
+# [(processes, seconds, words_per_second, speedup)]
+# ускорение считается относительно первого замера (обычно processes = 1)
+# Запуск процессов и открытие словаря в замер не входят: время отсчитывается,
+# когда все процессы пула открыли словарь
+def benchmark_scaling( words, dictionary_path, process_counts, chunk_size = 4096 ):
+	results = []
+	base_time = None
+	for processes in process_counts:
+		ready = multiprocessing.Barrier( processes + 1 )
+		with multiprocessing.Pool( processes, _init_worker, (dictionary_path, None, ready) ) as pool:
+			ready.wait()
+			start = time.perf_counter()
+			count = 0
+			for _ in _run_in_pool( pool, _check_chunk, words, chunk_size ):
+				count += 1
+			elapsed = time.perf_counter() - start
+		if base_time is None:
+			base_time = elapsed
+		results.append( (processes, elapsed, count / elapsed, base_time / elapsed) )
+	return results
+
+
+def parse_args():
+	parser = argparse.ArgumentParser( prog = "parallel_lookup.py", description = DescriptionString )
+	parser.add_argument( "dictionary", help = "Path to serialized dictionary (*_dic.dawg) or artifact container (*.wfpack)" )
+	parser.add_argument( "-w", "--words",
+		help = "UTF-8 file with one query word per line. If not set, the dictionary words are used",
+		default = None )
+	parser.add_argument( "-p", "--processes", type = int, nargs = "+",
+		default = [1, 2, 4, os.cpu_count() or 1] )
+	parser.add_argument( "--repeat", type = int, default = 1, help = "Repeat the query list N times" )
+	parser.add_argument( "--chunk-size", type = int, default = 4096 )
+	return parser.parse_args()
+
+
+def main():
+	args = parse_args()
+	if args.words is not None:
+		with open( args.words, encoding="utf-8" ) as words_in:
+			words = [line.strip() for line in words_in if line.strip() != ""]
+	else:
+		with lookup_server.LookupService.load( args.dictionary ) as service:
+			words = [w for (w, _attr) in service.dictionary.iter_words()]
+	words = words * args.repeat
+
+	print( "Words:", len( words ) )
+	for (processes, elapsed, rate, speedup) in benchmark_scaling( words, args.dictionary, args.processes, args.chunk_size ):
+		print( "processes: {:3}  time: {:8.3f} s  {:12.0f} words/s  speedup: {:.2f}".format( processes, elapsed, rate, speedup ) )
+
+
+####################################################################################################
+
+import unittest
+import tempfile
+
+class TestParallelLookup(unittest.TestCase):
+	def setUp(self):
+		self.words = [ "any", "anyone", "anywhere", "someone", "somewhere" ]
+		builder = dic.DicDawgBuilder()
+		for w in self.words:
+			builder.add_word( w )
+		fd, self.path = tempfile.mkstemp( suffix = "_dic.dawg" )
+		with os.fdopen( fd, "wb" ) as out:
+			out.write( builder.build().serialize() )
+
+	def tearDown(self):
+		os.remove( self.path )
+
+	def test_ordered_results(self):
+		queries = [ "any", "an", "someone", "x", "anywhere", "some" ] * 50
+		expected = [ q in self.words for q in queries ]
+		self.assertEqual( list( parallel_check( queries, self.path, processes = 2, chunk_size = 7 ) ), expected )
+
+	def test_lookup(self):
+		results = list( parallel_lookup( iter( [ "any", "none" ] ), self.path, processes = 1 ) )
+		self.assertEqual( [ r["found"] for r in results ], [ True, False ] )
+
+	def test_benchmark_scaling(self):
+		results = benchmark_scaling( self.words * 10, self.path, [ 1, 2 ], chunk_size = 8 )
+		self.assertEqual( [ processes for (processes, _t, _rate, _speedup) in results ], [ 1, 2 ] )
+		self.assertEqual( results[0][3], 1.0 )
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,189 @@
+#! python3
+
+import sys
+import json
+import time
+import tracemalloc
+import contextlib
+
+# Легковесная инструментация компиляторов: таймеры этапов, счетчики и пиковая память.
+#
+#	profiler = Profiler()
+#	with profiler.stage( "to_DFA" ):
+#		dfa = nfa.to_DFA()
+#	profiler.set( "dfa_states", len( dfa.states ) )
+#
+# Подписчики получают события по мере их появления: callback( kind, name, value ),
+# kind - "stage" (value - секунды), "count" (value - приращение) или "value".
+
+# подписчики всех профайлеров
+_global_subscribers = []
+
+def subscribe( callback ):
+	_global_subscribers.append( callback )
+
+def unsubscribe( callback ):
+	_global_subscribers.remove( callback )
+
+
+class Profiler:
+
+	def __init__(self, trace_memory = False):
+		self.trace_memory = trace_memory
+		# { имя этапа : секунды }, в порядке появления
+		self.stages = {}
+		# { имя этапа : пиковая память в байтах }
+		self.memory = {}
+		self.counters = {}
+		self.values = {}
+		self.subscribers = []
+
+
+	def subscribe(self, callback):
+		self.subscribers.append( callback )
+
+
+	def _notify(self, kind, name, value):
+		for callback in self.subscribers + _global_subscribers:
+			callback( kind, name, value )
+
+
+	@contextlib.contextmanager
+	def stage(self, name):
+		started_tracing = False
+		if self.trace_memory:
+			if not tracemalloc.is_tracing():
+				tracemalloc.start()
+				started_tracing = True
+			tracemalloc.reset_peak()
+		start = time.perf_counter()
+		try:
+			yield self
+		finally:
+			elapsed = time.perf_counter() - start
+			self.stages[name] = self.stages.get( name, 0.0 ) + elapsed
+			if self.trace_memory:
+				_current, peak = tracemalloc.get_traced_memory()
+				self.memory[name] = max( self.memory.get( name, 0 ), peak )
+				if started_tracing:
+					tracemalloc.stop()
+			self._notify( "stage", name, elapsed )
+
+
+	def count(self, name, value = 1):
+		self.counters[name] = self.counters.get( name, 0 ) + value
+		self._notify( "count", name, value )
+
+
+	def set(self, name, value):
+		self.values[name] = value
+		self._notify( "value", name, value )
+
+
+	def to_dict(self):
+		result = {
+			"stages_s": dict( self.stages ),
+			"counters": dict( self.counters ),
+			"values": dict( self.values ),
+		}
+		if self.trace_memory:
+			result["peak_memory_bytes"] = dict( self.memory )
+		return result
+
+
+	def write_json(self, path):
+		with open( path, "w" ) as out:
+			json.dump( self.to_dict(), out, indent = 2 )
+			out.write( "\n" )
+
+
+	def report(self, output = sys.stderr):
+		total = sum( self.stages.values() )
+		for name, elapsed in self.stages.items():
+			line = "{:20} {:10.3f} s {:6.1%}".format( name, elapsed, elapsed / total if total > 0 else 0.0 )
+			if name in self.memory:
+				line += "  peak {:10.1f} MB".format( self.memory[name] / (1 << 20) )
+			print( line, file = output )
+		for name, value in list( self.counters.items() ) + list( self.values.items() ):
+			print( "{:20} {}".format( name, value ), file = output )
+
+
+# профайлер, который ничего не делает (инструментация выключена)
+class NullProfiler(Profiler):
+
+	@contextlib.contextmanager
+	def stage(self, name):
+		yield self
+
+	def count(self, name, value = 1):
+		pass
+
+	def set(self, name, value):
+		pass
+
+
+# общие параметры командной строки для компиляторов
+def add_arguments( parser ):
+	parser.add_argument( "--profile",
+		action='store_const', const=True, default=False,
+		help = "Print per-stage timings and counters to stderr" )
+	parser.add_argument( "--stats-json",
+		help = "Write per-stage timings and counters to JSON file",
+		default = None )
+	parser.add_argument( "--trace-memory",
+		action='store_const', const=True, default=False,
+		help = "Track peak memory of each stage with tracemalloc (slow)" )
+
+
+def from_args( args ):
+	if args.profile or args.stats_json is not None or args.trace_memory:
+		return Profiler( args.trace_memory )
+	return NullProfiler()
+
+
+def finish( profiler, args ):
+	if args.profile:
+		profiler.report()
+	if args.stats_json is not None:
+		profiler.write_json( args.stats_json )
+
+
+####################################################################################################
+
+import unittest
+
+class TestProfiler(unittest.TestCase):
+
+	def test_stages_and_subscribers(self):
+		events = []
+		profiler = Profiler( trace_memory = True )
+		profiler.subscribe( lambda kind, name, value: events.append( (kind, name) ) )
+		with profiler.stage( "build" ):
+			data = [ i for i in range( 10000 ) ]
+		profiler.count( "words", 2 )
+		profiler.count( "words" )
+		profiler.set( "states", len( data ) )
+
+		result = profiler.to_dict()
+		self.assertIn( "build", result["stages_s"] )
+		self.assertGreater( result["peak_memory_bytes"]["build"], 0 )
+		self.assertEqual( result["counters"], { "words": 3 } )
+		self.assertEqual( result["values"], { "states": 10000 } )
+		self.assertEqual( events, [ ("stage", "build"), ("count", "words"), ("count", "words"), ("value", "states") ] )
+
+	def test_global_subscriber(self):
+		events = []
+		callback = lambda kind, name, value: events.append( name )
+		subscribe( callback )
+		try:
+			with Profiler().stage( "x" ):
+				pass
+			with NullProfiler().stage( "y" ):
+				pass
+		finally:
+			unsubscribe( callback )
+		self.assertEqual( events, [ "x" ] )
+
+
+if __name__ == "__main__":
+	unittest.main()
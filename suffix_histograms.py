@@ -0,0 +1,153 @@
+#! python3
+
+import mmap
+import struct
+import zlib
+import dictionary as dic
+
+# Гистограммы атрибутов поддеревьев узлов словаря перевернутых слов (для suffix_index.py).
+# compile_dictionary.py --reverse-output пишет их рядом со словарем (<словарь>.hist).
+#
+# Формат файла гистограмм (little-endian):
+#	заголовок:  magic "WFHIST", версия (2 байта), число узлов (4), размер словаря в байтах (8), CRC32 словаря (4)
+#	индекс:     по узлу - смещение узла в словаре (4) и смещение записи в файле (4), по возрастанию смещений узлов
+#	записи:     число пар (4), пары (атрибут (4, со знаком), число слов (4))
+
+HistogramMagic = b'WFHIST'
+HistogramVersion = 1
+HistogramHeader = struct.Struct( "<6sHIQI" )
+HistogramEntry = struct.Struct( "<II" )
+HistogramLength = struct.Struct( "<I" )
+HistogramPair = struct.Struct( "<iI" )
+
+
+# Гистограммы узлов поддерева root: { key( node ) : { атрибут : число слов } }.
+# Обход в глубину без рекурсии, гистограмма узла считается после гистограмм детей
+def subtree_histograms( root, items, data, key ):
+	histograms = {}
+	to_process = [(root, False)]
+	while len( to_process ) > 0:
+		node, children_done = to_process.pop()
+		node_key = key( node )
+		if node_key in histograms:
+			continue
+		children = items( node )
+		if not children_done:
+			to_process.append( (node, True) )
+			for (_letter, child) in children:
+				if key( child ) not in histograms:
+					to_process.append( (child, False) )
+			continue
+		histogram = {}
+		node_data = data( node )
+		if node_data is not None:
+			histogram[node_data] = 1
+		for (_letter, child) in children:
+			for attr, count in histograms[key( child )].items():
+				histogram[attr] = histogram.get( attr, 0 ) + count
+		histograms[node_key] = histogram
+	return histograms
+
+
+# файл гистограмм для сериализованного словаря перевернутых слов (bytes или DicReader)
+def serialize_histograms( dictionary ):
+	reader = dictionary if isinstance( dictionary, dic.DicReader ) else dic.DicReader( dictionary )
+	histograms = subtree_histograms( reader.root, reader.node_items, reader.node_data, lambda offset: offset )
+	offsets = sorted( histograms )
+	index = bytearray()
+	records = bytearray()
+	record_offset = HistogramHeader.size + HistogramEntry.size * len( offsets )
+	for offset in offsets:
+		histogram = histograms[offset]
+		index.extend( HistogramEntry.pack( offset, record_offset + len( records ) ) )
+		records.extend( HistogramLength.pack( len( histogram ) ) )
+		for attr in sorted( histogram ):
+			records.extend( HistogramPair.pack( attr, histogram[attr] ) )
+	header = HistogramHeader.pack( HistogramMagic, HistogramVersion, len( offsets ), len( reader.data ), zlib.crc32( reader.data ) )
+	return header + bytes( index ) + bytes( records )
+
+
+# Гистограммы из файла: двоичный поиск по индексу, данные не загружаются целиком
+class HistogramTable:
+
+	def __init__(self, data):
+		magic, version, count, dictionary_size, dictionary_crc = HistogramHeader.unpack_from( data, 0 )
+		if magic != HistogramMagic:
+			raise ValueError( "Unknown magic: " + str( magic ) )
+		if version != HistogramVersion:
+			raise ValueError( "Unknown histogram file version: " + str( version ) )
+		self.data = data
+		self.count = count
+		# размер словаря, для которого посчитаны гистограммы
+		self.dictionary_size = dictionary_size
+		self.dictionary_crc = dictionary_crc
+		self.file = None
+		self.mmap = None
+
+
+	@staticmethod
+	def open(path):
+		file = open( path, "rb" )
+		try:
+			data = mmap.mmap( file.fileno(), 0, access=mmap.ACCESS_READ )
+		except BaseException:
+			file.close()
+			raise
+		try:
+			table = HistogramTable( data )
+		except BaseException:
+			data.close()
+			file.close()
+			raise
+		table.file = file
+		table.mmap = data
+		return table
+
+
+	def close(self):
+		if self.mmap is not None:
+			self.data = None
+			self.mmap.close()
+			self.file.close()
+			self.mmap = self.file = None
+
+
+	# { атрибут : число слов } узла или None, если узла нет в индексе
+	def get(self, offset):
+		lo = 0
+		hi = self.count
+		while lo < hi:
+			mid = (lo + hi) // 2
+			node_offset, record_offset = HistogramEntry.unpack_from( self.data, HistogramHeader.size + HistogramEntry.size * mid )
+			if node_offset < offset:
+				lo = mid + 1
+			elif node_offset > offset:
+				hi = mid
+			else:
+				(length,) = HistogramLength.unpack_from( self.data, record_offset )
+				pairs = record_offset + HistogramLength.size
+				return dict( HistogramPair.unpack_from( self.data, pairs + HistogramPair.size * i ) for i in range( length ) )
+		return None
+
+
+####################################################################################################
+
+import unittest
+
+class TestHistograms(unittest.TestCase):
+
+	def test_round_trip(self):
+		builder = dic.DicDawgBuilder()
+		for (word, attr) in [ ("ab", 1), ("abc", 2), ("b", 1) ]:
+			builder.add_word( word, attr )
+		data = builder.build().serialize()
+		table = HistogramTable( serialize_histograms( data ) )
+		reader = dic.DicReader( data )
+		self.assertEqual( table.get( reader.root ), { 1: 2, 2: 1 } )
+		self.assertEqual( table.get( reader.find( "ab" ) ), { 1: 1, 2: 1 } )
+		self.assertIsNone( table.get( 1 ) )
+		self.assertEqual( (table.dictionary_size, table.dictionary_crc), (len( data ), zlib.crc32( data )) )
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,192 @@
+#! python3
+
+import argparse
+import os
+import zlib
+import dictionary as dic
+import compile_dictionary
+import suffix_histograms as hist
+
+DescriptionString = "Tag distribution of dictionary words with a given suffix."
+
+# Угадывание тэгов несловарных слов по окончанию.
+# Словарь перевернутых слов (compile_dictionary.py --reverse-output): слова с суффиксом "ость" -
+# это слова с префиксом "тсо". Для узла нужна гистограмма атрибутов слов его поддерева,
+# тогда запрос - это проход по суффиксу, без перебора поддерева.
+# В DAWG поддерево узла одно для всех путей к нему, поэтому гистограмма - свойство узла.
+#
+# Гистограммы всех узлов считаются при компиляции и пишутся рядом со словарем (<словарь>.hist),
+# файл читается через mmap. Без него гистограмма считается при запросе обходом поддерева
+# найденного узла и кэшируется (cache_size последних узлов).
+# Формат файла и его чтение - suffix_histograms.py.
+
+class SuffixIndex:
+
+	# dictionary - DicDawg/DicTree или DicReader перевернутых слов.
+	# Узлы DicNode различаются по id, поэтому ленивая десериализация (lazy = True) не подходит -
+	# для словаря с диска используйте DicReader
+	# tags - список тэгов по номерам атрибутов или None (тогда ключи гистограмм - атрибуты)
+	# histograms - HistogramTable этого словаря (только для DicReader) или None
+	def __init__(self, dictionary, tags = None, histograms = None, cache_size = 1024):
+		self.dictionary = dictionary
+		self.tags = tags
+		if isinstance( dictionary, dic.DicReader ):
+			self._items = dictionary.node_items
+			self._data = dictionary.node_data
+			self._next = dictionary.next
+			self._key = lambda offset: offset
+		else:
+			if histograms is not None:
+				raise ValueError( "Histogram file needs a DicReader dictionary" )
+			self._items = lambda node: list( zip( node.keys, node.children ) )
+			self._data = lambda node: node.data if node.is_leaf() else None
+			self._next = lambda node, letter: node.next( letter )
+			self._key = id
+		# размер сравнивается первым: он дешевле, а CRC ловит словари того же размера (другие тэги)
+		if histograms is not None and (histograms.dictionary_size != len( dictionary.data ) or
+				histograms.dictionary_crc != zlib.crc32( dictionary.data )):
+			raise ValueError( "Histogram file does not match the dictionary" )
+		self.histograms = histograms
+		# { ключ узла : гистограмма } для словаря без файла гистограмм
+		self.cache = dic.NodeCache( cache_size )
+
+
+	# histograms_path - по умолчанию <path>.hist, если такой файл есть
+	@staticmethod
+	def open(path, tags_path = None, histograms_path = None):
+		tags = None
+		if tags_path is not None:
+			with open( tags_path, encoding="utf-8" ) as tags_in:
+				tags = compile_dictionary.TagTable.read( tags_in ).tags
+		if histograms_path is None and os.path.exists( path + ".hist" ):
+			histograms_path = path + ".hist"
+		histograms = hist.HistogramTable.open( histograms_path ) if histograms_path is not None else None
+		reader = None
+		try:
+			reader = dic.DicReader.open( path )
+			return SuffixIndex( reader, tags, histograms )
+		except BaseException:
+			if reader is not None:
+				reader.close()
+			if histograms is not None:
+				histograms.close()
+			raise
+
+
+	def close(self):
+		if isinstance( self.dictionary, dic.DicReader ):
+			self.dictionary.close()
+		if self.histograms is not None:
+			self.histograms.close()
+
+
+	def histogram(self, node):
+		key = self._key( node )
+		if self.histograms is not None:
+			return self.histograms.get( key )
+		histogram = self.cache.get( key )
+		if histogram is None:
+			histogram = hist.subtree_histograms( node, self._items, self._data, self._key )[key]
+			self.cache.put( key, histogram )
+		return histogram
+
+
+	def _find(self, suffix):
+		# свертка букв, если она задана в словаре (альтернативы не перебираются)
+		folding = getattr( self.dictionary, "folding", None )
+		if folding is not None:
+			suffix = folding.fold_letters( suffix )
+		node = self.dictionary.root
+		for letter in reversed( suffix ):
+			node = self._next( node, letter )
+			if node is None:
+				return None
+		return node
+
+
+	# { тэг : число слов с суффиксом suffix }, по убыванию числа слов
+	def suffix_lookup(self, suffix):
+		node = self._find( suffix )
+		if node is None:
+			return {}
+		histogram = self.histogram( node )
+		result = {}
+		for attr, count in sorted( histogram.items(), key = lambda item: (-item[1], item[0]) ):
+			result[self.tags[attr] if self.tags is not None else attr] = count
+		return result
+
+
+	# число слов с суффиксом suffix
+	def count(self, suffix):
+		return sum( self.suffix_lookup( suffix ).values() )
+
+
+	# слова с суффиксом suffix: (word, attr), по алфавиту перевернутых слов
+	def iter_words(self, suffix):
+		for (reversed_word, attr) in self.dictionary.iter_words( suffix[::-1] ):
+			yield (reversed_word[::-1], attr)
+
+
+def parse_args():
+	parser = argparse.ArgumentParser( prog = "suffix_index.py", description = DescriptionString )
+	parser.add_argument( "dictionary", help = "Path to DAWG of reversed words (compile_dictionary.py --reverse-output)" )
+	parser.add_argument( "suffixes", nargs = "+" )
+	parser.add_argument( "--tags", help = "Tag table (compile_dictionary.py --tags-output)", default = None )
+	parser.add_argument( "--histograms", help = "Histogram file (compile_dictionary.py writes <reverse-output>.hist). "
+		"Default: <dictionary>.hist if it exists, otherwise histograms are computed per query", default = None )
+	return parser.parse_args()
+
+
+def main():
+	args = parse_args()
+	index = SuffixIndex.open( args.dictionary, args.tags, args.histograms )
+	for suffix in args.suffixes:
+		print( suffix )
+		for tag, count in index.suffix_lookup( suffix ).items():
+			print( "\t{}\t{}".format( count, tag ) )
+
+
+####################################################################################################
+
+import unittest
+import tempfile
+
+class TestSuffixIndex(unittest.TestCase):
+	Words = [ ("ball", 1), ("call", 2), ("fall", 2), ("football", 1), ("foot", 1), ("tall", 3) ]
+	Tags = [ "<>", "<n>", "<v>", "<adj>" ]
+
+	def check(self, index):
+		self.assertEqual( index.suffix_lookup( "all" ), { "<v>": 2, "<n>": 2, "<adj>": 1 } )
+		self.assertEqual( index.suffix_lookup( "ball" ), { "<n>": 2 } )
+		self.assertEqual( index.suffix_lookup( "xyz" ), {} )
+		self.assertEqual( index.count( "" ), len( self.Words ) )
+		self.assertEqual( list( index.iter_words( "tball" ) ), [ ("football", 1) ] )
+
+	def test_suffix_lookup(self):
+		dawg = compile_dictionary.build_reversed( [ (w[::-1], attr) for (w, attr) in self.Words ] )
+		self.check( SuffixIndex( dawg, self.Tags ) )
+		data = dawg.serialize()
+		self.check( SuffixIndex( dic.DicReader( data ), self.Tags ) )
+		self.check( SuffixIndex( dic.DicReader( data ), self.Tags, hist.HistogramTable( hist.serialize_histograms( data ) ) ) )
+		with self.assertRaises( ValueError ):
+			SuffixIndex( dic.DicReader( data ), None, hist.HistogramTable( hist.serialize_histograms( dawg.serialize( 1 ) ) ) )
+		self.assertEqual( SuffixIndex( dawg ).suffix_lookup( "all" ), { 2: 2, 1: 2, 3: 1 } )
+
+	def test_stale_histograms(self):
+		# другой тэг у одного слова: размер словаря тот же, гистограммы - нет
+		retagged = [ (w, 2 if w == "ball" else attr) for (w, attr) in self.Words ]
+		data = compile_dictionary.build_reversed( [ (w[::-1], attr) for (w, attr) in self.Words ] ).serialize()
+		stale = compile_dictionary.build_reversed( [ (w[::-1], attr) for (w, attr) in retagged ] ).serialize()
+		self.assertEqual( len( data ), len( stale ) )
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join( directory, "r.dawg" )
+			with open( path, "wb" ) as out:
+				out.write( data )
+			with open( path + ".hist", "wb" ) as out:
+				out.write( hist.serialize_histograms( stale ) )
+			with self.assertRaises( ValueError ):
+				SuffixIndex.open( path )
+
+
+if __name__ == "__main__":
+	main()
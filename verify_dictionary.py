@@ -0,0 +1,367 @@
+#! python3
+
+import sys
+import argparse
+import random
+import contextlib
+import fsm
+import dictionary as dic
+import compile_dictionary
+import container
+import lexicon_reader
+
+DescriptionString = "Checks a compiled dictionary against its source lexicon. " \
+	"Differential fuzzing of dictionary and automaton implementations."
+
+# 1. verify_lexicon: исходный словарь читается потоком (как в compile_dictionary.py),
+#    каждое слово и его атрибут проверяются в скомпилированном файле через DicReader.
+# 2. fuzz_dictionaries / fuzz_automata: случайные словари и автоматы, ответы всех реализаций
+#    (DicTree, DicDawg, десериализованные и ленивые узлы, DicReader, инкрементальный DAWG;
+#    NFA, DFA, EncodedDFA, LazyDFA) сравниваются между собой и с эталоном.
+# Ошибки возвращаются списком строк: пустой список - все сходится.
+
+
+#------------------------------------------------------------------------------
+# проверка по исходному словарю
+
+# words - (word, attr), как из compile_dictionary.read_words.
+# check_extra - проверить, что в словаре нет лишних слов (держит в памяти множество слов)
+#
+# Как и compile_dictionary, для повторяющегося слова (в том числе совпавшего после свертки)
+# верен атрибут последней строки. Поэтому несовпадение атрибута откладывается до конца ввода:
+# если слово встретится снова, прежняя строка считается повтором (duplicates), а не ошибкой.
+# В памяти держатся только слова с несовпавшим атрибутом
+def verify_lexicon( dictionary, words, max_errors = 20, check_extra = False ):
+	folding = getattr( dictionary, "folding", None )
+	seen = set() if check_extra else None
+	report = { "words": 0, "missing": 0, "wrong_attr": 0, "duplicates": 0, "extra": None }
+	errors = []
+	# { свернутое слово : (word, actual, attr) }
+	mismatched = {}
+	for (word, attr) in words:
+		report["words"] += 1
+		folded = folding.fold( word ) if folding is not None else word
+		if mismatched.pop( folded, None ) is not None:
+			report["duplicates"] += 1
+		actual = dictionary.get_attr( word )
+		if actual is None:
+			report["missing"] += 1
+			if len( errors ) < max_errors:
+				errors.append( "missing: " + word )
+		elif actual != attr:
+			mismatched[folded] = (word, actual, attr)
+		if seen is not None:
+			seen.add( folded )
+	for (word, actual, attr) in mismatched.values():
+		report["wrong_attr"] += 1
+		if len( errors ) < max_errors:
+			errors.append( "wrong attr: {} {} != {}".format( word, actual, attr ) )
+	if seen is not None:
+		report["extra"] = sum( 1 for (word, _attr) in dictionary.iter_words() if word not in seen )
+		if report["extra"] > 0 and len( errors ) < max_errors:
+			errors.append( "extra: {} words not in lexicon".format( report["extra"] ) )
+	report["errors"] = errors
+	return report
+
+
+# словарь и таблица тэгов (или None) из файла словаря или контейнера:
+# with open_artifact( path ) as (reader, tags): ... - файл закрывается по выходе
+@contextlib.contextmanager
+def open_artifact( path, tags_path = None ):
+	tags = None
+	if container.is_container( path ):
+		artifact = container.Container.open( path )
+		reader = artifact.reader()
+		if artifact.tags() is not None:
+			tags = compile_dictionary.TagTable()
+			for tag in artifact.tags():
+				tags.intern( tag )
+	else:
+		artifact = reader = dic.DicReader.open( path )
+	try:
+		if tags_path is not None:
+			with open( tags_path, encoding="utf-8" ) as tags_in:
+				tags = compile_dictionary.TagTable.read( tags_in )
+		yield reader, tags
+	finally:
+		artifact.close()
+
+
+#------------------------------------------------------------------------------
+# дифференциальное тестирование словарей
+
+Alphabets = [ "ab", "abc", "абвгдеё", "xyz-' ", "aé́ъ\U0001F600" ]
+
+def random_word( rnd, alphabet, max_length ):
+	return "".join( rnd.choice( alphabet ) for _ in range( rnd.randint( 1, max_length ) ) )
+
+
+# все формы словаря из (word, attr) по алфавиту: { название : словарь }
+def dictionary_forms( lexicon, rnd ):
+	forms = {}
+	tree = dic.DicTree()
+	builder = dic.DicDawgBuilder()
+	for (word, attr) in lexicon:
+		tree.add_word( word, attr )
+		builder.add_word( word, attr )
+	dawg = builder.build()
+	forms["tree"] = tree
+	forms["dawg"] = dawg
+
+	# символы вне BMP не помещаются в 2 байта раскладки 1
+	wide = any( ord( letter ) > 0xffff for (word, _attr) in lexicon for letter in word )
+	layouts = [ (0, None), (2, 0) ] if wide else [ (0, None), (1, None), (2, 1), (2, 0) ]
+	for (version, layout) in layouts:
+		name = "v{}{}".format( version, "" if layout is None else "_layout{}".format( layout ) )
+		tree_data = tree.serialize( version, layout )
+		dawg_data = dawg.serialize( version, layout )
+		loaded = dic.DicTree()
+		loaded.deserialize( tree_data )
+		forms["tree_" + name] = loaded
+		loaded = dic.DicDawg()
+		loaded.deserialize( dawg_data )
+		forms["dawg_" + name] = loaded
+		lazy = dic.DicDawg()
+		lazy.deserialize( dawg_data, lazy = True, cache_size = 4 )
+		forms["lazy_" + name] = lazy
+		forms["reader_" + name] = dic.DicReader( dawg_data )
+
+	# тот же словарь, полученный правками: половина слов - через DicDawgBuilder,
+	# остальные и лишние (потом удаленные) - через add_word/remove_word
+	half = len( lexicon ) // 2
+	builder = dic.DicDawgBuilder()
+	for (word, attr) in lexicon[:half]:
+		builder.add_word( word, attr )
+	incremental = builder.build()
+	words = set( word for (word, _attr) in lexicon )
+	extra = [random_word( rnd, "qz", 4 ) for _ in range( 5 )]
+	edits = [("add", word, attr) for (word, attr) in lexicon[half:]] + \
+		[("add", word, 1) for word in extra if word not in words]
+	rnd.shuffle( edits )
+	for (_op, word, attr) in edits:
+		incremental.add_word( word, attr )
+	for word in extra:
+		if word not in words:
+			incremental.remove_word( word )
+	forms["incremental"] = incremental
+	return forms
+
+
+def fuzz_dictionaries( seed = 1, rounds = 20, words = 60, max_length = 8, max_errors = 20 ):
+	rnd = random.Random( seed )
+	errors = []
+	for round in range( rounds ):
+		alphabet = rnd.choice( Alphabets )
+		lexicon = sorted( { random_word( rnd, alphabet, max_length ): rnd.randint( 0, 100 ) for _ in range( rnd.randint( 1, words ) ) }.items() )
+		expected = dict( lexicon )
+		forms = dictionary_forms( lexicon, rnd )
+
+		probes = [word for (word, _attr) in lexicon] + [random_word( rnd, alphabet, max_length ) for _ in range( words )]
+		probes += [word[:rnd.randint( 0, len( word ) )] for word in probes[:words]]
+		text = " ".join( rnd.sample( probes, min( len( probes ), 10 ) ) )
+		expected_prefixes = [(start, end, expected[text[start:end]])
+			for start in range( len( text ) ) for end in range( start + 1, len( text ) + 1 ) if text[start:end] in expected]
+
+		for name, dictionary in forms.items():
+			def fail( message ):
+				if len( errors ) < max_errors:
+					errors.append( "round {} ({}): {}: {}".format( round, alphabet, name, message ) )
+			for probe in probes:
+				if dictionary.get_attr( probe ) != expected.get( probe ):
+					fail( "get_attr( {!r} ) = {}, expected {}".format( probe, dictionary.get_attr( probe ), expected.get( probe ) ) )
+				if dictionary.check_word( probe ) != (probe in expected):
+					fail( "check_word( {!r} )".format( probe ) )
+			if list( dictionary.iter_words() ) != lexicon:
+				fail( "iter_words differs" )
+			prefixes = [(start, end, attr) for start in range( len( text ) ) for (end, attr) in dictionary.iter_prefixes( text, start )]
+			if prefixes != expected_prefixes:
+				fail( "iter_prefixes differs on {!r}".format( text ) )
+	return errors
+
+
+#------------------------------------------------------------------------------
+# дифференциальное тестирование автоматов
+
+# эталон: моделирование NFA множествами состояний
+def nfa_accepts( nfa, word ):
+	current = { fsm.START }
+	for symbol in word:
+		current = { target for name in current for target in nfa.states[name].get( symbol, () ) }
+		if len( current ) == 0:
+			return False
+	return len( current & nfa.final ) > 0
+
+
+def random_nfa( rnd, states, symbols, density ):
+	nfa = fsm.NFA()
+	names = [fsm.START] + ["Q{}".format( i ) for i in range( 1, states )]
+	for name in names:
+		if not nfa.has_state( name ):
+			nfa.add_state( name )
+	for name in names:
+		for symbol in range( symbols ):
+			for target in names:
+				if rnd.random() < density:
+					nfa.add_trans( name, symbol, target )
+	for name in names:
+		if rnd.random() < 0.3:
+			nfa.set_final( name )
+	return nfa
+
+
+def is_deterministic( nfa ):
+	return all( len( targets ) <= 1 for state in nfa.states.values() for targets in state.values() )
+
+
+def fuzz_automata( seed = 1, rounds = 50, states = 6, symbols = 3, sequences = 100, max_errors = 20 ):
+	rnd = random.Random( seed )
+	errors = []
+	for round in range( rounds ):
+		nfa = random_nfa( rnd, rnd.randint( 1, states ), rnd.randint( 1, symbols ), rnd.choice( [0.1, 0.2, 0.4] ) )
+		alphabet = sorted( nfa.terminal_alphabet )
+		if len( alphabet ) == 0:
+			continue
+		dfa = nfa.to_DFA()
+		implementations = {
+			"dfa": dfa.check,
+			"encoded": dfa.to_EncodedDFA().check,
+			"encoded_compressed": dfa.to_EncodedDFA( compress_alphabet = True ).check,
+			"compressed": dfa.compress_alphabet()[0].check,
+			"lazy": nfa.to_lazy_DFA().check,
+			"lazy_evicting": nfa.to_lazy_DFA( max_states = 2 ).check,
+		}
+		if is_deterministic( nfa ):
+			implementations["nfa"] = nfa.check
+
+		words = [[rnd.choice( alphabet ) for _ in range( rnd.randint( 0, 8 ) )] for _ in range( sequences )]
+		expected = [nfa_accepts( nfa, word ) for word in words]
+		for name, check in implementations.items():
+			for word, accepted in zip( words, expected ):
+				if check( word ) != accepted and len( errors ) < max_errors:
+					errors.append( "round {}: {}: {} -> {}, expected {}".format( round, name, word, not accepted, accepted ) )
+		encoded = dfa.to_EncodedDFA()
+		for vectorized in ([False, True] if fsm.numpy is not None else [False]):
+			batch = [bool( r ) for r in encoded.check_batch( *fsm.pack_sequences( words ), vectorized = vectorized )]
+			if batch != expected and len( errors ) < max_errors:
+				errors.append( "round {}: check_batch( vectorized = {} ) differs".format( round, vectorized ) )
+	return errors
+
+
+# оба вида проверки: { "dictionary_errors": [...], "automata_errors": [...] }
+def fuzz( seed = 1, rounds = 20 ):
+	return {
+		"dictionary_errors": fuzz_dictionaries( seed, rounds ),
+		"automata_errors": fuzz_automata( seed, rounds * 2 ),
+	}
+
+
+def parse_args():
+	parser = argparse.ArgumentParser( prog = "verify_dictionary.py", description = DescriptionString )
+	subparsers = parser.add_subparsers( dest = "command" )
+
+	lexicon_parser = subparsers.add_parser( "lexicon", help = "Check every word of the source lexicon in the compiled dictionary" )
+	lexicon_parser.add_argument( "dictionary", help = "Path to compiled dictionary or artifact container (*.wfpack)" )
+	lexicon_parser.add_argument( "-i", "--input", default = "-",
+		help = "Source lexicon, as for compile_dictionary.py. If not set or '-', stdin will be used" )
+	lexicon_parser.add_argument( "--encoding", default = None )
+	lexicon_parser.add_argument( "--tagged",
+		action='store_const', const=True, default=False,
+		help = "Input lines are 'word<TAB>tag' (see compile_dictionary.py --tagged)" )
+	lexicon_parser.add_argument( "--tags", default = None,
+		help = "Tag table. Default: <dictionary>.tags or the table in the container" )
+	lexicon_parser.add_argument( "--check-extra",
+		action='store_const', const=True, default=False,
+		help = "Also check that the dictionary has no words missing from the lexicon (keeps lexicon words in memory)" )
+	lexicon_parser.add_argument( "--max-errors", type = int, default = 20 )
+
+	fuzz_parser = subparsers.add_parser( "fuzz", help = "Randomized differential test of dictionary and automaton implementations" )
+	fuzz_parser.add_argument( "--seed", type = int, default = 1 )
+	fuzz_parser.add_argument( "--rounds", type = int, default = 100 )
+
+	args = parser.parse_args()
+	if args.command is None:
+		parser.error( "command is required" )
+	return args
+
+
+def main():
+	args = parse_args()
+
+	if args.command == "lexicon":
+		tags_path = args.tags
+		if tags_path is None and args.tagged and not container.is_container( args.dictionary ):
+			tags_path = args.dictionary + ".tags"
+		with open_artifact( args.dictionary, tags_path ) as (reader, tags):
+			if args.tagged and tags is None:
+				print( "Tag table is required for --tagged", file=sys.stderr )
+				sys.exit( 2 )
+			with lexicon_reader.open_lexicon( args.input, args.encoding ) as input:
+				report = verify_lexicon( reader, compile_dictionary.read_words( input, tags if args.tagged else None ),
+					args.max_errors, args.check_extra )
+		for error in report["errors"]:
+			print( error, file=sys.stderr )
+		print( "words: {words}  missing: {missing}  wrong attr: {wrong_attr}  duplicates: {duplicates}  extra: {extra}".format( **report ) )
+		failed = report["missing"] + report["wrong_attr"] + (report["extra"] or 0)
+
+	elif args.command == "fuzz":
+		result = fuzz( args.seed, args.rounds )
+		for error in result["dictionary_errors"] + result["automata_errors"]:
+			print( error, file=sys.stderr )
+		failed = len( result["dictionary_errors"] ) + len( result["automata_errors"] )
+		print( "errors:", failed )
+
+	sys.exit( 1 if failed > 0 else 0 )
+
+
+####################################################################################################
+
+import unittest
+import io
+import folding as fold
+
+class TestVerify(unittest.TestCase):
+
+	def test_verify_lexicon(self):
+		builder = dic.DicDawgBuilder()
+		builder.add_word( "ball", 1 )
+		builder.add_word( "foot", 2 )
+		builder.add_word( "hand", 1 )
+		reader = dic.DicReader( builder.build().serialize() )
+		report = verify_lexicon( reader, [ ("ball", 1), ("foot", 1), ("man", 0) ], check_extra = True )
+		self.assertEqual( (report["words"], report["missing"], report["wrong_attr"], report["extra"]), (3, 1, 1, 1) )
+		self.assertIn( "wrong attr: foot 2 != 1", report["errors"] )
+
+	def test_duplicates(self):
+		# compile_dictionary оставляет атрибут последней строки, в том числе после свертки
+		dawg = dic.DicDawgBuilder()
+		dawg.add_word( "ball", 2 )
+		dawg.add_word( "foot", 1 )
+		dawg = dawg.build()
+		dawg.folding = fold.Folding( lower = True )
+		reader = dic.DicReader( dawg.serialize() )
+		report = verify_lexicon( reader, [ ("ball", 1), ("Ball", 2), ("foot", 1), ("foot", 3) ], check_extra = True )
+		self.assertEqual( (report["duplicates"], report["wrong_attr"], report["extra"]), (1, 1, 0) )
+		self.assertEqual( report["errors"], [ "wrong attr: foot 1 != 3" ] )
+
+	def test_tagged_lexicon(self):
+		tags = compile_dictionary.TagTable()
+		lines = [ "ball\t<2>", "foot\t<1 3>" ]
+		dawg = dic.DicDawgBuilder()
+		for (word, attr) in compile_dictionary.read_words( lines, tags ):
+			dawg.add_word( word, attr )
+		reader = dic.DicReader( dawg.build().serialize() )
+		table = io.StringIO()
+		tags.write( table )
+		table = compile_dictionary.TagTable.read( io.StringIO( table.getvalue() ) )
+		report = verify_lexicon( reader, compile_dictionary.read_words( lines + [ "hand\t<2>" ], table ) )
+		self.assertEqual( (report["missing"], report["wrong_attr"]), (1, 0) )
+
+	def test_fuzz_dictionaries(self):
+		self.assertEqual( fuzz_dictionaries( seed = 3, rounds = 8 ), [] )
+
+	def test_fuzz_automata(self):
+		self.assertEqual( fuzz_automata( seed = 3, rounds = 40 ), [] )
+
+
+if __name__ == "__main__":
+	main()
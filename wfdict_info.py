@@ -0,0 +1,140 @@
+#! python3
+
+import sys
+import argparse
+import json
+import dictionary as dic
+import container
+
+DescriptionString = "Prints header information of a serialized dictionary without loading it."
+
+# Читается только заголовок: magic, версия, расширение (раскладка узлов, свертка, статистика).
+# Статистика есть в файлах версии 2; для старых файлов --scan считает ее обходом через mmap.
+
+StatsFields = [ "words", "nodes", "edges", "max_depth", "alphabet_size" ]
+
+
+# заголовок словаря из бинарного потока, начиная с текущей позиции:
+# (magic, версия, расширение, смещение корня)
+def read_header( stream ):
+	prefix_size = dic.DicSerializer.HeaderSize + dic.DicSerializer.ExtensionLengthBytes
+	data = stream.read( prefix_size )
+	if len( data ) < dic.DicSerializer.HeaderSize:
+		raise ValueError( "File is too short" )
+	version = int.from_bytes( data[len(dic.DicSerializer.MagicTree):dic.DicSerializer.HeaderSize], byteorder='little' )
+	if version >= 2:
+		length = int.from_bytes( data[dic.DicSerializer.HeaderSize:prefix_size], byteorder='little' )
+		data += stream.read( length )
+	return dic.DicSerializer.read_header( data )
+
+
+# { поле : значение } для файла словаря или секции словаря в контейнере
+def info( path, scan = False ):
+	is_container = container.is_container( path )
+	with open( path, "rb" ) as stream:
+		if is_container:
+			code, section_offset, _size, _raw_size, _crc = container.read_directory_stream( stream )[container.DawgSection]
+			if code != 0:
+				raise ValueError( "Dictionary section is compressed: " + path )
+			stream.seek( section_offset )
+		magic, version, extension, root_offset = read_header( stream )
+
+	result = {
+		"path": path,
+		"type": "dawg" if magic == dic.DicSerializer.MagicDawg else "tree",
+		"version": version,
+		"root_offset": root_offset,
+	}
+	format = dic.DicSerializer( version, extension.get( "layout", None ) )
+	result["layout"] = {
+		"child_count_bytes": format.child_count_bytes,
+		"attr_bytes": format.attr_bytes,
+		"letter_bytes": format.letter_bytes,
+		"offset_bytes": format.offset_bytes,
+	}
+	if "folding" in extension:
+		result["folding"] = extension["folding"]
+	stats = extension.get( "stats", None )
+	if stats is None and scan:
+		if is_container:
+			with container.Container.open( path ) as pack:
+				stats = pack.reader().stats()
+		else:
+			with dic.DicReader.open( path ) as reader:
+				stats = reader.stats()
+	if stats is not None:
+		result["stats"] = stats
+	return result
+
+
+def parse_args():
+	parser = argparse.ArgumentParser( prog = "wfdict_info.py", description = DescriptionString )
+	parser.add_argument( "dictionary", nargs = "+", help = "Path to serialized dictionary or artifact container (*.wfpack)" )
+	parser.add_argument( "--json",
+		action='store_const', const=True, default=False,
+		help = "Print JSON, one object per line" )
+	parser.add_argument( "--scan",
+		action='store_const', const=True, default=False,
+		help = "Compute stats by traversal for files without stats in the header (version < 2)" )
+	return parser.parse_args()
+
+
+def main():
+	args = parse_args()
+	failed = False
+	for path in args.dictionary:
+		try:
+			result = info( path, args.scan )
+		except (OSError, ValueError) as e:
+			print( path + ":", e, file=sys.stderr )
+			failed = True
+			continue
+		if args.json:
+			print( json.dumps( result, ensure_ascii=False ) )
+			continue
+		print( path )
+		print( "  type:         ", result["type"] )
+		print( "  version:      ", result["version"] )
+		print( "  layout:       ", " ".join( "{}={}".format( k, v ) for k, v in result["layout"].items() ) )
+		if "folding" in result:
+			print( "  folding:      ", json.dumps( result["folding"], ensure_ascii=False ) )
+		if "stats" in result:
+			for name in StatsFields:
+				print( "  {:14}".format( name + ":" ), result["stats"].get( name ) )
+		else:
+			print( "  stats:         not in header (version < 2), use --scan" )
+	sys.exit( 1 if failed else 0 )
+
+
+####################################################################################################
+
+import unittest
+import io
+import os
+import tempfile
+
+class TestInfo(unittest.TestCase):
+
+	def test_info(self):
+		builder = dic.DicDawgBuilder()
+		for word in [ "ab", "abc", "b" ]:
+			builder.add_word( word )
+		dawg = builder.build()
+		data = dawg.serialize()
+		self.assertEqual( read_header( io.BytesIO( bytes( data ) + b"garbage" ) ), dic.DicSerializer.read_header( data ) )
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join( directory, "xx_dic.dawg" )
+			with open( path, "wb" ) as out:
+				out.write( dawg.serialize( 1 ) )
+			self.assertNotIn( "stats", info( path ) )
+			self.assertEqual( info( path, scan = True )["stats"], dawg.stats() )
+
+			pack_path = os.path.join( directory, "xx.wfpack" )
+			container.pack_artifacts( pack_path, data )
+			result = info( pack_path )
+			self.assertEqual( (result["type"], result["version"]), ("dawg", 2) )
+			self.assertEqual( result["stats"]["words"], 3 )
+
+
+if __name__ == "__main__":
+	main()